@@ -2,6 +2,10 @@
 ASGI config for my_django_project.
 
 It exposes the ASGI callable as a module-level variable named `application`.
+Serve it with uvicorn workers so the async Scryfall search does not hold a thread
+while it waits on the upstream API:
+
+    gunicorn my_django_project.asgi:application -k uvicorn.workers.UvicornWorker
 
 For more information on this file, see
 https://docs.djangoproject.com/en/stable/howto/deployment/asgi/
@@ -12,4 +16,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_django_project.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+application = get_asgi_application()
+
+# Mapea el indice de nombres de carta antes de la primera peticion (users/cardindex.py).
+from users import cardindex  # noqa: E402
+
+cardindex.load()
@@ -0,0 +1,103 @@
+"""
+Primary/replica routing for the read-only pages.
+
+Views listed in ``DB_REPLICA_VIEWS`` read from the ``replica`` alias while
+they run; everything else, including every write, goes to ``default``. After
+a client sends a write request it is pinned to the primary for
+``DB_PRIMARY_PIN_SECONDS`` so it never reads a replica that has not caught up
+with its own change yet. Routing is a no-op when no ``replica`` alias is
+configured.
+"""
+
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+PRIMARY_PIN_COOKIE = 'db_primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_enabled():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class PrimaryReplicaRouter:
+    # Sessions and the user row are read on every request and must never be stale.
+    primary_only_apps = {'sessions', 'auth', 'contenttypes', 'admin'}
+
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get() or not replica_enabled():
+            return None
+        if model._meta.app_label in self.primary_only_apps or model._meta.label == settings.AUTH_USER_MODEL:
+            return 'default'
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {'default', REPLICA_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_ALIAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            token = getattr(request, '_replica_token', None)
+            if token is not None:
+                _use_replica.reset(token)
+        return self._pin_to_primary(request, response)
+
+    async def __acall__(self, request):
+        # Under ASGI process_view runs through sync_to_async: the value it sets is copied
+        # back into this context, but its token belongs to the thread's copy and cannot be
+        # used to reset it.
+        previous = _use_replica.get()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_replica.set(previous)
+        return self._pin_to_primary(request, response)
+
+    def _pin_to_primary(self, request, response):
+        if request.method not in SAFE_METHODS and replica_enabled():
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE,
+                '1',
+                max_age=settings.DB_PRIMARY_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            replica_enabled()
+            and request.method in SAFE_METHODS
+            and PRIMARY_PIN_COOKIE not in request.COOKIES
+            and request.resolver_match.url_name in settings.DB_REPLICA_VIEWS
+        ):
+            request._replica_token = _use_replica.set(True)
+        return None
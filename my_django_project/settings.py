@@ -25,6 +25,9 @@ DEBUG = True
 
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'testserver']
 
+# Production profile: export DJANGO_ENV=production (e.g. under gunicorn)
+PRODUCTION = os.environ.get('DJANGO_ENV') == 'production'
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -34,16 +37,20 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'users',
     # Add your apps here
 ]
 
 MIDDLEWARE = [
+    'users.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'my_django_project.db_router.ReplicaRoutingMiddleware',
+    'users.profiling.RequestProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,6 +73,56 @@ TEMPLATES = [
     },
 ]
 
+if PRODUCTION:
+    # Compile each template once per worker process instead of on every render.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
+# Rendered fragments of the collection and search pages ({% cache ... using="fragments" %}).
+# Keys carry the UserCard versions (`updated_at`), so writes never serve stale rows. In
+# production they live on disk so every worker process shares them.
+FRAGMENT_CACHE_SECONDS = int(os.environ.get('FRAGMENT_CACHE_SECONDS', '900'))
+FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR', str(BASE_DIR / 'fragment_cache'))
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+if PRODUCTION:
+    CACHES['fragments'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': FRAGMENT_CACHE_DIR,
+        'OPTIONS': {'MAX_ENTRIES': 100000, 'CULL_FREQUENCY': 10},
+    }
+
+# Sessions and the logged-in user. In production sessions are read from a cache shared by
+# every worker (and written through to the database) and the CustomUser row is cached for a
+# short time, so authenticated pages skip both the session and the user query. Messages
+# live in a signed cookie, so read-only requests never write the session.
+AUTH_USER_CACHE_ALIAS = 'sessions'
+AUTH_USER_CACHE_SECONDS = int(os.environ.get('AUTH_USER_CACHE_SECONDS', '300'))
+SESSION_CACHE_DIR = os.environ.get('SESSION_CACHE_DIR', str(BASE_DIR / 'session_cache'))
+CACHES['sessions'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessions'}
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+if PRODUCTION:
+    CACHES['sessions'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': SESSION_CACHE_DIR,
+        'OPTIONS': {'MAX_ENTRIES': 50000, 'CULL_FREQUENCY': 10},
+    }
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    SESSION_CACHE_ALIAS = 'sessions'
+    # Sessions created with the stock ModelBackend must log in again once after switching.
+    AUTHENTICATION_BACKENDS = ['users.auth.CachedModelBackend']
+
 WSGI_APPLICATION = 'my_django_project.wsgi.application'
 
 # Database
@@ -78,6 +135,47 @@ DATABASES = {
     }
 }
 
+# Optional read replica: set DJANGO_DB_REPLICA to the replica file (e.g. db_copy.sqlite3)
+# and keep it fresh with `python manage.py refresh_replica --interval 5`.
+DB_REPLICA = os.environ.get('DJANGO_DB_REPLICA', '')
+if DB_REPLICA:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / DB_REPLICA,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# SQLite tuned for several gunicorn workers: WAL lets readers run while a writer commits,
+# IMMEDIATE transactions take the write lock up front instead of failing on upgrade,
+# and `timeout` (busy_timeout) makes writers queue instead of raising "database is locked".
+SQLITE_PRODUCTION_OPTIONS = {
+    'timeout': 20,
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA cache_size=-64000;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA busy_timeout=20000;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+}
+
+if PRODUCTION:
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.sqlite3':
+            database['OPTIONS'] = {**SQLITE_PRODUCTION_OPTIONS, **database.get('OPTIONS', {})}
+        database['CONN_MAX_AGE'] = 600
+        database['CONN_HEALTH_CHECKS'] = True
+
+DATABASE_ROUTERS = ['my_django_project.db_router.PrimaryReplicaRouter']
+
+# Views (by URL name) that may read from the replica
+DB_REPLICA_VIEWS = {'home', 'search_card', 'search_card_matches', 'card_list', 'list_exchanges'}
+
+# Seconds a client keeps reading from the primary after sending a write
+DB_PRIMARY_PIN_SECONDS = int(os.environ.get('DJANGO_DB_PRIMARY_PIN_SECONDS', '10'))
+
 # Password validation
 # https://docs.djangoproject.com/en/stable/ref/settings/#auth-password-validators
 
@@ -115,12 +213,112 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
+# collectstatic only picks the files the templates reference from STATICFILES_DIRS
+# (plus STATIC_BUILD_EXTRA_FILES); `python manage.py build_static` runs it and reports sizes.
+STATICFILES_FINDERS = [
+    'my_django_project.staticfiles.ReferencedFilesFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+]
+STATIC_BUILD_EXTRA_FILES = []
+# Source images far larger than they are displayed; the build downsizes them.
+STATIC_BUILD_IMAGE_SIZES = {
+    'img/logo.png': (128, 128),
+    'favicon.ico': (64, 64),
+}
+
+if PRODUCTION:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'my_django_project.staticfiles.CompressedManifestStaticFilesStorage'},
+    }
+
+# Serve STATIC_ROOT from Django (precompressed, far-future headers) when no front proxy does.
+SERVE_STATIC = os.environ.get('DJANGO_SERVE_STATIC', '1' if PRODUCTION else '0') == '1'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/stable/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Scryfall API. Point SCRYFALL_API_BASE at `python manage.py scryfall_stub` to work offline.
+SCRYFALL_API_BASE = os.environ.get('SCRYFALL_API_BASE', 'https://api.scryfall.com').rstrip('/')
+# Extra pause between CSV lookups; the upstream token bucket below already paces them.
+SCRYFALL_BULK_LOOKUP_INTERVAL_SECONDS = float(os.environ.get('SCRYFALL_BULK_LOOKUP_INTERVAL_SECONDS', '0'))
+SCRYFALL_TIMEOUT_SECONDS = float(os.environ.get('SCRYFALL_TIMEOUT_SECONDS', '8'))
+# Keep-alive connections per Scryfall host (per process for the sync client, per event
+# loop for the async one) and retries (with Retry-After) on 429/5xx.
+SCRYFALL_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('SCRYFALL_MAX_CONNECTIONS_PER_HOST', '4'))
+SCRYFALL_MAX_RETRIES = int(os.environ.get('SCRYFALL_MAX_RETRIES', '2'))
+SCRYFALL_RETRY_BACKOFF_SECONDS = float(os.environ.get('SCRYFALL_RETRY_BACKOFF_SECONDS', '0.5'))
+SCRYFALL_RETRY_MAX_SECONDS = float(os.environ.get('SCRYFALL_RETRY_MAX_SECONDS', '5'))
+# Circuit breaker: after N consecutive failures or slow calls, fail fast for RESET seconds.
+SCRYFALL_BREAKER_FAILURES = int(os.environ.get('SCRYFALL_BREAKER_FAILURES', '5'))
+SCRYFALL_BREAKER_RESET_SECONDS = float(os.environ.get('SCRYFALL_BREAKER_RESET_SECONDS', '30'))
+SCRYFALL_SLOW_CALL_SECONDS = float(os.environ.get('SCRYFALL_SLOW_CALL_SECONDS', '2'))
+# Type-ahead search cache (stale-while-revalidate).
+SCRYFALL_SEARCH_FRESH_SECONDS = int(os.environ.get('SCRYFALL_SEARCH_FRESH_SECONDS', '600'))
+SCRYFALL_SEARCH_STALE_SECONDS = int(os.environ.get('SCRYFALL_SEARCH_STALE_SECONDS', '86400'))
+SCRYFALL_SEARCH_WAIT_SECONDS = float(os.environ.get('SCRYFALL_SEARCH_WAIT_SECONDS', '1'))
+SCRYFALL_REFRESH_WORKERS = int(os.environ.get('SCRYFALL_REFRESH_WORKERS', '4'))
+
+# Card image proxy (/users/card_image/): originals and thumbnails are cached on disk.
+CARD_IMAGE_CACHE_DIR = os.environ.get('CARD_IMAGE_CACHE_DIR', str(BASE_DIR / 'image_cache'))
+CARD_IMAGE_ALLOWED_HOSTS = {'cards.scryfall.io', 'c1.scryfall.com'}
+# Dotted path to a `url -> bytes` function; use 'users.images.placeholder_fetcher' offline.
+CARD_IMAGE_FETCHER = os.environ.get('CARD_IMAGE_FETCHER', 'users.images.fetch_from_upstream')
+# Larger downloads are refused instead of cached.
+CARD_IMAGE_MAX_BYTES = int(os.environ.get('CARD_IMAGE_MAX_BYTES', str(5 * 1024 * 1024)))
+
+# Token buckets shared by all worker processes through a local SQLite file.
+# Per client (user or IP) for the type-ahead search, and one global bucket for every
+# request we send to the Scryfall API (they ask for at most ~10 requests per second).
+RATELIMIT_DB_PATH = os.environ.get('RATELIMIT_DB_PATH', str(BASE_DIR / 'ratelimit.sqlite3'))
+SCRYFALL_CLIENT_RATE = float(os.environ.get('SCRYFALL_CLIENT_RATE', '3'))
+SCRYFALL_CLIENT_BURST = float(os.environ.get('SCRYFALL_CLIENT_BURST', '5'))
+SCRYFALL_UPSTREAM_RATE = float(os.environ.get('SCRYFALL_UPSTREAM_RATE', '8'))
+SCRYFALL_UPSTREAM_BURST = float(os.environ.get('SCRYFALL_UPSTREAM_BURST', '8'))
+SCRYFALL_UPSTREAM_WAIT_SECONDS = float(os.environ.get('SCRYFALL_UPSTREAM_WAIT_SECONDS', '2'))
+# Per client for the card image proxy; generous enough for a page full of thumbnails.
+CARD_IMAGE_CLIENT_RATE = float(os.environ.get('CARD_IMAGE_CLIENT_RATE', '20'))
+CARD_IMAGE_CLIENT_BURST = float(os.environ.get('CARD_IMAGE_CLIENT_BURST', '200'))
+
+# Read-only card name index built by `python manage.py build_card_index` and memory-mapped
+# by every worker; import matching and autocomplete use it before querying the database.
+CARD_INDEX_PATH = os.environ.get('CARD_INDEX_PATH', str(BASE_DIR / 'card_index.bin'))
+
+# Trade valuation (users/valuation.py): catalog prices cached per card in the default cache.
+TRADE_PRICE_CACHE_SECONDS = int(os.environ.get('TRADE_PRICE_CACHE_SECONDS', '900'))
+
+# Collection export (/users/export/): rows fetched per database round trip while streaming.
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '2000'))
+
+# JSON API under /api/ (users/api.py). Mobile clients and bots authenticate with HTTP
+# Basic over TLS or reuse the session cookie; pages are cursor paginated.
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    'DEFAULT_PAGINATION_CLASS': 'users.pagination.CursorPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', '50')),
+}
+if PRODUCTION:
+    # Without the browsable API renderer (and its template rendering).
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = ['rest_framework.renderers.JSONRenderer']
+
+# Request profiling: staff can send `X-Profile: 1` (or `?__profile__=1`); a sample of all
+# requests can be profiled too. Profiles and summaries land in PROFILING_OUTPUT_DIR.
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_OUTPUT_DIR = os.environ.get('PROFILING_OUTPUT_DIR', BASE_DIR / 'profiles')
+
+# Prometheus metrics: each worker flushes its counters to METRICS_DIR and /metrics/ sums
+# them. Without METRICS_TOKEN the endpoint only answers METRICS_ALLOWED_IPS.
+METRICS_DIR = os.environ.get('METRICS_DIR', str(BASE_DIR / 'metrics'))
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', '5'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = {'127.0.0.1', '::1'}
+
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'  # Ensure this is set to the desired redirect URL after logout
 LOGIN_URL = '/login/'
@@ -0,0 +1,178 @@
+"""
+Pipeline de ficheros estaticos para produccion.
+
+- `ReferencedFilesFinder` solo entrega a `collectstatic` los ficheros de `STATICFILES_DIRS`
+  que usan las plantillas (`{% static '...' %}`), mas lo que esos CSS referencian con
+  `url()`. En desarrollo `find()` sigue encontrando cualquier fichero.
+- `CompressedManifestStaticFilesStorage` escribe nombres con hash, reduce las imagenes
+  de `STATIC_BUILD_IMAGE_SIZES` y deja copias `.gz` / `.br` junto a cada fichero de texto.
+- `serve_static` sirve `STATIC_ROOT` con la copia comprimida que acepte el navegador y
+  cabeceras de cache de un ano para los nombres con hash.
+"""
+
+import gzip
+import io
+import mimetypes
+import os
+import posixpath
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import FileSystemFinder
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.template.utils import get_app_template_dirs
+from django.utils._os import safe_join
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # Sin brotli solo se generan las copias gzip.
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+STATIC_TAG_RE = re.compile(r"""{%\s*static\s+['"]([^'"]+)['"]""")
+CSS_URL_RE = re.compile(r"""url\(\s*['"]?([^'")]+?)['"]?\s*\)""")
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.ico', '.map', '.xml'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=3600'
+
+
+def template_static_references(include_apps=True):
+    """Rutas usadas con `{% static %}` en las plantillas del proyecto y, si se pide, de las apps."""
+    directories = [Path(d) for engine in settings.TEMPLATES for d in engine.get('DIRS', [])]
+    if include_apps:
+        directories += [Path(d) for d in get_app_template_dirs('templates')]
+    references = set()
+    for directory in directories:
+        for template in directory.rglob('*.html'):
+            references.update(STATIC_TAG_RE.findall(template.read_text(encoding='utf-8', errors='ignore')))
+    return references
+
+
+class ReferencedFilesFinder(FileSystemFinder):
+    def list(self, ignore_patterns):
+        wanted = template_static_references() | set(getattr(settings, 'STATIC_BUILD_EXTRA_FILES', ()))
+        available = {path: storage for path, storage in super().list(ignore_patterns)}
+        pending = list(wanted)
+        seen = set()
+        while pending:
+            path = pending.pop()
+            if path in seen or path not in available:
+                continue
+            seen.add(path)
+            yield path, available[path]
+            if path.endswith('.css'):
+                with available[path].open(path) as handle:
+                    css = handle.read().decode('utf-8', errors='ignore')
+                for url in CSS_URL_RE.findall(css):
+                    if url.startswith(('data:', '#', '/', 'http:', 'https:', '//')):
+                        continue
+                    target = posixpath.normpath(posixpath.join(posixpath.dirname(path), url.split('?')[0].split('#')[0]))
+                    pending.append(target)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Sin el patron de sourceMappingURL: los .map no se publican y el manifest fallaria.
+    patterns = (
+        (
+            '*.css',
+            (
+                r"""(?P<matched>url\(['"]{0,1}\s*(?P<url>.*?)["']{0,1}\))""",
+                (
+                    r"""(?P<matched>@import\s*["']\s*(?P<url>.*?)["'])""",
+                    """@import url("%(url)s")""",
+                ),
+            ),
+        ),
+    )
+
+    def url(self, name, force=False):
+        # Los settings dejan DEBUG activo; sin `force` Django devolveria el nombre sin hash.
+        return super().url(name, force=True)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run and Image is not None:
+            # Se reduce la copia ya recogida y el hash se calcula sobre ella, no sobre el original.
+            paths = dict(paths)
+            for name, dimensions in settings.STATIC_BUILD_IMAGE_SIZES.items():
+                if name in paths:
+                    with self.open(name) as handle:
+                        resized = _resize_image(handle.read(), name, dimensions)
+                    self.delete(name)
+                    self._save(name, ContentFile(resized))
+                    paths[name] = (self, name)
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in list(paths) + list(self.hashed_files.values()):
+            if Path(name).suffix.lower() in COMPRESSIBLE_EXTENSIONS and self.exists(name):
+                self._write_compressed(name)
+
+    def _write_compressed(self, name):
+        with self.open(name) as handle:
+            data = handle.read()
+        candidates = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            candidates.append(('.br', brotli.compress(data, quality=11)))
+        for suffix, compressed in candidates:
+            if len(compressed) < len(data) * 0.95:
+                with open(self.path(name) + suffix, 'wb') as handle:
+                    handle.write(compressed)
+
+
+def _resize_image(data, name, dimensions):
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        buffer = io.BytesIO()
+        if name.endswith('.ico'):
+            largest = max(dimensions)
+            sizes = [(size, size) for size in (16, 32, 48, 64, 128, 256) if size <= largest]
+            image.save(buffer, 'ICO', sizes=sizes)
+        else:
+            image.thumbnail(dimensions, Image.LANCZOS)
+            image.save(buffer, image.format or 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def serve_static(request, path):
+    try:
+        full_path = safe_join(str(settings.STATIC_ROOT), path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    served, encoding = full_path, None
+    for suffix, name in (('.br', 'br'), ('.gz', 'gzip')):
+        if name in accepted and os.path.isfile(full_path + suffix):
+            served, encoding = full_path + suffix, name
+            break
+
+    stat = os.stat(served)
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(
+            open(served, 'rb'),
+            content_type=content_type or 'application/octet-stream',
+            filename=os.path.basename(full_path),
+        )
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = IMMUTABLE if HASHED_NAME_RE.search(path) else REVALIDATE
+    return response
@@ -1,7 +1,11 @@
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.contrib.auth import views as auth_views
 from django.shortcuts import render
+from my_django_project.staticfiles import serve_static
+from users.api import router as api_router
+from users.metrics import metrics_view
 from users.models import Card, CustomUser, Exchange
 
 def home(request):
@@ -17,6 +21,11 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='/'), name='logout'),  # Redirige a la página principal
+    path('metrics/', metrics_view, name='metrics'),
+    path('api/', include(api_router.urls)),
     path('users/', include('users.urls')),  # Incluye las URLs de la app users
     path('', home, name='home'),  # Ruta para la pantalla de inicio
 ]
+
+if settings.SERVE_STATIC:
+    urlpatterns.insert(0, re_path(rf'^{settings.STATIC_URL.strip("/")}/(?P<path>.+)$', serve_static))
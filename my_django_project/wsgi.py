@@ -12,4 +12,9 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_django_project.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Mapea el indice de nombres de carta antes de la primera peticion (users/cardindex.py).
+from users import cardindex  # noqa: E402
+
+cardindex.load()
@@ -1,9 +1,146 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
 from django.contrib.auth.admin import UserAdmin
-from .models import Card, UserCard, CustomUser, Exchange
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Card, UserCard, CustomUser, Exchange, Notification
+from .pagination import EstimatedCountPaginator
+
+CURSOR_VAR = 'cursor'
+
+
+class CursorChangeList(ChangeList):
+    """
+    Listado del admin paginado por id (`?cursor=<id>`) en vez de por numero de pagina,
+    asi que la pagina 10.000 cuesta lo mismo que la primera. Si se ordena por otra
+    columna o se pide "Mostrar todo" vuelve a la paginacion normal del admin.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        try:
+            self.cursor = int(request.GET.get(CURSOR_VAR, ''))
+        except ValueError:
+            self.cursor = None
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+
+    @property
+    def uses_cursor(self):
+        return ORDER_VAR not in self.params and not self.show_all
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Cambiar filtros, busqueda u orden vuelve a la primera pagina.
+        if not new_params or CURSOR_VAR not in new_params:
+            remove = [*(remove or []), CURSOR_VAR]
+        return super().get_query_string(new_params, remove)
+
+    def get_results(self, request):
+        if self.uses_cursor and self.cursor is not None:
+            self.queryset = self.queryset.filter(pk__lt=self.cursor)
+            self.page_num = 1
+        super().get_results(request)
+        if self.uses_cursor and self.multi_page:
+            page = list(self.result_list)
+            if page:
+                self.next_cursor = page[-1].pk
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR])
+
+    @property
+    def next_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """
+    Base para las tablas grandes: sin `COUNT(*)` exacto, paginacion por cursor, claves
+    foraneas como campo de id (un <select> con todas las cartas no cabe en la pagina) y
+    busquedas que pueden usar los indices (prefijo `^` o exactas con `=`).
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-id',)
+    list_per_page = 50
+    change_list_template = 'admin/cursor_change_list.html'
+
+    # Claves foraneas a CustomUser que se buscan por nombre de usuario exacto y a Card por el
+    # principio del nombre. Con ellas la busqueda son subconsultas sobre los indices de las
+    # columnas `*_id`; `search_fields` solo se declara para que el admin muestre la caja.
+    user_search_fields = ()
+    card_search_field = None
+
+    def get_changelist(self, request, **kwargs):
+        return CursorChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not (self.user_search_fields or self.card_search_field) or not term:
+            return super().get_search_results(request, queryset, search_term)
+        query = Q()
+        users = CustomUser.objects.filter(username=term).values('pk')
+        for field in self.user_search_fields:
+            query |= Q(**{f'{field}__in': users})
+        if self.card_search_field:
+            query |= Q(**{f'{self.card_search_field}__in': Card.objects.filter(name__istartswith=term).values('pk')})
+        return queryset.filter(query), False
+
+
+@admin.register(Card)
+class CardAdmin(ScalableModelAdmin):
+    list_display = ('id', 'name', 'set_code', 'collector_number', 'rarity', 'usd_price', 'eur_price', 'updated_at')
+    search_fields = ('^name', '=scryfall_id')
+    search_help_text = 'Principio del nombre o Scryfall ID exacto.'
+
+
+@admin.register(UserCard)
+class UserCardAdmin(ScalableModelAdmin):
+    list_display = (
+        'id', 'user', 'card', 'is_owned', 'quantity_owned', 'quantity_required', 'listing_intent',
+        'condition', 'asking_price', 'updated_at',
+    )
+    list_filter = ('is_owned', 'listing_intent', 'condition')
+    list_select_related = ('user', 'card')
+    raw_id_fields = ('user', 'card')
+    search_fields = ('=user__username', '^card__name')
+    user_search_fields = ('user',)
+    card_search_field = 'card'
+    search_help_text = 'Usuario exacto o principio del nombre de la carta.'
+    actions = ('set_intent_sell', 'set_intent_trade', 'set_intent_sell_trade', 'clear_asking_price')
+
+    def get_queryset(self, request):
+        # El formulario, el borrado y el historial usan `__str__`, que lee el usuario y la carta.
+        return super().get_queryset(request).select_related('user', 'card')
+
+    def _update(self, request, queryset, **values):
+        # Un solo UPDATE; `updated_at` invalida las filas cacheadas de los listados.
+        updated = queryset.update(updated_at=timezone.now(), **values)
+        self.message_user(request, f'{updated} cartas actualizadas.')
+
+    @admin.action(description='Marcar para venta')
+    def set_intent_sell(self, request, queryset):
+        self._update(request, queryset, listing_intent='sell')
+
+    @admin.action(description='Marcar para cambio')
+    def set_intent_trade(self, request, queryset):
+        self._update(request, queryset, listing_intent='trade')
+
+    @admin.action(description='Marcar para venta/cambio')
+    def set_intent_sell_trade(self, request, queryset):
+        self._update(request, queryset, listing_intent='sell_trade')
+
+    @admin.action(description='Quitar el precio pedido')
+    def clear_asking_price(self, request, queryset):
+        self._update(request, queryset, asking_price=None)
 
-admin.site.register(Card)
-admin.site.register(UserCard)
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -14,8 +151,48 @@ class CustomUserAdmin(UserAdmin):
     list_filter = ("is_staff", "is_superuser", "city", "preferred_store", "transaction_preference")
     search_fields = ("username", "email", "city")
 
+
 @admin.register(Exchange)
-class ExchangeAdmin(admin.ModelAdmin):
-    list_display = ('sender', 'receiver', 'date')
-    list_filter = ('date',)
-    search_fields = ('sender__username', 'receiver__username')
+class ExchangeAdmin(ScalableModelAdmin):
+    list_display = ('id', 'sender', 'receiver', 'status', 'exchange_type', 'fairness_score', 'date')
+    list_filter = ('status', 'exchange_type', 'date')
+    list_select_related = ('sender', 'receiver')
+    raw_id_fields = ('sender', 'receiver')
+    search_fields = ('=sender__username', '=receiver__username')
+    user_search_fields = ('sender', 'receiver')
+    search_help_text = 'Usuario exacto que envia o recibe.'
+    actions = ('accept_pending', 'reject_pending')
+
+    def _set_status(self, request, queryset, status):
+        updated = queryset.filter(status='pending').update(status=status, updated_at=timezone.now())
+        self.message_user(request, f'{updated} intercambios pendientes actualizados.')
+
+    @admin.action(description='Aceptar los intercambios pendientes')
+    def accept_pending(self, request, queryset):
+        self._set_status(request, queryset, 'accepted')
+
+    @admin.action(description='Rechazar los intercambios pendientes')
+    def reject_pending(self, request, queryset):
+        self._set_status(request, queryset, 'rejected')
+
+
+@admin.register(Notification)
+class NotificationAdmin(ScalableModelAdmin):
+    list_display = ('id', 'sender', 'receiver', 'type', 'is_read', 'created_at')
+    list_filter = ('type', 'is_read')
+    list_select_related = ('sender', 'receiver')
+    raw_id_fields = ('sender', 'receiver', 'exchange', 'card')
+    search_fields = ('=sender__username', '=receiver__username')
+    user_search_fields = ('sender', 'receiver')
+    search_help_text = 'Usuario exacto que envia o recibe.'
+    actions = ('mark_read', 'mark_resolved')
+
+    @admin.action(description='Marcar como leidas')
+    def mark_read(self, request, queryset):
+        updated = queryset.update(is_read=True, updated_at=timezone.now())
+        self.message_user(request, f'{updated} notificaciones marcadas como leidas.')
+
+    @admin.action(description='Marcar como resueltas (salen de la bandeja)')
+    def mark_resolved(self, request, queryset):
+        updated = queryset.update(type='resolved', is_read=True, updated_at=timezone.now())
+        self.message_user(request, f'{updated} notificaciones resueltas.')
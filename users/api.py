@@ -0,0 +1,210 @@
+"""
+API JSON (`/api/`) sobre cartas, colecciones, intercambios y notificaciones.
+
+- Paginacion por cursor (`?cursor=`, `?page_size=`): el coste de cada pagina no crece con
+  la profundidad y no se repiten filas cuando se insertan otras mientras se recorre.
+- Fieldsets dispersos (`?fields=id,name`): las relaciones solo se cargan con
+  `select_related` si se pide algun campo que las necesita.
+- GET condicionales: listas y objetos llevan `ETag` y `Last-Modified` calculados con una
+  agregacion sobre `updated_at`, asi que un cliente que hace polling recibe un 304 sin que
+  se serialice nada.
+"""
+
+import hashlib
+
+from django.db.models import Count, Max, Q
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import permissions, routers, viewsets
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+
+from .models import Card, Exchange, Notification, UserCard
+from .serializers import (
+    CardSerializer,
+    ExchangeSerializer,
+    ListingSerializer,
+    NotificationSerializer,
+    UserCardSerializer,
+    requested_fields,
+)
+
+
+class IsStaffOrReadOnly(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.method in permissions.SAFE_METHODS or request.user.is_staff
+
+
+def _flag(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+class ConditionalGetMixin:
+    """
+    `list` y `retrieve` con validadores baratos. El ETag de una lista combina la URL
+    completa (filtros, cursor y campos), el usuario, el numero de filas y el ultimo
+    `updated_at`, de modo que tambien cambia al borrar filas. En las listas solo se
+    compara el ETag: `If-Modified-Since` no detectaria los borrados.
+    """
+
+    # Campo del serializador -> relaciones que necesita.
+    related_fields = {}
+
+    def with_related(self, queryset):
+        wanted = requested_fields(self.request)
+        related = {
+            relation
+            for field, relations in self.related_fields.items()
+            if wanted is None or field in wanted
+            for relation in relations
+        }
+        return queryset.select_related(*sorted(related)) if related else queryset
+
+    def _etag(self, *parts):
+        request = self.request
+        key = '|'.join(str(part) for part in (
+            request.get_full_path(), request.user.pk, request.accepted_renderer.format, *parts,
+        ))
+        return quote_etag(hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _with_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        # Los clientes pueden guardar la respuesta pero deben revalidarla siempre.
+        patch_cache_control(response, private=True, no_cache=True)
+        response['Vary'] = 'Accept, Cookie, Authorization'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        summary = queryset.aggregate(count=Count('pk'), last_modified=Max('updated_at'))
+        last_modified = summary['last_modified']
+        etag = self._etag(summary['count'], last_modified.isoformat() if last_modified else '')
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return self._with_validators(not_modified, etag, last_modified)
+        return self._with_validators(super().list(request, *args, **kwargs), etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = self._etag(instance.pk, instance.updated_at.isoformat())
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=int(instance.updated_at.timestamp()),
+        )
+        if not_modified is not None:
+            return self._with_validators(not_modified, etag, instance.updated_at)
+        response = Response(self.get_serializer(instance).data)
+        return self._with_validators(response, etag, instance.updated_at)
+
+
+class CardViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """Catalogo de cartas. `?name=` (exacto), `?search=` (contiene) y `?set_code=`."""
+
+    serializer_class = CardSerializer
+    permission_classes = [permissions.IsAuthenticated, IsStaffOrReadOnly]
+
+    def get_queryset(self):
+        queryset = Card.objects.all()
+        params = self.request.query_params
+        if params.get('name'):
+            queryset = queryset.filter(name__iexact=params['name'])
+        if params.get('search'):
+            queryset = queryset.filter(name__icontains=params['search'])
+        if params.get('set_code'):
+            queryset = queryset.filter(set_code__iexact=params['set_code'])
+        return queryset
+
+
+class UserCardViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """Coleccion del usuario autenticado (`card_list`). `?is_owned=true|false`."""
+
+    serializer_class = UserCardSerializer
+    related_fields = {'card': ('card',)}
+
+    def get_queryset(self):
+        queryset = UserCard.objects.filter(user=self.request.user)
+        if 'is_owned' in self.request.query_params:
+            queryset = queryset.filter(is_owned=_flag(self.request.query_params['is_owned']))
+        return self.with_related(queryset)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class ListingViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Cartas que poseen otros usuarios (`search_card_matches`): `?card_name=` busca el
+    nombre exacto y `?search=` por fragmento, como `search_card`.
+    """
+
+    serializer_class = ListingSerializer
+    related_fields = {'card': ('card',), 'owner': ('user',)}
+
+    def get_queryset(self):
+        queryset = (
+            UserCard.objects.filter(is_owned=True)
+            .exclude(user=self.request.user)
+            .exclude(user__transaction_preference='display_only')
+        )
+        params = self.request.query_params
+        if params.get('card_name'):
+            queryset = queryset.filter(card__name__iexact=params['card_name'])
+        if params.get('search'):
+            queryset = queryset.filter(card__name__icontains=params['search'])
+        return self.with_related(queryset)
+
+
+class ExchangeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """
+    Intercambios enviados o recibidos (`list_exchanges`). `POST` propone uno nuevo y
+    `PATCH {"status": "accepted"|"rejected"}` lo responde, solo el receptor y solo si
+    sigue pendiente (como `accept_exchange` / `reject_exchange`). `?status=` filtra.
+    """
+
+    serializer_class = ExchangeSerializer
+    http_method_names = ['get', 'post', 'patch', 'head', 'options']
+    related_fields = {'sender_username': ('sender',), 'receiver_username': ('receiver',)}
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Exchange.objects.filter(Q(sender=user) | Q(receiver=user))
+        if self.request.query_params.get('status'):
+            queryset = queryset.filter(status=self.request.query_params['status'])
+        return self.with_related(queryset)
+
+    def perform_create(self, serializer):
+        serializer.save(sender=self.request.user)
+
+    def perform_update(self, serializer):
+        exchange = serializer.instance
+        if exchange.receiver_id != self.request.user.pk:
+            raise PermissionDenied('Solo el receptor puede responder a este intercambio.')
+        if exchange.status != 'pending':
+            raise ValidationError({'status': 'Este intercambio ya fue respondido.'})
+        serializer.save()
+
+
+class NotificationViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """Notificaciones recibidas. `?unread=1` y `?type=`; `PATCH {"is_read": true}` las marca."""
+
+    serializer_class = NotificationSerializer
+    http_method_names = ['get', 'patch', 'head', 'options']
+    related_fields = {'sender_username': ('sender',)}
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(receiver=self.request.user)
+        params = self.request.query_params
+        if _flag(params.get('unread')):
+            queryset = queryset.filter(is_read=False)
+        if params.get('type'):
+            queryset = queryset.filter(type=params['type'])
+        return self.with_related(queryset)
+
+
+router = routers.DefaultRouter()
+router.register('cards', CardViewSet, basename='api-card')
+router.register('user-cards', UserCardViewSet, basename='api-user-card')
+router.register('listings', ListingViewSet, basename='api-listing')
+router.register('exchanges', ExchangeViewSet, basename='api-exchange')
+router.register('notifications', NotificationViewSet, basename='api-notification')
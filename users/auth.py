@@ -0,0 +1,33 @@
+"""
+Usuario autenticado cacheado.
+
+`CachedModelBackend` guarda la fila de `CustomUser` de cada sesion en la cache
+`AUTH_USER_CACHE_ALIAS` durante `AUTH_USER_CACHE_SECONDS`, de modo que una pagina
+autenticada no consulta la tabla de usuarios en cada peticion. `CustomUser.save()` y
+`delete()` borran la entrada, asi que un cambio de perfil, de contrasena o de `is_active`
+se ve en la siguiente peticion.
+"""
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+
+def user_cache_key(user_id):
+    return f'auth-user-{user_id}'
+
+
+def invalidate_user(user_id):
+    caches[settings.AUTH_USER_CACHE_ALIAS].delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        cache = caches[settings.AUTH_USER_CACHE_ALIAS]
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.AUTH_USER_CACHE_SECONDS)
+        return user
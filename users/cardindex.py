@@ -0,0 +1,251 @@
+"""
+Indice binario de nombres de carta compartido entre workers.
+
+`build_card_index` escribe en `CARD_INDEX_PATH` un fichero de solo lectura con todas las
+cartas ordenadas por nombre normalizado; cada worker lo abre con `mmap` al arrancar
+(`wsgi.py` / `asgi.py`), asi que las paginas viven una sola vez en la cache del sistema
+operativo y el indice se puede consultar desde la primera peticion.
+
+Formato (little endian):
+
+    cabecera   MAGIC, version, numero de cartas, offsets de cada seccion
+    registros  un `RECORD` de ancho fijo por carta, ordenados por nombre normalizado
+    por_id     indices de registro (uint32) ordenados por Scryfall ID
+    textos     cadenas UTF-8 referenciadas por (offset, longitud) desde los registros
+
+Las busquedas son binarias sobre los registros, sin deserializar nada. Si el fichero no
+existe o esta corrupto, `get_index()` devuelve None y los llamadores consultan la base de
+datos como siempre.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+MAGIC = b'MAKIIDX1'
+VERSION = 1
+# magic, version, cartas, offset registros, offset por_id, offset textos, construido (epoch)
+HEADER = struct.Struct('<8sIIQQQQ')
+# card id, clave, nombre, set_code, set_name, scryfall_id: (offset, longitud) de cada texto
+RECORD = struct.Struct('<QIHIHIBIHIB')
+INDEX_ENTRY = struct.Struct('<I')
+# Cada cuanto se comprueba si `build_card_index` ha sustituido el fichero.
+RELOAD_CHECK_SECONDS = 30
+
+_lock = threading.Lock()
+_index = None
+_checked_at = 0.0
+
+
+def normalize_name(value):
+    """Misma normalizacion que las claves de importacion: solo letras y digitos, en minuscula."""
+    return ''.join(ch.lower() for ch in (value or '') if ch.isalnum())
+
+
+def build(path, cards):
+    """
+    Escribe el indice de `cards` (iterable de tuplas id, nombre, set_code, set_name,
+    scryfall_id) de forma atomica y devuelve el numero de cartas indexadas.
+    """
+    rows = sorted(
+        (
+            (normalize_name(name), card_id, name or '', set_code or '', set_name or '', scryfall_id or '')
+            for card_id, name, set_code, set_name, scryfall_id in cards
+        ),
+        key=lambda row: (row[0], row[1]),
+    )
+    rows = [row for row in rows if row[0]]
+
+    strings = bytearray()
+    offsets = {}
+
+    def intern(text, limit):
+        encoded = text.encode('utf-8')[:limit]
+        if encoded not in offsets:
+            offsets[encoded] = len(strings)
+            strings.extend(encoded)
+        return offsets[encoded], len(encoded)
+
+    records = bytearray()
+    for key, card_id, name, set_code, set_name, scryfall_id in rows:
+        records.extend(RECORD.pack(
+            card_id,
+            *intern(key, 0xFFFF),
+            *intern(name, 0xFFFF),
+            *intern(set_code, 0xFF),
+            *intern(set_name, 0xFFFF),
+            *intern(scryfall_id, 0xFF),
+        ))
+
+    by_scryfall_id = bytearray()
+    for position in sorted((i for i, row in enumerate(rows) if row[5]), key=lambda i: rows[i][5]):
+        by_scryfall_id.extend(INDEX_ENTRY.pack(position))
+
+    records_offset = HEADER.size
+    by_id_offset = records_offset + len(records)
+    strings_offset = by_id_offset + len(by_scryfall_id)
+    header = HEADER.pack(MAGIC, VERSION, len(rows), records_offset, by_id_offset, strings_offset, int(time.time()))
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(temporary, 'wb') as handle:
+        handle.write(header)
+        handle.write(records)
+        handle.write(by_scryfall_id)
+        handle.write(strings)
+    os.replace(temporary, path)
+    return len(rows)
+
+
+class CardMatch(tuple):
+    __slots__ = ()
+    _fields = ('card_id', 'name', 'set_code', 'set_name', 'scryfall_id')
+
+    card_id = property(lambda self: self[0])
+    name = property(lambda self: self[1])
+    set_code = property(lambda self: self[2])
+    set_name = property(lambda self: self[3])
+    scryfall_id = property(lambda self: self[4])
+
+
+class CardIndex:
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as handle:
+            self.stat = os.fstat(handle.fileno())
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self._records, self._by_id, self._strings, self.built_at = (
+            HEADER.unpack_from(self._map, 0)
+        )
+        if (
+            magic != MAGIC or version != VERSION
+            or self._by_id - self._records != self.count * RECORD.size
+            or self._strings > len(self._map)
+        ):
+            self._map.close()
+            raise ValueError(f'{self.path} is not a card index (version {VERSION})')
+
+    def close(self):
+        self._map.close()
+
+    def __len__(self):
+        return self.count
+
+    def _text(self, offset, length):
+        start = self._strings + offset
+        return self._map[start:start + length]
+
+    def _record(self, position):
+        return RECORD.unpack_from(self._map, self._records + position * RECORD.size)
+
+    def _key(self, position):
+        _, key_offset, key_length, *_ = self._record(position)
+        return self._text(key_offset, key_length)
+
+    def _match(self, position):
+        card_id, _, _, name_off, name_len, code_off, code_len, set_off, set_len, sid_off, sid_len = (
+            self._record(position)
+        )
+        return CardMatch((
+            card_id,
+            self._text(name_off, name_len).decode('utf-8', errors='replace'),
+            self._text(code_off, code_len).decode('utf-8', errors='replace'),
+            self._text(set_off, set_len).decode('utf-8', errors='replace'),
+            self._text(sid_off, sid_len).decode('utf-8', errors='replace'),
+        ))
+
+    def _lower_bound(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, name, set_text=''):
+        """Cartas con ese nombre; si hay `set_text`, solo las de ese set (codigo o nombre)."""
+        key = normalize_name(name).encode('utf-8')
+        if not key:
+            return []
+        matches = []
+        position = self._lower_bound(key)
+        while position < self.count and self._key(position) == key:
+            matches.append(self._match(position))
+            position += 1
+        wanted_set = normalize_name(set_text)
+        if wanted_set:
+            matches = [
+                match for match in matches
+                if wanted_set in (normalize_name(match.set_code), normalize_name(match.set_name))
+            ]
+        return matches
+
+    def by_scryfall_id(self, scryfall_id):
+        wanted = (scryfall_id or '').encode('utf-8')
+        low, high = 0, (self._strings - self._by_id) // INDEX_ENTRY.size
+        while low < high:
+            middle = (low + high) // 2
+            position, = INDEX_ENTRY.unpack_from(self._map, self._by_id + middle * INDEX_ENTRY.size)
+            *_, sid_off, sid_len = self._record(position)
+            current = self._text(sid_off, sid_len)
+            if current == wanted:
+                return self._match(position)
+            if current < wanted:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def complete(self, prefix, limit=10):
+        """Hasta `limit` nombres distintos que empiezan por `prefix`, en orden alfabetico."""
+        key = normalize_name(prefix).encode('utf-8')
+        if not key:
+            return []
+        names = []
+        position = self._lower_bound(key)
+        while position < self.count and len(names) < limit:
+            if not self._key(position).startswith(key):
+                break
+            name = self._match(position).name
+            if not names or names[-1] != name:
+                names.append(name)
+            position += 1
+        return names
+
+
+def load(path=None):
+    """Abre (o vuelve a abrir) el indice; lo llaman `wsgi.py` y `asgi.py` al arrancar."""
+    global _index, _checked_at
+    path = str(path or settings.CARD_INDEX_PATH)
+    with _lock:
+        _checked_at = time.monotonic()
+        try:
+            _index = CardIndex(path)
+        except (OSError, ValueError, struct.error):
+            _index = None
+    # El mapa anterior no se cierra: alguna peticion en curso puede estar leyendolo y
+    # mmap lo libera cuando deja de tener referencias.
+    return _index
+
+
+def get_index():
+    """El indice cargado, o None si no hay ninguno. Recarga si el fichero se ha reconstruido."""
+    global _checked_at
+    if time.monotonic() - _checked_at < RELOAD_CHECK_SECONDS:
+        return _index
+    _checked_at = time.monotonic()
+    try:
+        stat = os.stat(settings.CARD_INDEX_PATH)
+    except OSError:
+        return _index
+    if _index is None or (stat.st_ino, stat.st_mtime_ns) != (_index.stat.st_ino, _index.stat.st_mtime_ns):
+        return load()
+    return _index
@@ -0,0 +1,135 @@
+"""Generador de datos sinteticos para los benchmarks (management commands `benchmark_*`)."""
+
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+
+from .models import Card, CustomUser, Exchange, Notification, UserCard
+
+NAME_PREFIXES = [
+    'Lightning', 'Serra', 'Dark', 'Llanowar', 'Counter', 'Swords', 'Birds', 'Wrath', 'Sol', 'Thought',
+    'Ancestral', 'Force', 'Brainstorm', 'Shivan', 'Goblin', 'Elvish', 'Mystic', 'Ethereal', 'Savage', 'Ancient',
+    'Verdant', 'Scalding', 'Misty', 'Arid', 'Bloodstained', 'Windswept', 'Wooded', 'Polluted', 'Flooded', 'Marsh',
+]
+NAME_SUFFIXES = [
+    'Bolt', 'Angel', 'Ritual', 'Elves', 'Spell', 'Plowshares', 'Paradise', 'God', 'Ring', 'Seize',
+    'Recall', 'Will', 'Storm', 'Dragon', 'Guide', 'Mystic', 'Confluence', 'Colossus', 'Tutor', 'Titan',
+    'Catacombs', 'Foothills', 'Rift', 'Mesa', 'Flats', 'Tomb', 'Delta', 'Wilds', 'Crypt', 'Vents',
+]
+SET_CODES = ['LEA', 'M10', 'ZEN', 'MH2', 'DMU', 'ONE', 'MOM', 'WOE', 'LCI', 'MKM', 'OTJ', 'BLB', 'DSK', 'FDN']
+NOTIFICATION_TYPES = ['resolved'] * 6 + ['info', 'action', 'exchange', 'compra']
+EXCHANGE_STATUSES = ['accepted'] * 3 + ['rejected'] * 2 + ['pending']
+
+
+def card_name(index):
+    """Nombre determinista y realista para la carta numero `index`."""
+    prefix = NAME_PREFIXES[index % len(NAME_PREFIXES)]
+    suffix = NAME_SUFFIXES[(index // len(NAME_PREFIXES)) % len(NAME_SUFFIXES)]
+    generation = index // (len(NAME_PREFIXES) * len(NAME_SUFFIXES))
+    return f"{prefix} {suffix}" + (f" {generation + 1}" if generation else '')
+
+
+def _batched(total, batch_size):
+    start = 0
+    while start < total:
+        yield start, min(batch_size, total - start)
+        start += batch_size
+
+
+def generate_dataset(users=100, cards=2000, user_cards=20000, exchanges=2000, notifications=5000,
+                     batch_size=5000, seed=0, prefix='bench', log=None):
+    """Inserta un dataset sintetico con bulk_create y devuelve los ids creados por modelo."""
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    password = make_password(None)
+
+    existing_users = CustomUser.objects.filter(username__startswith=f'{prefix}-').count()
+    created_users = CustomUser.objects.bulk_create(
+        [
+            CustomUser(
+                username=f'{prefix}-{existing_users + i}',
+                password=password,
+                city=rng.choice(CustomUser.CITY_CHOICES)[0],
+                transaction_preference=rng.choice(CustomUser.TRANSACTION_PREFERENCE_CHOICES)[0],
+            )
+            for i in range(users)
+        ],
+        batch_size=batch_size,
+    )
+    user_ids = [user.pk for user in created_users]
+    log(f'{len(user_ids)} users')
+
+    distinct_names = max(1, cards // 3)
+    card_ids = []
+    card_names = []
+    for start, size in _batched(cards, batch_size):
+        batch = []
+        for i in range(start, start + size):
+            usd_price = Decimal(rng.randint(10, 20000)) / 100
+            batch.append(Card(
+                name=card_name(i % distinct_names),
+                set_code=SET_CODES[(i // distinct_names) % len(SET_CODES)],
+                set_name=f'Set {SET_CODES[(i // distinct_names) % len(SET_CODES)]}',
+                collector_number=str(i % 400 + 1),
+                price=usd_price,
+                usd_price=usd_price,
+                eur_price=usd_price * Decimal('0.9'),
+            ))
+        created = Card.objects.bulk_create(batch, batch_size=batch_size)
+        card_ids.extend(card.pk for card in created)
+        card_names.extend(card.name for card in created)
+    log(f'{len(card_ids)} cards')
+
+    for start, size in _batched(user_cards, batch_size):
+        batch = []
+        for _ in range(size):
+            # Sesgo hacia las primeras cartas: unas pocas cartas populares tienen muchos duenos.
+            card_id = card_ids[int(len(card_ids) * rng.random() ** 2)]
+            is_owned = rng.random() < 0.7
+            quantity = rng.randint(1, 4)
+            batch.append(UserCard(
+                user_id=rng.choice(user_ids),
+                card_id=card_id,
+                is_owned=is_owned,
+                quantity_owned=quantity if is_owned else 0,
+                quantity_required=0 if is_owned else quantity,
+                listing_intent=rng.choice(UserCard.LISTING_INTENT_CHOICES)[0],
+                condition=rng.choice(UserCard.CONDITION_CHOICES)[0],
+            ))
+        UserCard.objects.bulk_create(batch, batch_size=batch_size)
+        log(f'{start + size} user cards')
+
+    exchange_ids = []
+    for start, size in _batched(exchanges, batch_size):
+        batch = []
+        for _ in range(size):
+            sender_id, receiver_id = rng.sample(user_ids, 2) if len(user_ids) > 1 else (user_ids[0], user_ids[0])
+            batch.append(Exchange(
+                sender_id=sender_id,
+                receiver_id=receiver_id,
+                sender_cards=', '.join(rng.sample(card_names, min(2, len(card_names)))),
+                receiver_cards=rng.choice(card_names),
+                status=rng.choice(EXCHANGE_STATUSES),
+                exchange_type=rng.choice(Exchange.EXCHANGE_TYPE_CHOICES)[0],
+            ))
+        exchange_ids.extend(exchange.pk for exchange in Exchange.objects.bulk_create(batch, batch_size=batch_size))
+    log(f'{len(exchange_ids)} exchanges')
+
+    for start, size in _batched(notifications, batch_size):
+        batch = []
+        for _ in range(size):
+            sender_id, receiver_id = rng.sample(user_ids, 2) if len(user_ids) > 1 else (user_ids[0], user_ids[0])
+            name = rng.choice(card_names)
+            batch.append(Notification(
+                sender_id=sender_id,
+                receiver_id=receiver_id,
+                message=f"{prefix} busca la carta '{name}'.",
+                type=rng.choice(NOTIFICATION_TYPES),
+                exchange_id=rng.choice(exchange_ids) if exchange_ids else None,
+                payload={'card_name': name},
+            ))
+        Notification.objects.bulk_create(batch, batch_size=batch_size)
+    log(f'{notifications} notifications')
+
+    return {'users': user_ids, 'cards': card_ids, 'exchanges': exchange_ids}
@@ -0,0 +1,166 @@
+"""
+Listas de cartas en texto (importacion por `import_cards`, `add_to_owned_cards` y
+`create_user_cards_from_txt`).
+
+`parse()` recorre las lineas una a una y reconoce los formatos habituales:
+
+    4 Lightning Bolt                    MTGO / lista simple
+    4 Lightning Bolt (M10) 146          MTGA y Moxfield (texto)
+    4x Lightning Bolt (M10) 146 *F*     Moxfield con marcas de foil/etched
+    1 Lightning Bolt [M10]              set entre corchetes
+    SB: 2 Duress                        sideboard de MTGO
+
+Las cabeceras de seccion (`Deck`, `Sideboard`, `Commander`, `// Sideboard`...) y los
+comentarios (`#`, `//`) se saltan; el bloque `About` de MTGA y el `Maybeboard` de Moxfield
+no son cartas de la lista y se ignoran enteros.
+
+`resolve()` agrupa las entradas repetidas y las busca por lotes entre las cartas locales:
+el nombre se normaliza con el indice de `cardindex` si esta cargado, las impresiones con
+set se buscan por set y numero de coleccionista, y las lineas sin set usan la carta sin
+set (`set_code=''`) como hacia la importacion en el navegador, o la impresion resuelta mas
+antigua si `reconcile_placeholder_cards` ya la fundio. Lo que no existe se crea con un
+solo `bulk_create`.
+"""
+
+import re
+from collections import namedtuple
+
+from . import cardindex
+from .models import Card
+
+BATCH_SIZE = 500
+MAX_QUANTITY = 10000
+NAME_MAX_LENGTH = Card._meta.get_field('name').max_length
+
+Entry = namedtuple('Entry', 'line_number quantity name set_code collector_number')
+
+LINE = re.compile(
+    r'''^
+    (?:SB:\s*)?
+    (?:(?P<quantity>\d+)\s*[xX]?\s+)?
+    (?P<name>.+?)
+    (?:\s+[(\[](?P<set_code>[A-Za-z0-9]{2,6})[)\]](?:\s+(?P<collector_number>[^\s*]+))?)?
+    (?:\s+\*[A-Za-z]+\*)*
+    \s*$''',
+    re.VERBOSE,
+)
+SECTION = re.compile(
+    r'^(?://\s*)?(deck|main|mainboard|sideboard|side|commander|commanders|companion|about|maybeboard|considering)'
+    r'(?:\s*\(\d+\))?\s*:?$',
+    re.IGNORECASE,
+)
+SKIPPED_SECTIONS = {'about', 'maybeboard', 'considering'}
+
+
+def parse(lines, errors=None):
+    """
+    Genera un `Entry` por cada linea con carta de `lines` (cualquier iterable de str). Las
+    lineas que no se entienden se anaden a `errors` como (numero de linea, texto).
+    """
+    section = 'deck'
+    for line_number, raw in enumerate(lines, start=1):
+        line = raw.strip().lstrip('\ufeff')
+        if not line:
+            continue
+        header = SECTION.match(line)
+        if header:
+            section = header.group(1).lower()
+            continue
+        if section in SKIPPED_SECTIONS or line.startswith(('#', '//')):
+            continue
+        match = LINE.match(line)
+        name = match.group('name').strip() if match else ''
+        if not name or name.isdigit() or len(name) > NAME_MAX_LENGTH:
+            if errors is not None:
+                errors.append((line_number, line))
+            continue
+        quantity = min(int(match.group('quantity') or 1), MAX_QUANTITY)
+        if quantity <= 0:
+            continue
+        yield Entry(
+            line_number,
+            quantity,
+            name,
+            (match.group('set_code') or '').upper(),
+            match.group('collector_number') or '',
+        )
+
+
+def _canonical_names(names):
+    """Nombre normalizado -> nombre tal como esta en el catalogo, segun el indice de cartas."""
+    index = cardindex.get_index()
+    canonical = {}
+    if index is None:
+        return canonical
+    for name in names:
+        matches = index.lookup(name)
+        if matches:
+            canonical[cardindex.normalize_name(name)] = matches[0].name
+    return canonical
+
+
+def _pick(candidates, set_code, collector_number):
+    if not set_code:
+        placeholders = [card for card in candidates if not card.set_code]
+        if not placeholders:
+            # `reconcile_placeholder_cards` funde los marcadores en la impresion resuelta mas antigua.
+            placeholders = [card for card in candidates if card.scryfall_id]
+        return min(placeholders, key=lambda card: card.pk, default=None)
+    in_set = [card for card in candidates if (card.set_code or '').upper() == set_code]
+    if collector_number:
+        exact = [card for card in in_set if (card.collector_number or '') == collector_number]
+        in_set = exact or in_set
+    # Mejor una impresion ya enriquecida con Scryfall que un marcador creado por otra importacion.
+    return min(in_set, key=lambda card: (not card.scryfall_id, card.pk), default=None)
+
+
+def resolve(entries):
+    """
+    Devuelve [(Card, cantidad, [numeros de linea])] para las entradas agrupadas por
+    nombre, set y numero; crea en bloque las cartas que no existen.
+    """
+    groups = {}
+    for entry in entries:
+        key = (cardindex.normalize_name(entry.name), entry.set_code, entry.collector_number)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [entry.name, entry.quantity, [entry.line_number]]
+        else:
+            group[1] += entry.quantity
+            group[2].append(entry.line_number)
+    if not groups:
+        return []
+
+    canonical = _canonical_names({name for name, _, _ in groups.values()})
+    for (name_key, _, _), group in groups.items():
+        group[0] = canonical.get(name_key, group[0])
+
+    candidates = {}
+    names = sorted({group[0] for group in groups.values()})
+    for start in range(0, len(names), BATCH_SIZE):
+        cards = Card.objects.filter(name__in=names[start:start + BATCH_SIZE]).only(
+            'id', 'name', 'set_code', 'collector_number', 'scryfall_id',
+        )
+        for card in cards:
+            candidates.setdefault(cardindex.normalize_name(card.name), []).append(card)
+
+    resolved = {}
+    missing = {}
+    for key, (name, _, _) in groups.items():
+        name_key, set_code, collector_number = key
+        card = _pick(candidates.get(name_key, []), set_code, collector_number)
+        if card is not None:
+            resolved[key] = card
+        else:
+            # Una sola carta nueva por nombre y set aunque lleguen varios numeros de coleccionista.
+            missing.setdefault((name_key, set_code), Card(
+                name=name, set_code=set_code, collector_number=collector_number or None,
+            ))
+    if missing:
+        # SQLite y PostgreSQL devuelven los ids con RETURNING.
+        Card.objects.bulk_create(list(missing.values()), batch_size=BATCH_SIZE)
+        for key in groups:
+            if key not in resolved:
+                resolved[key] = missing[key[:2]]
+
+    return [(resolved[key], quantity, line_numbers) for key, (_, quantity, line_numbers) in groups.items()]
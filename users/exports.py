@@ -0,0 +1,140 @@
+"""
+Exportacion de la coleccion.
+
+`export_collection` envia los UserCard del usuario como CSV compatible con Moxfield (el
+mismo formato que acepta `upload_file`) o como NDJSON, una carta por linea. La respuesta
+es un `StreamingHttpResponse` que recorre la consulta con `.iterator(chunk_size=...)`: la
+cabecera sale antes de la primera consulta y la memoria no crece con la coleccion.
+"""
+
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from django.views.decorators.http import require_GET
+
+from .models import UserCard
+
+MOXFIELD_COLUMNS = [
+    'Count', 'Tradelist Count', 'Name', 'Edition', 'Condition', 'Language', 'Foil', 'Tags',
+    'Last Modified', 'Collector Number', 'Alter', 'Proxy', 'Purchase Price',
+]
+EXPORT_FIELDS = [
+    'id', 'is_owned', 'quantity_owned', 'quantity_required', 'listing_intent', 'condition', 'asking_price',
+    'updated_at', 'card__name', 'card__set_code', 'card__set_name', 'card__collector_number',
+    'card__scryfall_id', 'card__price',
+]
+CONDITION_LABELS = dict(UserCard.CONDITION_CHOICES)
+TRADE_INTENTS = {'trade', 'sell_trade'}
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+SCOPES = {
+    'owned': {'is_owned': True},
+    'desired': {'is_owned': False},
+    'all': {},
+}
+# Filas por trozo enviado; cada trozo es una sola escritura en el socket.
+ROWS_PER_WRITE = 500
+
+
+def _rows(user, scope):
+    return (
+        UserCard.objects.filter(user=user, **SCOPES[scope])
+        .order_by('id')
+        .values(*EXPORT_FIELDS)
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+
+
+def _batched_lines(lines):
+    # La primera linea (la cabecera del CSV) sale sola, antes de consultar la base de datos.
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is not None:
+        yield first
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= ROWS_PER_WRITE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def _csv_line(writer, buffer, values):
+    writer.writerow(values)
+    line = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return line
+
+
+def moxfield_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+    yield _csv_line(writer, buffer, MOXFIELD_COLUMNS)
+    for row in rows:
+        quantity = row['quantity_owned'] if row['is_owned'] else row['quantity_required']
+        yield _csv_line(writer, buffer, [
+            quantity,
+            quantity if row['is_owned'] and row['listing_intent'] in TRADE_INTENTS else 0,
+            row['card__name'],
+            (row['card__set_code'] or '').lower(),
+            CONDITION_LABELS.get(row['condition'], ''),
+            'English',
+            '',
+            '' if row['is_owned'] else 'wishlist',
+            timezone.localtime(row['updated_at']).strftime('%Y-%m-%d %H:%M:%S.%f'),
+            row['card__collector_number'] or '',
+            'False',
+            'False',
+            row['asking_price'] if row['asking_price'] is not None else '',
+        ])
+
+
+def ndjson(rows):
+    for row in rows:
+        yield json.dumps({
+            'id': row['id'],
+            'name': row['card__name'],
+            'set_code': row['card__set_code'] or '',
+            'set_name': row['card__set_name'] or '',
+            'collector_number': row['card__collector_number'] or '',
+            'scryfall_id': row['card__scryfall_id'] or '',
+            'is_owned': row['is_owned'],
+            'quantity': row['quantity_owned'] if row['is_owned'] else row['quantity_required'],
+            'listing_intent': row['listing_intent'],
+            'condition': row['condition'],
+            'asking_price': str(row['asking_price']) if row['asking_price'] is not None else None,
+            'price': str(row['card__price']),
+            'updated_at': row['updated_at'].isoformat(),
+        }, ensure_ascii=False) + '\n'
+
+
+@login_required
+@require_GET
+def export_collection(request):
+    """`?format=csv|ndjson` y `?cards=owned|desired|all` (por defecto CSV de las poseidas)."""
+    export_format = request.GET.get('format', 'csv')
+    scope = request.GET.get('cards', 'owned')
+    if export_format not in FORMATS or scope not in SCOPES:
+        return HttpResponseBadRequest('Formato o seleccion de cartas no valido.')
+
+    rows = _rows(request.user, scope)
+    lines = moxfield_csv(rows) if export_format == 'csv' else ndjson(rows)
+    content_type, extension = FORMATS[export_format]
+    response = StreamingHttpResponse(_batched_lines(lines), content_type=content_type)
+    filename = f"coleccion-{request.user.username}-{scope}-{timezone.localdate():%Y%m%d}.{extension}"
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Cache-Control'] = 'private, no-store'
+    # Sin esto nginx acumula la respuesta entera antes de enviarla.
+    response['X-Accel-Buffering'] = 'no'
+    return response
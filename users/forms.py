@@ -15,4 +15,10 @@ class CardForm(forms.ModelForm):
         fields = ['name', 'description']
 
 class UploadFileForm(forms.Form):
+    MODE_CHOICES = [
+        ('append', 'Añadir todas las filas'),
+        ('sync', 'Sincronizar: aplicar solo los cambios respecto a mi colección'),
+    ]
+
     file = forms.FileField(label='Selecciona un archivo CSV')
+    mode = forms.ChoiceField(choices=MODE_CHOICES, initial='append', required=False, widget=forms.RadioSelect)
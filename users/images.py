@@ -0,0 +1,186 @@
+"""
+Cache local de imagenes de cartas.
+
+`card_image` sirve las imagenes de Scryfall a traves de la aplicacion: cada URL se
+descarga una sola vez a `CARD_IMAGE_CACHE_DIR`, se generan miniaturas `small` y
+`medium` con Pillow y se entregan con cabeceras de cache de un ano y ETag. Solo se
+aceptan URLs de `CARD_IMAGE_ALLOWED_HOSTS` para que el endpoint no sea un proxy abierto.
+
+La descarga se hace con `CARD_IMAGE_FETCHER` (ruta a una funcion `url -> bytes`), que
+en pruebas se puede cambiar por `placeholder_fetcher`. La cache se indexa por la URL
+sin query string ni fragmento (Scryfall anade `?<timestamp>` a las imagenes), asi que
+variar la query no crea ficheros nuevos, y no se guarda nada de mas de
+`CARD_IMAGE_MAX_BYTES`. El endpoint pide sesion y consume del bucket `card-image`.
+"""
+
+import hashlib
+import io
+import os
+import threading
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, HttpResponse, HttpResponseBadRequest
+from django.urls import reverse
+from django.utils.module_loading import import_string
+from django.views.decorators.http import require_GET
+
+from . import metrics, ratelimit, scryfall
+
+try:
+    from PIL import Image
+except ImportError:  # Sin Pillow se sirve la imagen original en todos los tamanos.
+    Image = None
+
+THUMBNAIL_SIZES = {
+    'small': (146, 204),
+    'medium': (244, 340),
+}
+SIZES = ('small', 'medium', 'full')
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Cerrojos repartidos por el hash de la URL: numero fijo, no uno por imagen vista. Dos
+# imagenes que caen en el mismo solo se descargan una detras de otra.
+FETCH_LOCK_STRIPES = 64
+_fetch_locks = [threading.Lock() for _ in range(FETCH_LOCK_STRIPES)]
+
+
+class ImageUnavailable(Exception):
+    pass
+
+
+def is_allowed(url):
+    parts = urlsplit(url or '')
+    return parts.scheme == 'https' and parts.hostname in settings.CARD_IMAGE_ALLOWED_HOSTS
+
+
+def canonical_url(url):
+    """`url` sin credenciales, puerto, query string ni fragmento: la clave de la cache."""
+    parts = urlsplit(url or '')
+    return urlunsplit((parts.scheme, parts.hostname or '', parts.path, '', ''))
+
+
+def proxy_url(url, size='small'):
+    """URL del proxy para `url`; si el host no esta permitido, la propia `url`."""
+    if not is_allowed(url):
+        return url
+    return f"{reverse('card_image')}?{urlencode({'url': canonical_url(url), 'size': size})}"
+
+
+def fetch_from_upstream(url):
+    try:
+        response = scryfall.get_client().request('GET', url)
+    except (HTTPError, URLError, TimeoutError) as exc:
+        raise ImageUnavailable(str(exc)) from exc
+    return response.body
+
+
+def placeholder_fetcher(url):
+    """Fetcher para pruebas: una imagen de color fijo derivado de la URL, sin red."""
+    if Image is None:
+        raise ImageUnavailable('Pillow is required for placeholder images')
+    digest = hashlib.sha1(url.encode('utf-8')).digest()
+    buffer = io.BytesIO()
+    Image.new('RGB', (488, 680), tuple(digest[:3])).save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def _key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+
+def _path(key, size):
+    suffix = 'orig' if size == 'full' else f'{size}.jpg'
+    return Path(settings.CARD_IMAGE_CACHE_DIR) / key[:2] / f'{key}.{suffix}'
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+
+
+def _lock_for(key):
+    return _fetch_locks[int(key, 16) % FETCH_LOCK_STRIPES]
+
+
+def is_cached(url, size='small'):
+    return _path(_key(canonical_url(url)), size).exists()
+
+
+def cached_image_path(url, size='small'):
+    """Ruta local de la imagen en el tamano pedido; descarga y redimensiona si hace falta."""
+    url = canonical_url(url)
+    key = _key(url)
+    target = _path(key, size)
+    if target.exists():
+        metrics.inc('maki_scryfall_cache_total', cache='image', result='hit')
+        return target
+
+    metrics.inc('maki_scryfall_cache_total', cache='image', result='miss')
+    # Un solo hilo por imagen descarga el original; el resto espera y lo reutiliza.
+    with _lock_for(key):
+        original = _path(key, 'full')
+        if not original.exists():
+            data = import_string(settings.CARD_IMAGE_FETCHER)(url)
+            if len(data) > settings.CARD_IMAGE_MAX_BYTES:
+                raise ImageUnavailable(f'{url} is larger than {settings.CARD_IMAGE_MAX_BYTES} bytes')
+            _write_atomic(original, data)
+        if size == 'full' or Image is None:
+            return original
+        if not target.exists():
+            try:
+                _write_atomic(target, _thumbnail(original, THUMBNAIL_SIZES[size]))
+            except OSError as exc:
+                # Lo descargado no es una imagen valida: se descarta para reintentar luego.
+                original.unlink(missing_ok=True)
+                raise ImageUnavailable(str(exc)) from exc
+    return target
+
+
+def _thumbnail(original, dimensions):
+    with Image.open(original) as image:
+        image = image.convert('RGB')
+        image.thumbnail(dimensions, Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _content_type(path):
+    with open(path, 'rb') as handle:
+        header = handle.read(8)
+    if header.startswith(b'\x89PNG'):
+        return 'image/png'
+    if header[:4] == b'RIFF':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+@login_required
+@require_GET
+@ratelimit.rate_limit(ratelimit.card_image_bucket)
+def card_image(request):
+    url = canonical_url(request.GET.get('url', ''))
+    size = request.GET.get('size', 'small')
+    if size not in SIZES or not is_allowed(url):
+        return HttpResponseBadRequest('Imagen no permitida.')
+
+    try:
+        path = cached_image_path(url, size)
+    except ImageUnavailable:
+        return HttpResponse(status=502)
+
+    stat = path.stat()
+    etag = f'"{_key(url)}-{size}-{stat.st_size}-{int(stat.st_mtime)}"'
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponse(status=304)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=_content_type(path))
+    response['ETag'] = etag
+    response['Cache-Control'] = CACHE_CONTROL
+    return response
@@ -0,0 +1,83 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, transaction
+from django.utils import timezone
+
+from users.models import Notification, NotificationArchive
+
+
+class Command(BaseCommand):
+    help = 'Archive (or delete) resolved notifications older than the given age, in small chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Minimum age in days of the notifications to process.')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows moved per transaction.')
+        parser.add_argument('--delete', action='store_true', help='Delete the rows instead of copying them to the archive.')
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to sleep between chunks so other writers can take the lock.')
+        parser.add_argument('--max-retries', type=int, default=5, help='Retries per chunk when SQLite reports the database as locked.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        pending = Notification.objects.filter(type='resolved', created_at__lt=cutoff).order_by('id')
+        action = 'deleted' if options['delete'] else 'archived'
+
+        processed = 0
+        last_id = 0
+        started = time.monotonic()
+        while True:
+            chunk_ids = list(pending.filter(id__gt=last_id).values_list('id', flat=True)[:options['chunk_size']])
+            if not chunk_ids:
+                break
+            self._process_chunk(chunk_ids, options)
+            processed += len(chunk_ids)
+            last_id = chunk_ids[-1]
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{processed} rows {action} ({processed / elapsed if elapsed else 0:.0f} rows/s)')
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f'Done: {processed} notifications {action} in {elapsed:.2f}s ({rate:.0f} rows/s).'))
+
+    def _process_chunk(self, chunk_ids, options):
+        for attempt in range(options['max_retries'] + 1):
+            try:
+                with transaction.atomic():
+                    if not options['delete']:
+                        self._copy_to_archive(chunk_ids)
+                    Notification.objects.filter(id__in=chunk_ids).delete()
+                return
+            except OperationalError as exc:
+                if 'locked' not in str(exc) or attempt == options['max_retries']:
+                    raise
+                wait = 0.1 * 2 ** attempt
+                self.stderr.write(f'Database locked, retrying chunk in {wait:.1f}s.')
+                time.sleep(wait)
+
+    def _copy_to_archive(self, chunk_ids):
+        rows = Notification.objects.filter(id__in=chunk_ids).values_list(
+            'id', 'sender_id', 'receiver_id', 'message', 'exchange_id', 'card_id', 'payload', 'created_at'
+        )
+        NotificationArchive.objects.bulk_create(
+            [
+                NotificationArchive(
+                    notification_id=notification_id,
+                    sender_id=sender_id,
+                    receiver_id=receiver_id,
+                    message=message,
+                    exchange_id=exchange_id,
+                    card_id=card_id,
+                    payload=payload,
+                    created_at=created_at,
+                )
+                for notification_id, sender_id, receiver_id, message, exchange_id, card_id, payload, created_at in rows
+            ],
+            ignore_conflicts=True,
+        )
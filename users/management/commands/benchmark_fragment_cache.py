@@ -0,0 +1,115 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from users.dataset import generate_dataset
+from users.models import CustomUser, UserCard
+
+DUMMY_FRAGMENTS = {
+    **settings.CACHES,
+    'fragments': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Render the collection and search pages for a user with a large collection with template '
+        'fragment caching disabled, cold, warm and right after editing one card, and report p50 '
+        'latency and query counts. Runs against a generated throwaway database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collection', type=int, default=5000, help='Cards in the benchmarked collection.')
+        parser.add_argument('--iterations', type=int, default=10, help='Timed requests per page and scenario.')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            collector = self._generate(options['collection'])
+            self._benchmark(collector, options['iterations'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _generate(self, collection):
+        log = lambda message: self.stdout.write(f'  generated {message}')  # noqa: E731
+        # Un coleccionista con toda la coleccion y otros usuarios para que la busqueda tenga filas.
+        generate_dataset(users=1, cards=collection, user_cards=collection, exchanges=0, notifications=0,
+                         prefix='collector', log=log)
+        generate_dataset(users=60, cards=2000, user_cards=30000, exchanges=0, notifications=0,
+                         prefix='bench', seed=1, log=log)
+        return CustomUser.objects.get(username='collector-0')
+
+    def _benchmark(self, collector, iterations):
+        client = Client()
+        client.force_login(collector)
+        popular = (
+            UserCard.objects.filter(is_owned=True).values('card__name')
+            .annotate(owners=Count('user', distinct=True)).order_by('-owners').first()
+        )
+        pages = [
+            ('card_list', reverse('card_list'), {}),
+            ('view_user_cards', reverse('view_user_cards'), {'user_id': collector.pk}),
+            ('search_card_matches', reverse('search_card_matches'), {'card_name': popular['card__name']}),
+        ]
+        edited = UserCard.objects.filter(user=collector, is_owned=True).first()
+        fragments = caches['fragments']
+
+        def uncached():
+            pass
+
+        def cold():
+            fragments.clear()
+
+        def after_edit():
+            edited.quantity_owned += 1
+            edited.save(update_fields=['quantity_owned', 'updated_at'])
+
+        scenarios = [('no fragment cache', uncached), ('cold', cold), ('warm', uncached), ('after 1 edit', after_edit)]
+
+        self.stdout.write(
+            f"\nCollection: {UserCard.objects.filter(user=collector).count()} cards, "
+            f"search '{popular['card__name']}' has {popular['owners']} owners"
+        )
+        self.stdout.write(f"\n{'page':<22} {'scenario':<18} {'p50 ms':>9} {'queries':>8} {'vs uncached':>12}")
+        for name, url, data in pages:
+            baseline = None
+            for label, before_request in scenarios:
+                if label == 'no fragment cache':
+                    with override_settings(CACHES=DUMMY_FRAGMENTS):
+                        p50, queries = self._measure(client, url, data, before_request, iterations)
+                else:
+                    fragments = caches['fragments']
+                    fragments.clear()
+                    client.get(url, data)
+                    p50, queries = self._measure(client, url, data, before_request, iterations)
+                baseline = baseline or p50
+                self.stdout.write(
+                    f"{name:<22} {label:<18} {p50:>9.2f} {queries:>8} {(p50 - baseline) / baseline * 100:>+11.0f}%"
+                )
+
+    def _measure(self, client, url, data, before_request, iterations):
+        timings = []
+        queries = 0
+        for _ in range(iterations):
+            before_request()
+            query_count = 0
+
+            def count_queries(execute, sql, params, many, context):
+                nonlocal query_count
+                query_count += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_queries):
+                started = time.perf_counter()
+                response = client.get(url, data)
+                timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, (url, response.status_code)
+            queries = query_count
+        return statistics.median(timings), queries
@@ -0,0 +1,137 @@
+import json
+import statistics
+import time
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Q
+
+from users.dataset import generate_dataset
+from users.models import Card, Exchange, Notification, UserCard
+
+index_migration = import_module('users.migrations.0009_query_indexes')
+
+INDEXED_MODELS = (Card, UserCard, Notification, Exchange)
+
+# Mismas consultas que emiten las vistas de users/views.py y la portada.
+QUERY_SHAPES = [
+    ('card_list owned', lambda ctx: UserCard.objects.filter(user_id=ctx['user_id'], is_owned=True)),
+    ('card_list desired', lambda ctx: UserCard.objects.filter(user_id=ctx['user_id'], is_owned=False)),
+    ('search_card_matches', lambda ctx: UserCard.objects.filter(
+        card__name__iexact=ctx['card_name'], is_owned=True).exclude(user_id=ctx['user_id'])),
+    ('search_users_with_desired_card', lambda ctx: UserCard.objects.filter(
+        card__name__iexact=ctx['card_name'], is_owned=False).exclude(user_id=ctx['user_id'])),
+    ('edit_card_quantity', lambda ctx: UserCard.objects.filter(user_id=ctx['user_id'], card_id=ctx['card_id'])),
+    ('Card get_or_create(name, set_code)', lambda ctx: Card.objects.filter(name=ctx['card_name'], set_code='')),
+    ('list_notifications', lambda ctx: Notification.objects.filter(
+        receiver_id=ctx['user_id']).exclude(type='resolved').order_by('-created_at')),
+    ('pending_transactions', lambda ctx: Exchange.objects.filter(receiver_id=ctx['user_id'], status='pending')),
+    ('list_exchanges', lambda ctx: Exchange.objects.filter(
+        Q(sender_id=ctx['user_id']) | Q(receiver_id=ctx['user_id'])).order_by('-date')),
+    ('home accepted exchanges', lambda ctx: Exchange.objects.filter(status='accepted').values_list(
+        'sender_cards', 'receiver_cards')),
+    ('home featured cards', lambda ctx: Card.objects.order_by('-price', 'name')[:3]),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Build a throwaway database with a synthetic dataset and compare query plans and latencies '
+        'of the view queries with and without the indexes from migration 0009.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--cards', type=int, default=60000)
+        parser.add_argument('--user-cards', type=int, default=1_000_000)
+        parser.add_argument('--exchanges', type=int, default=100000)
+        parser.add_argument('--notifications', type=int, default=300000)
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query.')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self._benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['json_path']}"))
+
+    def _benchmark(self, options):
+        started = time.monotonic()
+        generate_dataset(
+            users=options['users'],
+            cards=options['cards'],
+            user_cards=options['user_cards'],
+            exchanges=options['exchanges'],
+            notifications=options['notifications'],
+            log=lambda message: self.stdout.write(f'  generated {message}'),
+        )
+        self.stdout.write(f'Dataset ready in {time.monotonic() - started:.1f}s')
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        busiest_user = (
+            UserCard.objects.values('user_id').annotate(total=Count('id')).order_by('-total').first()['user_id']
+        )
+        sample = UserCard.objects.filter(user_id=busiest_user).select_related('card').first()
+        context = {'user_id': busiest_user, 'card_id': sample.card_id, 'card_name': sample.card.name.upper()}
+
+        with_indexes = self._measure(context, options['repeat'])
+        self._drop_indexes()
+        try:
+            without_indexes = self._measure(context, options['repeat'])
+        finally:
+            self._restore_indexes()
+
+        results = []
+        self.stdout.write(f"\n{'query':<34} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+        for label, _ in QUERY_SHAPES:
+            before, after = without_indexes[label], with_indexes[label]
+            speedup = before['median_ms'] / after['median_ms'] if after['median_ms'] else float('inf')
+            self.stdout.write(f"{label:<34} {before['median_ms']:>10.2f} {after['median_ms']:>10.2f} {speedup:>7.1f}x")
+            results.append({'query': label, 'before': before, 'after': after})
+
+        self.stdout.write('\nQuery plans (before -> after):')
+        for entry in results:
+            self.stdout.write(f"\n[{entry['query']}]")
+            self.stdout.write(f"  before: {entry['before']['plan']}")
+            self.stdout.write(f"  after:  {entry['after']['plan']}")
+        return results
+
+    def _measure(self, context, repeat):
+        measurements = {}
+        for label, build_queryset in QUERY_SHAPES:
+            queryset = build_queryset(context)
+            plan = queryset.explain().replace('\n', ' | ')
+            # Se mide solo la base de datos, sin construir instancias del ORM.
+            sql, params = queryset.query.sql_with_params()
+            timings = []
+            with connection.cursor() as cursor:
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append((time.perf_counter() - started) * 1000)
+            measurements[label] = {'median_ms': statistics.median(timings), 'max_ms': max(timings), 'plan': plan}
+        return measurements
+
+    def _drop_indexes(self):
+        with connection.schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+            index_migration.drop_card_name_ci_index(None, editor)
+
+    def _restore_indexes(self):
+        with connection.schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+            index_migration.create_card_name_ci_index(None, editor)
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Run concurrent readers and writers against a scratch SQLite file, once with the default '
+        'rollback journal and once with the production pragmas, and compare throughput.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of each run.')
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--rows-per-write', type=int, default=200, help='Rows inserted per write transaction.')
+
+    def handle(self, *args, **options):
+        production_pragmas = [
+            statement.strip()
+            for statement in settings.SQLITE_PRODUCTION_OPTIONS['init_command'].split(';')
+            if statement.strip()
+        ]
+        profiles = [
+            ('default', ['PRAGMA journal_mode=DELETE'], 5),
+            ('production', production_pragmas, settings.SQLITE_PRODUCTION_OPTIONS['timeout']),
+        ]
+        for label, pragmas, timeout in profiles:
+            with tempfile.TemporaryDirectory() as scratch_dir:
+                result = self._run(os.path.join(scratch_dir, 'bench.sqlite3'), pragmas, timeout, options)
+            self.stdout.write(
+                f"{label:<11} reads/s={result['reads'] / options['seconds']:>9.0f}  "
+                f"writes/s={result['writes'] / options['seconds']:>7.0f}  "
+                f"locked_errors={result['locked']:<5} "
+                f"max_read_ms={result['max_read'] * 1000:.1f}  "
+                f"reads_during_writes={result['overlapping_reads']}"
+            )
+
+    def _connect(self, path, pragmas, timeout):
+        connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        for pragma in pragmas:
+            connection.execute(pragma)
+        return connection
+
+    def _run(self, path, pragmas, timeout, options):
+        setup = self._connect(path, pragmas, timeout)
+        setup.execute('CREATE TABLE usercard (id INTEGER PRIMARY KEY, user_id INTEGER, name TEXT, quantity INTEGER)')
+        setup.execute('CREATE INDEX usercard_user ON usercard (user_id)')
+        setup.executemany(
+            'INSERT INTO usercard (user_id, name, quantity) VALUES (?, ?, ?)',
+            ((i % 100, f'card {i}', 1) for i in range(20000)),
+        )
+        setup.close()
+
+        stop = threading.Event()
+        writing = threading.Event()
+        lock = threading.Lock()
+        result = {'reads': 0, 'writes': 0, 'locked': 0, 'max_read': 0.0, 'overlapping_reads': 0}
+
+        def reader(worker):
+            connection = self._connect(path, pragmas, timeout)
+            while not stop.is_set():
+                started = time.perf_counter()
+                during_write = writing.is_set()
+                try:
+                    connection.execute(
+                        'SELECT COUNT(*), SUM(quantity) FROM usercard WHERE user_id = ?', (worker,)
+                    ).fetchone()
+                except sqlite3.OperationalError:
+                    with lock:
+                        result['locked'] += 1
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    result['reads'] += 1
+                    result['max_read'] = max(result['max_read'], elapsed)
+                    if during_write:
+                        result['overlapping_reads'] += 1
+            connection.close()
+
+        def writer(worker):
+            connection = self._connect(path, pragmas, timeout)
+            rows = [(worker, f'import {worker}-{i}', 1) for i in range(options['rows_per_write'])]
+            while not stop.is_set():
+                try:
+                    connection.execute('BEGIN IMMEDIATE')
+                    writing.set()
+                    connection.executemany('INSERT INTO usercard (user_id, name, quantity) VALUES (?, ?, ?)', rows)
+                    connection.execute('COMMIT')
+                except sqlite3.OperationalError:
+                    if connection.in_transaction:
+                        connection.execute('ROLLBACK')
+                    with lock:
+                        result['locked'] += 1
+                    continue
+                finally:
+                    writing.clear()
+                with lock:
+                    result['writes'] += 1
+            connection.close()
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return result
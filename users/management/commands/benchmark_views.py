@@ -0,0 +1,174 @@
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from users import urls as user_urls
+from users.dataset import generate_dataset
+from users.models import CustomUser, Exchange, UserCard
+
+# login/logout cambian la sesion del cliente de pruebas.
+SKIPPED_URL_NAMES = {'login', 'logout'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every URL in users/urls.py (plus the landing page) through the test client and report '
+        'p50/p95 latency, query counts and peak memory. Results are written as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per URL.')
+        parser.add_argument('--output', default='benchmark_views.json', help='Where to write the JSON results.')
+        parser.add_argument('--compare', help='Previous results file to compare against.')
+        parser.add_argument('--current-db', action='store_true',
+                            help='Benchmark the configured database instead of a generated throwaway one.')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--cards', type=int, default=10000)
+        parser.add_argument('--user-cards', type=int, default=100000)
+        parser.add_argument('--exchanges', type=int, default=10000)
+        parser.add_argument('--notifications', type=int, default=30000)
+
+    def handle(self, *args, **options):
+        old_name = None
+        if not options['current_db']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            if not options['current_db']:
+                generate_dataset(
+                    users=options['users'],
+                    cards=options['cards'],
+                    user_cards=options['user_cards'],
+                    exchanges=options['exchanges'],
+                    notifications=options['notifications'],
+                    log=lambda message: self.stdout.write(f'  generated {message}'),
+                )
+            report = self._benchmark(options['iterations'])
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options['compare']:
+            self._compare(options['compare'], report)
+
+    def _benchmark(self, iterations):
+        # Las vistas solo-POST devuelven 500 en GET; se registran en la tabla, no en el log.
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        busiest = UserCard.objects.values('user_id').annotate(total=Count('id')).order_by('-total').first()
+        user = CustomUser.objects.get(pk=busiest['user_id']) if busiest else CustomUser.objects.first()
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+
+        user_card = UserCard.objects.filter(user=user).first()
+        pending = Exchange.objects.filter(receiver=user, status='pending').first()
+        url_kwargs = {
+            'card_id': user_card.card_id if user_card else 0,
+            'is_owned': 1,
+            'user_id': user.pk,
+            'exchange_id': pending.pk if pending else 0,
+        }
+        # delete_card recibe el id del UserCard, no el de la carta.
+        url_kwargs_overrides = {'delete_card': {'card_id': user_card.pk if user_card else 0}}
+        popular_name = user_card.card.name if user_card else ''
+        query_strings = {
+            'search_card': {'card_name': popular_name[:5]},
+            'search_card_matches': {'card_name': popular_name},
+            'search_users_with_desired_card': {'card_name': popular_name},
+            'view_user_cards': {'user_id': user.pk},
+        }
+
+        targets = [('home', reverse('home'))]
+        for pattern in user_urls.urlpatterns:
+            if not isinstance(pattern, URLPattern) or pattern.name in SKIPPED_URL_NAMES:
+                continue
+            kwargs = {name: url_kwargs.get(name, 0) for name in pattern.pattern.converters}
+            kwargs.update(url_kwargs_overrides.get(pattern.name, {}))
+            targets.append((pattern.name, reverse(pattern.name, kwargs=kwargs)))
+
+        results = []
+        self.stdout.write(f"\n{'view':<32} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'peak KiB':>9}")
+        for name, url in targets:
+            data = query_strings.get(name, {})
+            timings = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                response = self._request(client, url, data)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            query_count = 0
+
+            def count_queries(execute, sql, params, many, context):
+                nonlocal query_count
+                query_count += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_queries):
+                self._request(client, url, data)
+            tracemalloc.start()
+            self._request(client, url, data)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            entry = {
+                'view': name,
+                'url': url,
+                'status': response.status_code,
+                'p50_ms': round(statistics.median(timings), 3),
+                'p95_ms': round(self._percentile(timings, 95), 3),
+                'queries': query_count,
+                'peak_kib': round(peak / 1024, 1),
+            }
+            results.append(entry)
+            self.stdout.write(
+                f"{name:<32} {entry['status']:>6} {entry['p50_ms']:>9.2f} {entry['p95_ms']:>9.2f} "
+                f"{entry['queries']:>8} {entry['peak_kib']:>9.1f}"
+            )
+
+        return {
+            'generated_at': timezone.now().isoformat(),
+            'iterations': iterations,
+            'dataset': {
+                'users': CustomUser.objects.count(),
+                'user_cards': UserCard.objects.count(),
+                'exchanges': Exchange.objects.count(),
+            },
+            'results': results,
+        }
+
+    def _request(self, client, url, data):
+        # Algunas vistas escriben en GET (add_card, delete_card): cada peticion se revierte.
+        with transaction.atomic():
+            response = client.get(url, data)
+            transaction.set_rollback(True)
+        return response
+
+    def _percentile(self, values, percentile):
+        if len(values) < 2:
+            return values[0]
+        return statistics.quantiles(values, n=100, method='inclusive')[percentile - 1]
+
+    def _compare(self, previous_path, report):
+        with open(previous_path, encoding='utf-8') as handle:
+            previous = {entry['view']: entry for entry in json.load(handle)['results']}
+        self.stdout.write(f"\n{'view':<32} {'p50 before':>10} {'p50 after':>10} {'change':>8} {'queries':>10}")
+        for entry in report['results']:
+            before = previous.get(entry['view'])
+            if not before:
+                continue
+            change = (entry['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+            self.stdout.write(
+                f"{entry['view']:<32} {before['p50_ms']:>10.2f} {entry['p50_ms']:>10.2f} {change:>+7.0f}% "
+                f"{before['queries']:>4} -> {entry['queries']:<4}"
+            )
@@ -0,0 +1,30 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users import cardindex
+from users.models import Card
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the read-only card name index (names, set codes and Scryfall IDs) that every worker '
+        'memory-maps at startup. Workers pick up a rebuilt file within a few seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help='Output file (defaults to CARD_INDEX_PATH).')
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.CARD_INDEX_PATH
+        started = time.monotonic()
+        cards = Card.objects.values_list('id', 'name', 'set_code', 'set_name', 'scryfall_id').iterator(chunk_size=5000)
+        count = cardindex.build(path, cards)
+        elapsed = time.monotonic() - started
+        size = os.path.getsize(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} cards into {path} ({size / 1024:.0f} KiB, {size / max(count, 1):.0f} bytes/card) '
+            f'in {elapsed:.2f}s.'
+        ))
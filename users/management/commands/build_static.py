@@ -0,0 +1,63 @@
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from my_django_project.staticfiles import template_static_references
+
+
+class Command(BaseCommand):
+    help = (
+        'Collect the static files the templates reference into STATIC_ROOT with hashed names and '
+        'gzip/brotli copies, then compare the cold page transfer size against the unprocessed sources.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-clear', action='store_true', help='Keep files already in STATIC_ROOT.')
+
+    def handle(self, *args, **options):
+        if not hasattr(staticfiles_storage, 'stored_name'):
+            raise CommandError(
+                'The static files storage does not hash names. Run with DJANGO_ENV=production '
+                'or point STORAGES["staticfiles"] at CompressedManifestStaticFilesStorage.'
+            )
+        call_command('collectstatic', interactive=False, clear=not options['no_clear'], verbosity=0)
+
+        source_count = sum(len(files) for directory in settings.STATICFILES_DIRS for _, _, files in os.walk(directory))
+        built_count = sum(
+            1 for _, _, files in os.walk(settings.STATIC_ROOT)
+            for name in files if not name.endswith(('.gz', '.br'))
+        )
+        self.stdout.write(f'Collected {built_count} files into {settings.STATIC_ROOT} '
+                          f'(STATICFILES_DIRS holds {source_count}, admin assets included).')
+
+        self.stdout.write(f"\n{'asset':<28} {'source':>10} {'built':>10} {'gzip':>10} {'brotli':>10}")
+        total_before = total_after = 0
+        for path in sorted(template_static_references(include_apps=False)):
+            source = finders.find(path)
+            if not source:
+                continue
+            built = Path(staticfiles_storage.path(staticfiles_storage.stored_name(path)))
+            sizes = {suffix: self._size(Path(f'{built}{suffix}')) for suffix in ('', '.gz', '.br')}
+            best = min(size for size in sizes.values() if size is not None)
+            total_before += os.path.getsize(source)
+            total_after += best
+            self.stdout.write(
+                f"{path:<28} {self._kib(os.path.getsize(source)):>10} {self._kib(sizes['']):>10} "
+                f"{self._kib(sizes['.gz']):>10} {self._kib(sizes['.br']):>10}"
+            )
+        reduction = (1 - total_after / total_before) * 100 if total_before else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'\nCold page load (local assets): {self._kib(total_before)} -> {self._kib(total_after)} '
+            f'({reduction:.0f}% less).'
+        ))
+
+    def _size(self, path):
+        return path.stat().st_size if path.exists() else None
+
+    def _kib(self, size):
+        return '-' if size is None else f'{size / 1024:.1f} KiB'
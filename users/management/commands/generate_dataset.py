@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.dataset import generate_dataset
+
+
+class Command(BaseCommand):
+    help = 'Insert a synthetic dataset (users, cards, user cards, exchanges, notifications) with bulk inserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--cards', type=int, default=2000)
+        parser.add_argument('--user-cards', type=int, default=20000)
+        parser.add_argument('--exchanges', type=int, default=2000)
+        parser.add_argument('--notifications', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='bench', help='Prefix of the generated usernames.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        generate_dataset(
+            users=options['users'],
+            cards=options['cards'],
+            user_cards=options['user_cards'],
+            exchanges=options['exchanges'],
+            notifications=options['notifications'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            log=lambda message: self.stdout.write(f'  {message}'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Dataset generated in {time.monotonic() - started:.1f}s.'))
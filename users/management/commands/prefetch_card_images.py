@@ -0,0 +1,64 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import images
+from users.models import Card
+
+
+class Command(BaseCommand):
+    help = (
+        'Warm the local card image cache: download the newest cards\' Scryfall images and build their '
+        'thumbnails so the first page view does not pay for it. Already cached images are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help='Newest cards to check (0 checks every card).')
+        parser.add_argument('--sizes', default='small,medium', help='Comma separated sizes to build.')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--interval', type=float, default=0, help='Keep running every N seconds instead of once.')
+
+    def handle(self, *args, **options):
+        sizes = [size.strip() for size in options['sizes'].split(',') if size.strip()]
+        unknown = set(sizes) - set(images.SIZES)
+        if unknown:
+            raise CommandError(f"Unknown sizes: {', '.join(sorted(unknown))}. Choose from {', '.join(images.SIZES)}.")
+
+        while True:
+            started = time.monotonic()
+            self._prefetch(sizes, options['limit'], options['workers'])
+            if not options['interval']:
+                break
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
+
+    def _prefetch(self, sizes, limit, workers):
+        urls = (
+            Card.objects.exclude(image_url__isnull=True).exclude(image_url='')
+            .order_by('-id').values_list('image_url', flat=True)
+        )
+        if limit:
+            urls = urls[:limit]
+        pending = [
+            (url, size) for url in dict.fromkeys(urls) if images.is_allowed(url)
+            for size in sizes if not images.is_cached(url, size)
+        ]
+
+        started = time.monotonic()
+        failed = 0
+
+        def warm(item):
+            try:
+                images.cached_image_path(*item)
+                return True
+            except images.ImageUnavailable:
+                return False
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for ok in executor.map(warm, pending):
+                failed += not ok
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Cached {len(pending) - failed} images ({failed} failed) in {elapsed:.1f}s.'
+        ))
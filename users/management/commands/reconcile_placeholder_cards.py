@@ -0,0 +1,177 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from users import cardindex
+from users.models import Card, Notification, UserCard
+
+PLACEHOLDER = (Q(set_code='') | Q(set_code__isnull=True)) & (Q(scryfall_id='') | Q(scryfall_id__isnull=True))
+# Nombres por consulta de busqueda (SQLite admite 999 parametros).
+LOOKUP_BATCH_SIZE = 400
+
+
+class Command(BaseCommand):
+    help = (
+        'Merge placeholder cards (no set code and no Scryfall ID) into a resolved printing with the same '
+        'normalized name, or into a single placeholder when there is none. UserCard and Notification rows '
+        'are repointed with set-based UPDATEs and the merged placeholders are deleted. Each chunk of names '
+        'is committed on its own, so the command can be stopped and run again at any time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200, help='Card names merged per transaction.')
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to sleep between chunks so other writers can take the lock.')
+        parser.add_argument('--max-retries', type=int, default=5, help='Retries per chunk when SQLite reports the database as locked.')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be merged without writing anything.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+
+        groups = {}
+        for card_id, name in Card.objects.filter(PLACEHOLDER).order_by('id').values_list('id', 'name').iterator():
+            key = cardindex.normalize_name(name)
+            if key:
+                groups.setdefault(key, []).append((card_id, name))
+        keys = sorted(groups)
+        self.stdout.write(f'{sum(len(members) for members in groups.values())} placeholder cards under {len(keys)} names.')
+
+        totals = {'names': 0, 'merged': 0, 'user_cards': 0, 'notifications': 0}
+        started = time.monotonic()
+        for start in range(0, len(keys), options['chunk_size']):
+            chunk = {key: groups[key] for key in keys[start:start + options['chunk_size']]}
+            counts = self._process_chunk(chunk, options)
+            totals['names'] += len(chunk)
+            for name, value in counts.items():
+                totals[name] += value
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"{totals['names']}/{len(keys)} names, {totals['merged']} placeholders merged, "
+                f"{totals['user_cards']} user cards repointed ({totals['names'] / elapsed if elapsed else 0:.0f} names/s)"
+            )
+            if options['pause'] and not options['dry_run']:
+                time.sleep(options['pause'])
+
+        elapsed = time.monotonic() - started
+        verb = 'would be merged' if options['dry_run'] else 'merged'
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {totals['merged']} placeholders {verb}, {totals['user_cards']} user cards and "
+            f"{totals['notifications']} notifications repointed in {elapsed:.2f}s."
+        ))
+        if totals['merged'] and not options['dry_run'] and cardindex.get_index() is not None:
+            self.stdout.write('Run build_card_index to drop the merged cards from the card name index.')
+
+    def _targets(self, chunk):
+        """Clave normalizada -> id de la impresion resuelta (con Scryfall ID) mas antigua."""
+        names = {name for members in chunk.values() for _, name in members}
+        candidate_ids = set()
+        index = cardindex.get_index()
+        if index is not None:
+            # El indice encuentra tambien las variantes de mayusculas y puntuacion del nombre.
+            for members in chunk.values():
+                candidate_ids.update(match.card_id for match in index.lookup(members[0][1]) if match.scryfall_id)
+
+        names, candidate_ids = sorted(names), sorted(candidate_ids)
+        targets = {}
+        for start in range(0, max(len(names), len(candidate_ids)), LOOKUP_BATCH_SIZE):
+            query = (
+                Q(name__in=names[start:start + LOOKUP_BATCH_SIZE])
+                | Q(pk__in=candidate_ids[start:start + LOOKUP_BATCH_SIZE])
+            )
+            rows = (
+                Card.objects.filter(query)
+                .exclude(scryfall_id__isnull=True)
+                .exclude(scryfall_id='')
+                .values_list('id', 'name')
+            )
+            for card_id, name in rows:
+                key = cardindex.normalize_name(name)
+                if key in chunk and card_id < targets.get(key, card_id + 1):
+                    targets[key] = card_id
+        return targets
+
+    def _merges(self, chunk):
+        """{id destino: [ids de los marcadores que se funden en el]} del trozo."""
+        targets = self._targets(chunk)
+        merges = {}
+        for key, members in chunk.items():
+            ids = [card_id for card_id, _ in members]
+            # Sin impresion resuelta, el marcador mas antiguo se queda con los demas.
+            target = targets.get(key, ids[0])
+            sources = [card_id for card_id in ids if card_id != target]
+            if sources:
+                merges[target] = sources
+        return merges
+
+    def _process_chunk(self, chunk, options):
+        for attempt in range(options['max_retries'] + 1):
+            try:
+                with transaction.atomic():
+                    return self._merge(chunk, options['dry_run'])
+            except OperationalError as exc:
+                if 'locked' not in str(exc) or attempt == options['max_retries']:
+                    raise
+                wait = 0.1 * 2 ** attempt
+                self.stderr.write(f'Database locked, retrying chunk in {wait:.1f}s.')
+                time.sleep(wait)
+
+    def _merge(self, chunk, dry_run):
+        merges = self._merges(chunk)
+        sources = [card_id for card_ids in merges.values() for card_id in card_ids]
+        counts = {'merged': len(sources), 'user_cards': 0, 'notifications': 0}
+        if not sources:
+            return counts
+        if dry_run:
+            counts['user_cards'] = UserCard.objects.filter(card_id__in=sources).count()
+            counts['notifications'] = Notification.objects.filter(card_id__in=sources).count()
+            return counts
+
+        counts['user_cards'] = self._merge_user_cards(merges, sources)
+        target_for = Case(*[When(card_id__in=card_ids, then=Value(target)) for target, card_ids in merges.items()])
+        # `updated_at` cambia para que las listas cacheadas vuelvan a pintar la fila con la carta nueva.
+        UserCard.objects.filter(card_id__in=sources).update(card_id=target_for, updated_at=timezone.now())
+        counts['notifications'] = Notification.objects.filter(card_id__in=sources).update(card_id=target_for)
+        # Solo los que se han quedado sin filas: una importacion concurrente espera al commit.
+        Card.objects.filter(pk__in=sources, usercard__isnull=True).delete()
+        return counts
+
+    def _merge_user_cards(self, merges, sources):
+        """
+        Suma las filas que chocarian al repuntarlas (mismo usuario, lista y carta destino) en
+        la fila mas antigua, como las importaciones de listas, y borra el resto. Las filas que
+        ya estaban en el destino no se juntan entre si. Devuelve las filas movidas o sumadas.
+        """
+        target_of = {source: target for target, card_ids in merges.items() for source in card_ids}
+        fields = ('id', 'user_id', 'is_owned', 'card_id', 'quantity_owned', 'quantity_required')
+        moved = list(UserCard.objects.filter(card_id__in=sources).order_by('id').values_list(*fields))
+        if not moved:
+            return 0
+        existing = (
+            UserCard.objects.filter(card_id__in=list(merges), user_id__in={row[1] for row in moved})
+            .order_by('-id').values_list('user_id', 'is_owned', 'card_id', 'id')
+        )
+        survivors = {(user_id, is_owned, card_id): user_card_id for user_id, is_owned, card_id, user_card_id in existing}
+
+        added = {}
+        obsolete_ids = []
+        for user_card_id, user_id, is_owned, card_id, quantity_owned, quantity_required in moved:
+            key = (user_id, is_owned, target_of[card_id])
+            survivor = survivors.setdefault(key, user_card_id)
+            if survivor != user_card_id:
+                totals = added.setdefault(survivor, [0, 0])
+                totals[0] += quantity_owned
+                totals[1] += quantity_required
+                obsolete_ids.append(user_card_id)
+
+        UserCard.objects.filter(pk__in=obsolete_ids).delete()
+        for survivor, (quantity_owned, quantity_required) in added.items():
+            UserCard.objects.filter(pk=survivor).update(
+                quantity_owned=F('quantity_owned') + quantity_owned,
+                quantity_required=F('quantity_required') + quantity_required,
+                updated_at=timezone.now(),
+            )
+        return len(moved)
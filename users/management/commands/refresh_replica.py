@@ -0,0 +1,44 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from my_django_project.db_router import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the read replica with the SQLite online backup API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Keep refreshing every N seconds instead of running once.')
+        parser.add_argument('--pages', type=int, default=-1, help='Pages copied per backup step (-1 copies everything in one step).')
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError('No replica configured. Set DJANGO_DB_REPLICA to the replica file first.')
+
+        primary = settings.DATABASES['default']
+        replica = settings.DATABASES[REPLICA_ALIAS]
+        if 'sqlite3' not in primary['ENGINE'] or 'sqlite3' not in replica['ENGINE']:
+            raise CommandError('refresh_replica only supports SQLite databases.')
+
+        while True:
+            started = time.monotonic()
+            self._backup(str(primary['NAME']), str(replica['NAME']), options['pages'])
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(f'Replica refreshed in {elapsed * 1000:.0f} ms.'))
+            if not options['interval']:
+                break
+            time.sleep(max(0, options['interval'] - elapsed))
+
+    def _backup(self, primary_path, replica_path, pages):
+        # Backing up into the live replica file keeps open reader connections valid:
+        # they simply see the new snapshot once the copy commits.
+        source = sqlite3.connect(primary_path)
+        target = sqlite3.connect(replica_path, timeout=30)
+        try:
+            source.backup(target, pages=pages)
+        finally:
+            target.close()
+            source.close()
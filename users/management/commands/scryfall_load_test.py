@@ -0,0 +1,164 @@
+import asyncio
+import csv
+import io
+import json
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+
+from users import views
+from users.dataset import SET_CODES, card_name
+from users.scryfall_stub import start_stub_in_thread
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a Moxfield CSV import through the Scryfall enrichment path while concurrent clients '
+        'hit the type-ahead search, against the local Scryfall stub.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=3000, help='Rows in the generated CSV.')
+        parser.add_argument('--distinct-names', type=int, default=2000,
+                            help='Distinct card names in the CSV (repeats are served from the cache).')
+        parser.add_argument('--lookup-interval', type=float, default=0.0,
+                            help='SCRYFALL_BULK_LOOKUP_INTERVAL_SECONDS during the run.')
+        parser.add_argument('--upstream-rate', type=float, default=1000,
+                            help='SCRYFALL_UPSTREAM_RATE during the run (the stub has no real budget).')
+        parser.add_argument('--typeahead-clients', type=int, default=8)
+        parser.add_argument('--typeahead-interval', type=float, default=0.4,
+                            help='Seconds between keystrokes of one type-ahead client.')
+        parser.add_argument('--start-stub', action='store_true', help='Start an in-process stub instead of using SCRYFALL_API_BASE.')
+        parser.add_argument('--stub-latency-ms', type=float, default=50)
+        parser.add_argument('--stub-error-rate', type=float, default=0.0)
+        parser.add_argument('--stub-rate-limit-rate', type=float, default=0.0)
+        parser.add_argument('--output', help='Write the report as JSON to this file.')
+
+    def handle(self, *args, **options):
+        server = None
+        base_url = settings.SCRYFALL_API_BASE
+        if options['start_stub']:
+            server, base_url = start_stub_in_thread(
+                latency_ms=options['stub_latency_ms'],
+                error_rate=options['stub_error_rate'],
+                rate_limit_rate=options['stub_rate_limit_rate'],
+                seed=1,
+            )
+        elif 'api.scryfall.com' in base_url:
+            raise CommandError('Refusing to load-test the live Scryfall API: pass --start-stub or point SCRYFALL_API_BASE at the stub.')
+
+        self.stdout.write(f'Target: {base_url}')
+        cache.clear()
+        try:
+            with override_settings(
+                SCRYFALL_API_BASE=base_url,
+                SCRYFALL_BULK_LOOKUP_INTERVAL_SECONDS=options['lookup_interval'],
+                SCRYFALL_UPSTREAM_RATE=options['upstream_rate'],
+                SCRYFALL_UPSTREAM_BURST=max(1, options['upstream_rate']),
+            ):
+                report = self._run(options)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+        if server is not None:
+            report['stub'] = dict(server.stub_config.stats)
+
+        self._print(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
+
+    def _build_csv(self, rows, distinct_names):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['Count', 'Name', 'Edition'])
+        rng = random.Random(7)
+        for _ in range(rows):
+            index = rng.randrange(max(1, distinct_names))
+            writer.writerow([rng.randint(1, 4), card_name(index), SET_CODES[index % len(SET_CODES)].lower()])
+        return io.BytesIO(buffer.getvalue().encode('utf-8'))
+
+    def _run(self, options):
+        stop = threading.Event()
+        lock = threading.Lock()
+        typeahead = {'latencies': [], 'statuses': Counter()}
+        factory = RequestFactory()
+
+        async def typeahead_client(client_id):
+            # La vista es asincrona: cada cliente tiene su bucle de eventos, como un worker ASGI,
+            # y reutiliza sus conexiones a Scryfall entre teclas.
+            rng = random.Random(client_id)
+            user = SimpleNamespace(is_authenticated=True, pk=f'loadtest-{client_id}')
+
+            async def auser():
+                return user
+
+            while not stop.is_set():
+                name = card_name(rng.randrange(options['distinct_names']))
+                query = name[:rng.randint(3, len(name))]
+                request = factory.get('/users/scryfall/search/', {'q': query})
+                request.user, request.auser = user, auser
+                started = time.perf_counter()
+                response = await views.scryfall_card_search(request)
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    typeahead['latencies'].append(elapsed)
+                    typeahead['statuses'][response.status_code] += 1
+                await asyncio.sleep(options['typeahead_interval'])
+
+        def run_client(client_id):
+            asyncio.run(typeahead_client(client_id))
+
+        threads = [threading.Thread(target=run_client, args=(i,), daemon=True)
+                   for i in range(options['typeahead_clients'])]
+        for thread in threads:
+            thread.start()
+
+        started = time.perf_counter()
+        parsed_rows = views._parse_moxfield_csv(self._build_csv(options['rows'], options['distinct_names']))
+        enriched_rows, errors = views._bulk_lookup_scryfall_cards(parsed_rows)
+        import_elapsed = time.perf_counter() - started
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        latencies = sorted(typeahead['latencies'])
+        return {
+            'import': {
+                'rows': len(parsed_rows),
+                'seconds': round(import_elapsed, 3),
+                'rows_per_second': round(len(parsed_rows) / import_elapsed, 1) if import_elapsed else None,
+                'matched': sum(1 for row in enriched_rows if row['match_status'] == 'matched'),
+                'errors': len(errors),
+            },
+            'typeahead': {
+                'requests': len(latencies),
+                'p50_ms': round(statistics.median(latencies), 2) if latencies else None,
+                'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 2) if len(latencies) >= 20 else None,
+                'statuses': {str(code): count for code, count in typeahead['statuses'].items()},
+            },
+        }
+
+    def _print(self, report):
+        imported = report['import']
+        self.stdout.write(
+            f"Import: {imported['rows']} rows in {imported['seconds']}s "
+            f"({imported['rows_per_second']} rows/s), {imported['matched']} matched, {imported['errors']} errors"
+        )
+        typeahead = report['typeahead']
+        self.stdout.write(
+            f"Type-ahead: {typeahead['requests']} requests, p50 {typeahead['p50_ms']} ms, "
+            f"p95 {typeahead['p95_ms']} ms, statuses {typeahead['statuses']}"
+        )
+        if 'stub' in report:
+            self.stdout.write(f"Stub: {report['stub']}")
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.scryfall_stub import make_stub_server
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve a local stand-in for the Scryfall API (/cards/search, /cards/collection, /sets). '
+        'Run the app with SCRYFALL_API_BASE=http://127.0.0.1:<port> to use it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=50, help='Mean added latency per response.')
+        parser.add_argument('--jitter-ms', type=float, default=20, help='Uniform +/- jitter around the latency.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503.')
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of requests answered with 429.')
+        parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429 responses.')
+        parser.add_argument('--recordings', help='Directory of recorded responses served before synthesized ones.')
+        parser.add_argument('--record-from', metavar='URL',
+                            help='Fetch responses missing from --recordings from this API (e.g. https://api.scryfall.com) and save them.')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['record_from'] and not options['recordings']:
+            raise CommandError('--record-from needs --recordings to know where to save responses.')
+        server = make_stub_server(
+            options['host'],
+            options['port'],
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            retry_after=options['retry_after'],
+            recordings_dir=options['recordings'],
+            record_from=options['record_from'],
+            seed=options['seed'],
+        )
+        host, port = server.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(f'Scryfall stub listening on http://{host}:{port}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Stub stats: {server.stub_config.stats}')
@@ -0,0 +1,322 @@
+"""
+Metricas en formato de exposicion de Prometheus.
+
+Cada proceso (cada worker de gunicorn) acumula sus contadores e histogramas en
+memoria y los vuelca cada `METRICS_FLUSH_SECONDS` a su propio fichero JSON dentro de
+`METRICS_DIR`. El endpoint `/metrics/` suma los ficheros de todos los procesos, asi
+que no hay escrituras concurrentes sobre el mismo fichero. Antes de sumar, los ficheros
+de procesos que ya no existen se acumulan en `metrics-retired.json` y se borran: los
+contadores de workers reciclados siguen contando sin que el directorio crezca. Solo
+vuelcan los procesos que han servido peticiones; los comandos de `manage.py` no dejan
+ficheros.
+"""
+
+import atexit
+import glob
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+try:
+    import fcntl
+except ImportError:  # Sin flock (Windows) no se acumulan los ficheros de procesos terminados.
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+METRICS = {
+    'maki_http_requests_total': ('counter', 'HTTP requests by view, method and status code.', None),
+    'maki_view_latency_seconds': ('histogram', 'View latency in seconds, middleware to response.', LATENCY_BUCKETS),
+    'maki_view_db_queries': ('histogram', 'Database queries executed per request.', QUERY_COUNT_BUCKETS),
+    'maki_scryfall_request_seconds': ('histogram', 'Scryfall upstream request latency in seconds.', LATENCY_BUCKETS),
+    'maki_scryfall_responses_total': ('counter', 'Scryfall upstream responses by endpoint and status.', None),
+    'maki_scryfall_circuit_opened_total': ('counter', 'Times the Scryfall circuit breaker opened, by host.', None),
+    'maki_scryfall_circuit_rejected_total': ('counter', 'Scryfall requests failed fast by an open circuit, by host.', None),
+    'maki_rate_limited_total': ('counter', 'Requests rejected by a rate-limit token bucket, by bucket.', None),
+    'maki_scryfall_cache_total': ('counter', 'Scryfall cache lookups by cache and result (hit/stale/miss).', None),
+    'maki_import_rows_total': ('counter', 'Card import rows processed by source and result.', None),
+    'maki_trade_price_cache_total': ('counter', 'Card price cache lookups for trade valuation by result (hit/miss).', None),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+RETIRED_FILE = 'metrics-retired.json'
+PROCESS_FILE = re.compile(r'metrics-(\d+)-[0-9a-f]+\.json')
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._path = None
+        # Lo activa el middleware: solo los procesos que sirven peticiones escriben fichero.
+        self.serving = False
+        self._counters = {}
+        self._histograms = {}
+        self._last_flush = time.monotonic()
+
+    def _check_fork(self):
+        # Tras un fork (gunicorn --preload) el hijo no hereda los valores del padre.
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            histogram['buckets'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= settings.METRICS_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._check_fork()
+            if not self._counters and not self._histograms:
+                return
+            snapshot = {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), data] for (name, labels), data in self._histograms.items()],
+            }
+            self._last_flush = time.monotonic()
+            if self._path is None:
+                self._path = Path(settings.METRICS_DIR) / f'metrics-{self._pid}-{uuid.uuid4().hex[:8]}.json'
+            path = self._path
+        _write(path, snapshot)
+
+
+def _write(path, snapshot):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix('.tmp')
+    with open(temporary, 'w', encoding='utf-8') as handle:
+        json.dump(snapshot, handle)
+    os.replace(temporary, path)
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+registry = MetricsRegistry()
+inc = registry.inc
+observe = registry.observe
+
+
+@atexit.register
+def _flush_on_exit():
+    if not registry.serving:
+        return
+    try:
+        registry.flush()
+    except Exception:
+        pass
+
+
+def _add(counters, histograms, snapshot):
+    for name, labels, value in snapshot.get('counters', []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, data in snapshot.get('histograms', []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        merged = histograms.setdefault(key, {'buckets': [0] * len(data['buckets']), 'sum': 0.0, 'count': 0})
+        merged['buckets'] = [a + b for a, b in zip(merged['buckets'], data['buckets'])]
+        merged['sum'] += data['sum']
+        merged['count'] += data['count']
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def retire_dead_files():
+    """
+    Suma los ficheros de procesos terminados en `RETIRED_FILE` y los borra. `merged` guarda
+    los que ya se sumaron hasta borrarlos, asi que cortar a medias no cuenta nada dos veces.
+    """
+    directory = Path(settings.METRICS_DIR)
+    dead = [
+        path for path in directory.glob('metrics-*.json')
+        if (match := PROCESS_FILE.fullmatch(path.name)) and not _alive(int(match.group(1)))
+    ]
+    if fcntl is None or not dead:
+        return
+    with open(directory / 'metrics.lock', 'w') as lock:
+        # Dos scrapes a la vez no deben sumar el mismo fichero.
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        retired_path = directory / RETIRED_FILE
+        retired = _read(retired_path) or {}
+        merged = set(retired.get('merged', []))
+        counters, histograms = {}, {}
+        _add(counters, histograms, retired)
+        for path in dead:
+            snapshot = None if path.name in merged else _read(path)
+            if snapshot is not None:
+                _add(counters, histograms, snapshot)
+                merged.add(path.name)
+        retired = {
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(labels), data] for (name, labels), data in histograms.items()],
+            'merged': sorted(merged),
+        }
+        _write(retired_path, retired)
+        for name in merged:
+            (directory / name).unlink(missing_ok=True)
+        retired['merged'] = []
+        _write(retired_path, retired)
+
+
+def collect():
+    """Suma los volcados de todos los procesos."""
+    counters = {}
+    histograms = {}
+    for filename in glob.glob(os.path.join(settings.METRICS_DIR, 'metrics-*.json')):
+        snapshot = _read(filename)
+        if snapshot is not None:
+            _add(counters, histograms, snapshot)
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_bound(bound):
+    return repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+
+def render_exposition():
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+            continue
+        for (metric, labels), data in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], data['buckets']):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_bound(bound)
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", le)])} {cumulative}')
+            lines.append(f"{name}_sum{_format_labels(labels)} {data['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {data['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if token:
+        if request.META.get('HTTP_AUTHORIZATION') != f'Bearer {token}':
+            return HttpResponseForbidden()
+    elif request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    registry.serving = True
+    registry.flush()
+    retire_dead_files()
+    return HttpResponse(render_exposition(), content_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            counter.watch(stack)
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, counter.count)
+        return response
+
+    async def __acall__(self, request):
+        # Bajo ASGI el ORM corre en el hilo sincrono de la peticion (sync_to_async), que
+        # tiene sus propias conexiones: los contadores se instalan y se quitan alli.
+        counter = QueryCounter()
+        stack = ExitStack()
+        started = time.perf_counter()
+        await sync_to_async(counter.watch)(stack)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self._record(request, response, time.perf_counter() - started, counter.count)
+        return response
+
+    def _record(self, request, response, elapsed, query_count):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unresolved'
+        inc('maki_http_requests_total', view=view, method=request.method, status=str(response.status_code))
+        observe('maki_view_latency_seconds', elapsed, view=view)
+        observe('maki_view_db_queries', query_count, view=view)
+        registry.serving = True
+        registry.maybe_flush()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def watch(self, stack):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
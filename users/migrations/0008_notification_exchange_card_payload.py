@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+EXCHANGE_ID_PATTERN = re.compile(r'\(ID de intercambio: (\d+)\)')
+
+
+def backfill_structured_fields(apps, schema_editor):
+    Notification = apps.get_model('users', 'Notification')
+    Exchange = apps.get_model('users', 'Exchange')
+    Card = apps.get_model('users', 'Card')
+
+    for notification in Notification.objects.filter(type__in=['action', 'exchange']).iterator():
+        parts = notification.message.split("'")
+        if len(parts) < 2:
+            continue
+        notification.payload = {'card_name': parts[1]}
+        if notification.type == 'exchange' and len(parts) >= 4:
+            notification.payload['offered_cards'] = [name for name in parts[3].split(', ') if name]
+
+        match = EXCHANGE_ID_PATTERN.search(notification.message)
+        if match:
+            notification.exchange = Exchange.objects.filter(pk=int(match.group(1))).first()
+        elif notification.type == 'exchange':
+            # "X ofrece 'A' por 'B'." no lleva el id: es la respuesta al intercambio pendiente
+            # que abrio quien la recibe, mejor el que pide esa misma carta.
+            pending = Exchange.objects.filter(
+                sender_id=notification.receiver_id, receiver_id=notification.sender_id, status='pending',
+            ).order_by('-id')
+            notification.exchange = pending.filter(receiver_cards=parts[1]).first() or pending.first()
+        notification.card = Card.objects.filter(name=parts[1]).order_by('id').first()
+        notification.save(update_fields=['payload', 'exchange', 'card'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_notificationarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='card',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='users.card'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='exchange',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='users.exchange'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='payload',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(backfill_structured_fields, migrations.RunPython.noop),
+    ]
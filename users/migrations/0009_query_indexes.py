@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:09
+
+from django.db import migrations, models
+
+CARD_NAME_CI_INDEX = 'users_card_name_ci_idx'
+
+# card__name__iexact compiles to `name LIKE %s` on SQLite, which only uses an index built
+# with the NOCASE collation, and to `UPPER(name) = UPPER(%s)` on PostgreSQL.
+CARD_NAME_CI_INDEX_SQL = {
+    'sqlite': f'CREATE INDEX IF NOT EXISTS {CARD_NAME_CI_INDEX} ON users_card (name COLLATE NOCASE)',
+    'postgresql': f'CREATE INDEX IF NOT EXISTS {CARD_NAME_CI_INDEX} ON users_card (UPPER(name))',
+}
+
+
+def create_card_name_ci_index(apps, schema_editor):
+    sql = CARD_NAME_CI_INDEX_SQL.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def drop_card_name_ci_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CARD_NAME_CI_INDEX_SQL:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {CARD_NAME_CI_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_notification_exchange_card_payload'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['name', 'set_code'], name='users_card_name_set_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['-price', 'name'], name='users_card_price_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchange',
+            index=models.Index(fields=['status'], name='users_exch_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchange',
+            index=models.Index(fields=['receiver', 'status'], name='users_exch_recv_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('type', 'resolved'), _negated=True), fields=['receiver', '-created_at'], name='users_notif_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercard',
+            index=models.Index(fields=['user', 'is_owned'], name='users_uc_user_owned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercard',
+            index=models.Index(fields=['card', 'is_owned'], name='users_uc_card_owned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercard',
+            index=models.Index(fields=['user', 'card'], name='users_uc_user_card_idx'),
+        ),
+        migrations.RunPython(create_card_name_ci_index, drop_card_name_ci_index),
+    ]
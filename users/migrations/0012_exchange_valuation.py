@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_card_exchange_notification_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exchange',
+            name='fairness_score',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=4, null=True),
+        ),
+        migrations.AddField(
+            model_name='exchange',
+            name='receiver_value',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='exchange',
+            name='sender_value',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='exchange',
+            name='valuation',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
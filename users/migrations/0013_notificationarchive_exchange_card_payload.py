@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_exchange_valuation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationarchive',
+            name='card_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationarchive',
+            name='exchange_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationarchive',
+            name='payload',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
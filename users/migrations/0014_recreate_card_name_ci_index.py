@@ -0,0 +1,23 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# SQLite rebuilds users_card when 0011 adds updated_at, and the rebuild only keeps the
+# indexes Django knows about: the raw NOCASE index from 0009 is lost. Any later migration
+# that rebuilds the table must recreate it the same way.
+index_migration = import_module('users.migrations.0009_query_indexes')
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_notificationarchive_exchange_card_payload'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_migration.create_card_name_ci_index, noop),
+    ]
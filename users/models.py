@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 
 class CustomUser(AbstractUser):
@@ -39,6 +40,25 @@ class CustomUser(AbstractUser):
         null=True,
     )
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._invalidate_cached_user()
+
+    def delete(self, *args, **kwargs):
+        user_id = self.pk
+        result = super().delete(*args, **kwargs)
+        self._invalidate_cached_user(user_id)
+        return result
+
+    def _invalidate_cached_user(self, user_id=None):
+        # Import local: users.auth importa el backend de auth, que necesita las apps cargadas.
+        from .auth import invalidate_user
+
+        user_id = user_id or self.pk
+        invalidate_user(user_id)
+        # Otra peticion podria volver a cachear la fila vieja antes del commit.
+        transaction.on_commit(lambda: invalidate_user(user_id))
+
 
 class Card(models.Model):
     name = models.CharField(max_length=150)
@@ -53,6 +73,37 @@ class Card(models.Model):
     usd_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     usd_foil_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     eur_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Campos que muestran las filas cacheadas de las listas (nombre y valores en cada moneda).
+    LISTED_FIELDS = ('name', 'price', 'usd_price', 'usd_foil_price', 'eur_price')
+
+    class Meta:
+        # El indice sin distincion de mayusculas sobre `name` (card__name__iexact) depende
+        # del motor y se crea en la migracion 0009.
+        indexes = [
+            models.Index(fields=['name', 'set_code'], name='users_card_name_set_idx'),
+            models.Index(fields=['-price', 'name'], name='users_card_price_name_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            return
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(self.LISTED_FIELDS) & set(update_fields):
+            # Las listas de cartas cachean cada fila con la version (`updated_at`) del UserCard.
+            UserCard.objects.filter(card=self).update(updated_at=timezone.now())
+        self._invalidate_cached_prices()
+
+    def _invalidate_cached_prices(self):
+        # Import local: users.valuation importa este modulo.
+        from .valuation import invalidate_card_prices
+
+        card_id = self.pk
+        invalidate_card_prices(card_id)
+        transaction.on_commit(lambda: invalidate_card_prices(card_id))
 
     def __str__(self):
         if self.set_name:
@@ -82,6 +133,14 @@ class UserCard(models.Model):
     listing_intent = models.CharField(max_length=16, choices=LISTING_INTENT_CHOICES, default='trade')
     condition = models.CharField(max_length=24, choices=CONDITION_CHOICES, default='near_mint')
     asking_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_owned'], name='users_uc_user_owned_idx'),
+            models.Index(fields=['card', 'is_owned'], name='users_uc_card_owned_idx'),
+            models.Index(fields=['user', 'card'], name='users_uc_user_card_idx'),
+        ]
 
     def total_price(self):
         return self.card.price * self.quantity_owned if self.is_owned else 0
@@ -103,11 +162,48 @@ class Notification(models.Model):
         ('error', 'Error'),
     ]
     type = models.CharField(max_length=10, choices=TYPE_CHOICES, default='info')
+    exchange = models.ForeignKey('Exchange', on_delete=models.SET_NULL, blank=True, null=True, related_name='notifications')
+    card = models.ForeignKey(Card, on_delete=models.SET_NULL, blank=True, null=True, related_name='notifications')
+    payload = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Bandeja de entrada: solo las no resueltas, ya ordenadas por fecha.
+            models.Index(
+                fields=['receiver', '-created_at'],
+                condition=~models.Q(type='resolved'),
+                name='users_notif_inbox_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Notificacion de {self.sender.username} para {self.receiver.username}: {self.message}"
 
 
+class NotificationArchive(models.Model):
+    """Copia compacta de una notificacion resuelta que ya salio de la bandeja."""
+
+    notification_id = models.BigIntegerField(unique=True)
+    sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='archived_sent_notifications')
+    receiver = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='archived_received_notifications')
+    message = models.TextField()
+    # Ids sueltos como `notification_id`: el intercambio o la carta pueden borrarse despues.
+    exchange_id = models.BigIntegerField(blank=True, null=True)
+    card_id = models.BigIntegerField(blank=True, null=True)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['receiver', '-created_at'], name='users_notarc_recv_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notificacion archivada de {self.sender.username} para {self.receiver.username}: {self.message}"
+
+
 class Exchange(models.Model):
     sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='sent_exchanges')
     receiver = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='received_exchanges')
@@ -125,6 +221,18 @@ class Exchange(models.Model):
         ('trade', 'Cambio'),
     ]
     exchange_type = models.CharField(max_length=10, choices=EXCHANGE_TYPE_CHOICES, default='trade')
+    # Valoracion en USD de cada lado al hacer la oferta (users/valuation.py).
+    sender_value = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    receiver_value = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    fairness_score = models.DecimalField(max_digits=4, decimal_places=3, blank=True, null=True)
+    valuation = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status'], name='users_exch_status_idx'),
+            models.Index(fields=['receiver', 'status'], name='users_exch_recv_status_idx'),
+        ]
 
     def __str__(self):
         return f"Intercambio entre {self.sender.username} y {self.receiver.username} el {self.date}"
@@ -0,0 +1,60 @@
+"""
+Paginacion de la API JSON y del admin.
+
+Va aparte de `users/api.py` porque DRF importa la clase de la API desde los settings.
+"""
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+from rest_framework import pagination
+
+
+class CursorPagination(pagination.CursorPagination):
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Filas aproximadas de la tabla de `model` sin recorrerla: las estadisticas del
+    planificador en PostgreSQL, las de `ANALYZE` en SQLite y, si no hay, el id mas alto.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return row[0]
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+    return model._default_manager.using(using).aggregate(highest=Max('pk'))['highest'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginador del admin que no hace `COUNT(*)` sobre tablas enteras. Sin filtros usa
+    `estimated_row_count` si la tabla pasa de `exact_limit` filas; con filtros o busqueda
+    cuenta como mucho `exact_limit` + 1 filas, y las paginas siguientes se recorren con el
+    cursor de `users.admin.CursorChangeList`.
+    """
+
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate > self.exact_limit:
+                return estimate
+        return queryset[:self.exact_limit + 1].count()
@@ -0,0 +1,211 @@
+"""
+Perfilado bajo demanda de peticiones.
+
+`RequestProfilingMiddleware` envuelve la vista en cProfile cuando un usuario staff
+envia la cabecera `X-Profile: 1` o el parametro `?__profile__=1`, o cuando la
+peticion cae en la muestra `PROFILING_SAMPLE_RATE`. El tiempo se reparte entre SQL,
+render de plantillas y llamadas HTTP a Scryfall, y se guardan el `.prof` y un
+resumen `.json` en `PROFILING_OUTPUT_DIR`.
+
+Las peticiones no perfiladas solo pagan la lectura de una cabecera y, si hay
+muestreo, un `random.random()`.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import random
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+from django.utils import timezone
+
+_active_profile = ContextVar('active_profile', default=None)
+
+TEMPLATE_RENDER_CODE = Template.render.__code__
+
+
+class RequestTimings:
+    def __init__(self):
+        self.totals = {'sql': 0.0, 'sql_in_template': 0.0, 'scryfall': 0.0}
+        self.counts = {'sql': 0, 'scryfall': 0}
+
+    def add(self, category, seconds):
+        self.totals[category] = self.totals.get(category, 0.0) + seconds
+        self.counts[category] = self.counts.get(category, 0) + 1
+
+
+@contextmanager
+def track(category):
+    """Suma el tiempo del bloque a `category` si la peticion actual se esta perfilando."""
+    timings = _active_profile.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(category, time.perf_counter() - started)
+
+
+def _inside_template_render():
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code is TEMPLATE_RENDER_CODE:
+            return True
+        frame = frame.f_back
+    return False
+
+
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.output_dir = Path(settings.PROFILING_OUTPUT_DIR)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._should_profile(request):
+            return self.get_response(request)
+        return self._profile(request)
+
+    async def __acall__(self, request):
+        if self._requested(request):
+            user = await request.auser()
+            profile = user.is_staff
+        else:
+            profile = self._sampled()
+        if not profile:
+            return await self.get_response(request)
+        return await self._aprofile(request)
+
+    def _requested(self, request):
+        return request.META.get('HTTP_X_PROFILE') == '1' or request.GET.get('__profile__') == '1'
+
+    def _sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _should_profile(self, request):
+        if self._requested(request):
+            user = getattr(request, 'user', None)
+            return bool(user and user.is_staff)
+        return self._sampled()
+
+    def _time_queries(self, stack, timings):
+        def time_sql(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                elapsed = time.perf_counter() - started
+                timings.add('sql', elapsed)
+                if _inside_template_render():
+                    timings.totals['sql_in_template'] += elapsed
+
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(time_sql))
+
+    def _profile(self, request):
+        timings = RequestTimings()
+        token = _active_profile.set(timings)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                self._time_queries(stack, timings)
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+        finally:
+            _active_profile.reset(token)
+        return self._finish(request, response, profiler, timings, time.perf_counter() - started)
+
+    async def _aprofile(self, request):
+        timings = RequestTimings()
+        token = _active_profile.set(timings)
+        profiler = cProfile.Profile()
+        stack = ExitStack()
+        started = time.perf_counter()
+        try:
+            # El SQL corre en el hilo sincrono de la peticion; cProfile sigue al hilo del bucle
+            # de eventos, asi que tambien recoge lo que hagan a la vez otras peticiones.
+            await sync_to_async(self._time_queries)(stack, timings)
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+                await sync_to_async(stack.close)()
+        finally:
+            _active_profile.reset(token)
+        total = time.perf_counter() - started
+        return await sync_to_async(self._finish)(request, response, profiler, timings, total)
+
+    def _finish(self, request, response, profiler, timings, total):
+        profile_id = self._write(request, response, profiler, timings, total)
+        if getattr(request, 'user', None) is not None and request.user.is_staff:
+            response['X-Profile-Id'] = profile_id
+        return response
+
+    def _template_seconds(self, stats):
+        for (filename, lineno, _), (_, _, _, cumulative, _) in stats.stats.items():
+            if filename == TEMPLATE_RENDER_CODE.co_filename and lineno == TEMPLATE_RENDER_CODE.co_firstlineno:
+                return cumulative
+        return 0.0
+
+    def _write(self, request, response, profiler, timings, total):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        match = getattr(request, 'resolver_match', None)
+        view_name = (match.url_name or match.view_name) if match else 'unresolved'
+        profile_id = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{view_name}-{os.getpid()}"
+
+        stats = pstats.Stats(profiler)
+        template_total = self._template_seconds(stats)
+        template_only = max(0.0, template_total - timings.totals['sql_in_template'])
+        sql = timings.totals['sql']
+        scryfall = timings.totals['scryfall']
+        top_functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:20]
+
+        summary = {
+            'id': profile_id,
+            'path': request.get_full_path(),
+            'method': request.method,
+            'view': view_name,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'sql_ms': round(sql * 1000, 2),
+            'sql_queries': timings.counts['sql'],
+            'template_ms': round(template_only * 1000, 2),
+            'scryfall_ms': round(scryfall * 1000, 2),
+            'scryfall_calls': timings.counts['scryfall'],
+            'python_ms': round(max(0.0, total - sql - template_only - scryfall) * 1000, 2),
+            'top_cumulative': [
+                {
+                    'function': f'{filename}:{lineno}({name})',
+                    'calls': calls,
+                    'cumulative_ms': round(cumulative * 1000, 2),
+                }
+                for (filename, lineno, name), (_, calls, _, cumulative, _) in top_functions
+            ],
+        }
+        stats.dump_stats(self.output_dir / f'{profile_id}.prof')
+        with open(self.output_dir / f'{profile_id}.json', 'w', encoding='utf-8') as handle:
+            json.dump(summary, handle, indent=2)
+        return profile_id
@@ -0,0 +1,164 @@
+"""
+Limitador de peticiones con token buckets compartidos entre procesos.
+
+Los buckets viven en un fichero SQLite local (`RATELIMIT_DB_PATH`) y cada consumo se
+hace dentro de `BEGIN IMMEDIATE`, asi que leer, recargar y descontar tokens es atomico
+aunque haya varios workers de gunicorn. Hay un bucket por cliente (usuario o IP) para
+la busqueda y uno global para el presupuesto de peticiones a Scryfall.
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+
+from . import metrics
+
+IDLE_BUCKET_SECONDS = 3600
+
+_local = threading.local()
+
+
+def _connection():
+    connection = getattr(_local, 'connection', None)
+    if connection is None or _local.pid != os.getpid():
+        connection = sqlite3.connect(str(settings.RATELIMIT_DB_PATH), timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        _local.connection = connection
+        _local.pid = os.getpid()
+    return connection
+
+
+class TokenBucket:
+    """`rate` tokens por segundo hasta un maximo de `capacity`."""
+
+    def __init__(self, name, rate, capacity):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+
+    def consume(self, identity='', cost=1):
+        """Devuelve (permitido, segundos hasta que haya tokens suficientes)."""
+        key = f'{self.name}:{identity}'
+        now = time.time()
+        connection = _connection()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+                tokens = self.capacity if row is None else min(self.capacity, row[0] + (now - row[1]) * self.rate)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                connection.execute(
+                    'INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                    (key, tokens, now),
+                )
+                if random.random() < 0.001:
+                    connection.execute('DELETE FROM buckets WHERE updated_at < ?', (now - IDLE_BUCKET_SECONDS,))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.OperationalError:
+            # Si el fichero esta bloqueado mas de `timeout`, mejor dejar pasar que tumbar la vista.
+            return True, 0.0
+        if allowed:
+            return True, 0.0
+        metrics.inc('maki_rate_limited_total', bucket=self.name)
+        return False, (cost - tokens) / self.rate
+
+    def acquire(self, identity='', cost=1, timeout=0.0):
+        """Como `consume`, pero espera hasta `timeout` segundos a que haya tokens."""
+        deadline = time.monotonic() + timeout
+        while True:
+            allowed, retry_after = self.consume(identity, cost)
+            if allowed:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(retry_after, remaining))
+
+    async def aacquire(self, identity='', cost=1, timeout=0.0):
+        """`acquire` para codigo asincrono: el SQLite se consulta en un hilo y la espera no bloquea el bucle."""
+        consume = sync_to_async(self.consume, thread_sensitive=False)
+        deadline = time.monotonic() + timeout
+        while True:
+            allowed, retry_after = await consume(identity, cost)
+            if allowed:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(retry_after, remaining))
+
+
+def client_key(request):
+    if request.user.is_authenticated:
+        return f'user-{request.user.pk}'
+    forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    client_ip = forwarded_for.split(',')[0].strip() or request.META.get('REMOTE_ADDR', 'anon')
+    return f'ip-{client_ip}'
+
+
+def rate_limit(bucket, key=client_key, payload=None):
+    """
+    Decorador de vistas: responde 429 (con `Retry-After`) cuando el bucket del cliente
+    se queda sin tokens. `bucket` es un TokenBucket o una funcion que lo devuelve (para
+    leer los settings en cada peticion); `payload` es el cuerpo JSON de la respuesta.
+    """
+    body = payload or {'error': 'Demasiadas peticiones. Espera un momento y vuelve a intentarlo.'}
+
+    def check(request):
+        current = bucket() if callable(bucket) else bucket
+        allowed, retry_after = current.consume(key(request))
+        if allowed:
+            return None
+        response = JsonResponse(body, status=429)
+        response['Retry-After'] = str(max(1, round(retry_after)))
+        return response
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                # `key` puede leer `request.user`, que solo se carga desde codigo sincrono.
+                limited = await sync_to_async(check)(request)
+                if limited is not None:
+                    return limited
+                return await view_func(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            limited = check(request)
+            if limited is not None:
+                return limited
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def scryfall_search_bucket():
+    return TokenBucket('scryfall-search', settings.SCRYFALL_CLIENT_RATE, settings.SCRYFALL_CLIENT_BURST)
+
+
+def scryfall_upstream_bucket():
+    return TokenBucket('scryfall-upstream', settings.SCRYFALL_UPSTREAM_RATE, settings.SCRYFALL_UPSTREAM_BURST)
+
+
+def card_image_bucket():
+    return TokenBucket('card-image', settings.CARD_IMAGE_CLIENT_RATE, settings.CARD_IMAGE_CLIENT_BURST)
@@ -0,0 +1,424 @@
+"""
+Cliente HTTP para la API de Scryfall.
+
+Mantiene un pool de conexiones keep-alive por host (sin repetir el handshake TCP+TLS
+en cada fila de una importacion), pide las respuestas comprimidas con gzip y
+reintenta los 429/5xx con backoff exponencial respetando `Retry-After`. Cada host
+tiene un circuit breaker: tras varios fallos o llamadas lentas seguidas las peticiones
+fallan al instante hasta que una peticion de prueba vuelve a salir bien.
+
+`cached_search` sirve la busqueda de cartas desde la cache con stale-while-revalidate:
+las entradas caducadas se devuelven enseguida y se refrescan en segundo plano.
+
+`scryfall_async` ofrece lo mismo sobre asyncio para las vistas servidas por ASGI.
+
+Los errores se lanzan como `urllib.error.HTTPError` / `URLError`, igual que con
+`urlopen`, para que las vistas sigan tratandolos del mismo modo.
+"""
+
+import gzip
+import hashlib
+import http.client
+import io
+import json
+import queue
+import random
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import metrics, profiling, ratelimit
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'MakiExchange/1.0 (local development contact: desktop-app)',
+    'Accept': 'application/json;q=0.9,*/*;q=0.8',
+    'Accept-Encoding': 'gzip',
+    'Connection': 'keep-alive',
+}
+
+
+class CircuitOpenError(URLError):
+    pass
+
+
+class CircuitBreaker:
+    """Cerrado -> abierto tras `failure_threshold` fallos seguidos; a los `reset_seconds` deja pasar una prueba."""
+
+    def __init__(self, name, failure_threshold, reset_seconds):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def abandon(self):
+        """Una llamada cancelada por el cliente no cuenta; si era la prueba, se permite otra."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is None and self._failures < self.failure_threshold:
+                return
+            if self._opened_at is None:
+                metrics.inc('maki_scryfall_circuit_opened_total', host=self.name)
+            self._opened_at = time.monotonic()
+
+
+class ScryfallResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+
+class HostPool:
+    """Conexiones abiertas contra un host; como mucho `max_connections` en uso a la vez."""
+
+    def __init__(self, scheme, host, port, max_connections, timeout, breaker):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.breaker = breaker
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._ssl_context = ssl.create_default_context() if scheme == 'https' else None
+
+    def _connect(self):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def acquire(self, fresh=False):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise URLError(f'Scryfall connection pool for {self.host} is exhausted')
+        if not fresh:
+            try:
+                return self._idle.get_nowait(), True
+            except queue.Empty:
+                pass
+        return self._connect(), False
+
+    def release(self, connection):
+        self._idle.put(connection)
+        self._slots.release()
+
+    def discard(self, connection):
+        connection.close()
+        self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class BaseScryfallClient:
+    """Configuracion, pools por host y esperas entre reintentos; `scryfall_async` reutiliza esta base."""
+
+    pool_class = None
+
+    def __init__(self, base_url, max_connections_per_host=4, timeout=8, max_retries=2,
+                 backoff_seconds=0.5, max_backoff_seconds=5, breaker_failures=5,
+                 breaker_reset_seconds=30, slow_call_seconds=2, upstream_bucket=None, upstream_wait_seconds=0):
+        self.base_url = base_url.rstrip('/')
+        self.base_host = urlsplit(self.base_url).hostname
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.upstream_bucket = upstream_bucket
+        self.upstream_wait_seconds = upstream_wait_seconds
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+
+    def _prepare(self, method, url, body, extra_headers):
+        parts = urlsplit(url)
+        target = parts.path or '/'
+        if parts.query:
+            target = f'{target}?{parts.query}'
+        headers = dict(DEFAULT_HEADERS, **(extra_headers or {}))
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        return parts, target, headers, self._pool(parts.scheme, parts.hostname, parts.port)
+
+    def _url(self, path, params):
+        url = path if '://' in path else f'{self.base_url}{path}'
+        return f'{url}?{urlencode(params)}' if params else url
+
+    def breaker_for(self, url):
+        parts = urlsplit(url if '://' in url else f'{self.base_url}{url}')
+        return self._pool(parts.scheme, parts.hostname, parts.port).breaker
+
+    def _pool(self, scheme, host, port):
+        key = (scheme, host, port)
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._pools_lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    breaker = CircuitBreaker(host, self.breaker_failures, self.breaker_reset_seconds)
+                    pool = self._pools[key] = self.pool_class(
+                        scheme, host, port, self.max_connections_per_host, self.timeout, breaker,
+                    )
+        return pool
+
+    def _record_attempt(self, pool, endpoint, status, elapsed):
+        if status == 'error' or status in RETRY_STATUSES or elapsed > self.slow_call_seconds:
+            pool.breaker.record_failure()
+        else:
+            pool.breaker.record_success()
+        metrics.observe('maki_scryfall_request_seconds', elapsed, endpoint=endpoint)
+        metrics.inc('maki_scryfall_responses_total', endpoint=endpoint, status=str(status))
+
+    def _backoff(self, attempt):
+        delay = self.backoff_seconds * (2 ** attempt)
+        return min(self.max_backoff_seconds, delay + random.uniform(0, delay / 2))
+
+    def _retry_after(self, value, attempt):
+        if not value:
+            return self._backoff(attempt)
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = (parsedate_to_datetime(value) - timezone.now()).total_seconds()
+            except (TypeError, ValueError):
+                return self._backoff(attempt)
+        return min(self.max_backoff_seconds, max(0.0, seconds))
+
+
+def raise_for_status(url, response):
+    if response.status >= 400:
+        raise HTTPError(url, response.status, http.client.responses.get(response.status, ''),
+                        response.headers, io.BytesIO(response.body))
+    return response
+
+
+class ScryfallClient(BaseScryfallClient):
+    pool_class = HostPool
+
+    def get(self, path, params=None):
+        return self.request('GET', path, params=params).json()
+
+    def post(self, path, payload, params=None):
+        return self.request('POST', path, params=params, payload=payload).json()
+
+    def request(self, method, path, params=None, payload=None):
+        """Devuelve la respuesta 2xx; lanza HTTPError para el resto tras los reintentos."""
+        url = self._url(path, params)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        return raise_for_status(url, self.fetch(method, url, body))
+
+    def fetch(self, method, url, body=None, extra_headers=None):
+        """Hace la peticion con reintentos y devuelve la ultima respuesta, sea cual sea su estado."""
+        parts, target, headers, pool = self._prepare(method, url, body, extra_headers)
+
+        with profiling.track('scryfall'):
+            for attempt in range(self.max_retries + 1):
+                if not pool.breaker.allow():
+                    metrics.inc('maki_scryfall_circuit_rejected_total', host=pool.host)
+                    raise CircuitOpenError(f'Scryfall circuit for {pool.host} is open')
+                if (self.upstream_bucket is not None and pool.host == self.base_host
+                        and not self.upstream_bucket.acquire(timeout=self.upstream_wait_seconds)):
+                    raise URLError('Scryfall upstream request budget exhausted')
+                started = time.perf_counter()
+                status = 'error'
+                try:
+                    response = self._send(pool, method, target, body, headers)
+                    status = response.status
+                except ConnectionError as exc:
+                    if attempt == self.max_retries:
+                        raise URLError(exc) from exc
+                    delay = self._backoff(attempt)
+                except (OSError, http.client.HTTPException) as exc:
+                    if isinstance(exc, TimeoutError):
+                        raise
+                    raise URLError(exc) from exc
+                else:
+                    if status not in RETRY_STATUSES or attempt == self.max_retries:
+                        return response
+                    delay = self._retry_after(response.headers.get('Retry-After'), attempt)
+                finally:
+                    self._record_attempt(pool, parts.path, status, time.perf_counter() - started)
+                time.sleep(delay)
+
+    def close(self):
+        with self._pools_lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+    def _send(self, pool, method, target, body, headers):
+        fresh = False
+        while True:
+            connection, reused = pool.acquire(fresh=fresh)
+            try:
+                connection.request(method, target, body=body, headers=headers)
+                raw = connection.getresponse()
+                data = raw.read()
+            except STALE_CONNECTION_ERRORS:
+                pool.discard(connection)
+                if reused:
+                    # El servidor cerro una conexion ociosa: se repite con una nueva sin gastar reintento.
+                    fresh = True
+                    continue
+                raise
+            except BaseException:
+                pool.discard(connection)
+                raise
+            if raw.will_close:
+                pool.discard(connection)
+            else:
+                pool.release(connection)
+            if raw.getheader('Content-Encoding', '').lower() == 'gzip':
+                data = gzip.decompress(data)
+            return ScryfallResponse(raw.status, raw.headers, data)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def configured_client(client_class, base_url):
+    return client_class(
+        base_url,
+        max_connections_per_host=settings.SCRYFALL_MAX_CONNECTIONS_PER_HOST,
+        timeout=settings.SCRYFALL_TIMEOUT_SECONDS,
+        max_retries=settings.SCRYFALL_MAX_RETRIES,
+        backoff_seconds=settings.SCRYFALL_RETRY_BACKOFF_SECONDS,
+        max_backoff_seconds=settings.SCRYFALL_RETRY_MAX_SECONDS,
+        breaker_failures=settings.SCRYFALL_BREAKER_FAILURES,
+        breaker_reset_seconds=settings.SCRYFALL_BREAKER_RESET_SECONDS,
+        slow_call_seconds=settings.SCRYFALL_SLOW_CALL_SECONDS,
+        upstream_bucket=ratelimit.scryfall_upstream_bucket(),
+        upstream_wait_seconds=settings.SCRYFALL_UPSTREAM_WAIT_SECONDS,
+    )
+
+
+def get_client(base_url=None):
+    """Cliente compartido del proceso para `SCRYFALL_API_BASE` (o `base_url`)."""
+    base_url = (base_url or settings.SCRYFALL_API_BASE).rstrip('/')
+    client = _clients.get(base_url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(base_url)
+            if client is None:
+                client = _clients[base_url] = configured_client(ScryfallClient, base_url)
+    return client
+
+
+_refresh_executor = None
+_in_flight = {}
+_in_flight_lock = threading.RLock()
+
+
+def _refresh(key, loader):
+    """Ejecuta `loader` en el pool de refresco salvo que ya haya uno en curso para `key`."""
+    global _refresh_executor
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is None:
+            if _refresh_executor is None:
+                _refresh_executor = ThreadPoolExecutor(
+                    max_workers=settings.SCRYFALL_REFRESH_WORKERS, thread_name_prefix='scryfall-refresh',
+                )
+            future = _in_flight[key] = _refresh_executor.submit(loader)
+            future.add_done_callback(lambda _: _forget(key, future))
+    return future
+
+
+def _forget(key, future):
+    with _in_flight_lock:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+
+
+def search_cache_key(params):
+    normalized = sorted((key, str(value).strip().lower()) for key, value in params.items())
+    return 'scryfall-search-' + hashlib.sha1(repr(normalized).encode('utf-8')).hexdigest()
+
+
+def cached_search(params, limit):
+    """
+    Devuelve hasta `limit` cartas de `/cards/search` para `params`.
+
+    Entrada fresca: se devuelve tal cual. Entrada caducada (pero dentro de
+    `SCRYFALL_SEARCH_STALE_SECONDS`): se devuelve y se refresca en segundo plano. Sin
+    entrada: se espera al refresco como mucho `SCRYFALL_SEARCH_WAIT_SECONDS`; si no
+    llega, se lanza TimeoutError y la respuesta queda en cache para la siguiente tecla.
+    """
+    cache_key = search_cache_key(params)
+
+    def load():
+        try:
+            cards = get_client().get('/cards/search', params).get('data', [])[:limit]
+        except HTTPError as exc:
+            # Scryfall responde 404 cuando la busqueda no tiene resultados.
+            if exc.code != 404:
+                raise
+            cards = []
+        cache.set(cache_key, {'cards': cards, 'fetched_at': time.time()}, timeout=settings.SCRYFALL_SEARCH_STALE_SECONDS)
+        return cards
+
+    entry = cache.get(cache_key)
+    if entry is not None:
+        if time.time() - entry['fetched_at'] < settings.SCRYFALL_SEARCH_FRESH_SECONDS:
+            metrics.inc('maki_scryfall_cache_total', cache='search', result='hit')
+        else:
+            metrics.inc('maki_scryfall_cache_total', cache='search', result='stale')
+            _refresh(cache_key, load)
+        return entry['cards']
+
+    metrics.inc('maki_scryfall_cache_total', cache='search', result='miss')
+    future = _refresh(cache_key, load)
+    try:
+        return future.result(timeout=settings.SCRYFALL_SEARCH_WAIT_SECONDS)
+    except TimeoutError:
+        # Esperar mas que eso es una llamada lenta aunque el refresco acabe terminando.
+        get_client().breaker_for('/cards/search').record_failure()
+        raise
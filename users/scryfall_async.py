@@ -0,0 +1,351 @@
+"""
+Cliente asincrono de Scryfall para las vistas servidas por ASGI (`asgi.py`).
+
+Se comporta como `scryfall.ScryfallClient` (keep-alive, gzip, reintentos respetando
+`Retry-After`, circuit breaker por host y presupuesto global de peticiones) pero habla
+HTTP/1.1 sobre `asyncio.open_connection`: una busqueda que espera a Scryfall no ocupa un
+hilo, asi que un solo proceso atiende cientos a la vez. Cada host admite como mucho
+`SCRYFALL_MAX_CONNECTIONS_PER_HOST` conexiones en uso; el resto de peticiones espera turno.
+
+Django cancela la vista cuando el navegador aborta la peticion (el `AbortController` de
+`register_cards.html` lo hace con cada tecla nueva). La conexion en curso se cierra en vez
+de volver al pool, y una busqueda que ya nadie espera se cancela.
+
+Las conexiones y semaforos de asyncio pertenecen a un bucle de eventos, asi que hay un
+cliente por bucle (`get_client()`).
+"""
+
+import asyncio
+import gzip
+import http.client
+import io
+import json
+import ssl
+import threading
+import time
+import weakref
+from urllib.error import HTTPError, URLError
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics, profiling
+from .scryfall import (
+    RETRY_STATUSES,
+    BaseScryfallClient,
+    CircuitOpenError,
+    ScryfallResponse,
+    configured_client,
+    raise_for_status,
+    search_cache_key,
+)
+
+MAX_HEADER_LINES = 100
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class AsyncHostPool:
+    """Conexiones (reader, writer) abiertas contra un host; como mucho `max_connections` en uso."""
+
+    def __init__(self, scheme, host, port, max_connections, timeout, breaker):
+        self.scheme = scheme
+        self.host = host
+        self.port = port or DEFAULT_PORTS[scheme]
+        self.timeout = timeout
+        self.breaker = breaker
+        self.host_header = host if self.port == DEFAULT_PORTS[scheme] else f'{host}:{self.port}'
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections)
+        self._ssl_context = ssl.create_default_context() if scheme == 'https' else None
+
+    async def acquire(self, fresh=False):
+        try:
+            async with asyncio.timeout(self.timeout):
+                await self._slots.acquire()
+        except TimeoutError:
+            raise URLError(f'Scryfall connection pool for {self.host} is exhausted') from None
+        try:
+            while self._idle and not fresh:
+                connection = self._idle.pop()
+                if not connection[0].at_eof() and not connection[1].is_closing():
+                    return connection, True
+                connection[1].close()
+            async with asyncio.timeout(self.timeout):
+                connection = await asyncio.open_connection(self.host, self.port, ssl=self._ssl_context)
+        except BaseException:
+            self._slots.release()
+            raise
+        return connection, False
+
+    def release(self, connection):
+        self._idle.append(connection)
+        self._slots.release()
+
+    def discard(self, connection):
+        connection[1].close()
+        self._slots.release()
+
+    def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+async def _read_headers(reader):
+    lines = []
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        lines.append(line)
+        if len(lines) > MAX_HEADER_LINES:
+            raise http.client.HTTPException('Too many headers in the Scryfall response')
+    return http.client.parse_headers(io.BytesIO(b''.join(lines) + b'\r\n'))
+
+
+async def _read_chunked(reader):
+    chunks = []
+    while True:
+        size = int((await reader.readline()).split(b';', 1)[0].strip() or b'0', 16)
+        if size == 0:
+            await _read_headers(reader)
+            return b''.join(chunks)
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+
+
+async def _read_response(reader, method):
+    """Devuelve (estado, cabeceras, cuerpo, hay_que_cerrar)."""
+    while True:
+        status_line = await reader.readline()
+        if not status_line:
+            # Igual que `http.client.RemoteDisconnected`: la conexion ociosa ya estaba cerrada.
+            raise ConnectionResetError('Scryfall closed the connection without a response')
+        try:
+            version, status = status_line.decode('latin-1').split(None, 2)[:2]
+            status = int(status)
+        except ValueError:
+            raise http.client.BadStatusLine(status_line) from None
+        headers = await _read_headers(reader)
+        if status != 100:
+            break
+
+    will_close = version == 'HTTP/1.0' or headers.get('Connection', '').lower() == 'close'
+    if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+        body = b''
+    elif headers.get('Transfer-Encoding', '').lower() == 'chunked':
+        body = await _read_chunked(reader)
+    elif headers.get('Content-Length') is not None:
+        body = await reader.readexactly(int(headers['Content-Length']))
+    else:
+        body = await reader.read()
+        will_close = True
+    return status, headers, body, will_close
+
+
+class AsyncScryfallClient(BaseScryfallClient):
+    pool_class = AsyncHostPool
+
+    async def get(self, path, params=None):
+        return (await self.request('GET', path, params=params)).json()
+
+    async def post(self, path, payload, params=None):
+        return (await self.request('POST', path, params=params, payload=payload)).json()
+
+    async def request(self, method, path, params=None, payload=None):
+        """Devuelve la respuesta 2xx; lanza HTTPError para el resto tras los reintentos."""
+        url = self._url(path, params)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        return raise_for_status(url, await self.fetch(method, url, body))
+
+    async def fetch(self, method, url, body=None, extra_headers=None):
+        """Hace la peticion con reintentos y devuelve la ultima respuesta, sea cual sea su estado."""
+        parts, target, headers, pool = self._prepare(method, url, body, extra_headers)
+
+        with profiling.track('scryfall'):
+            for attempt in range(self.max_retries + 1):
+                if not pool.breaker.allow():
+                    metrics.inc('maki_scryfall_circuit_rejected_total', host=pool.host)
+                    raise CircuitOpenError(f'Scryfall circuit for {pool.host} is open')
+                started = time.perf_counter()
+                status = 'error'
+                try:
+                    if (self.upstream_bucket is not None and pool.host == self.base_host
+                            and not await self.upstream_bucket.aacquire(timeout=self.upstream_wait_seconds)):
+                        status = 'budget'
+                        raise URLError('Scryfall upstream request budget exhausted')
+                    started = time.perf_counter()
+                    response = await self._send(pool, method, target, body, headers)
+                    status = response.status
+                except asyncio.CancelledError:
+                    # El navegador aborto la busqueda: no cuenta como fallo de Scryfall.
+                    status = 'cancelled'
+                    pool.breaker.abandon()
+                    raise
+                except ConnectionError as exc:
+                    if attempt == self.max_retries:
+                        raise URLError(exc) from exc
+                    delay = self._backoff(attempt)
+                except URLError:
+                    raise
+                except (OSError, EOFError, http.client.HTTPException) as exc:
+                    if isinstance(exc, TimeoutError):
+                        raise
+                    raise URLError(exc) from exc
+                else:
+                    if status not in RETRY_STATUSES or attempt == self.max_retries:
+                        return response
+                    delay = self._retry_after(response.headers.get('Retry-After'), attempt)
+                finally:
+                    if status == 'budget':
+                        pool.breaker.abandon()
+                    elif status != 'cancelled':
+                        self._record_attempt(pool, parts.path, status, time.perf_counter() - started)
+                await asyncio.sleep(delay)
+
+    def close(self):
+        with self._pools_lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+    def _request_bytes(self, pool, method, target, body, headers):
+        lines = [f'{method} {target} HTTP/1.1', f'Host: {pool.host_header}']
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        if body is not None:
+            lines.append(f'Content-Length: {len(body)}')
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b'')
+
+    async def _send(self, pool, method, target, body, headers):
+        fresh = False
+        while True:
+            connection, reused = await pool.acquire(fresh=fresh)
+            reader, writer = connection
+            try:
+                async with asyncio.timeout(self.timeout):
+                    writer.write(self._request_bytes(pool, method, target, body, headers))
+                    await writer.drain()
+                    status, response_headers, data, will_close = await _read_response(reader, method)
+            except (ConnectionError, asyncio.IncompleteReadError) as exc:
+                pool.discard(connection)
+                if reused:
+                    # El servidor cerro una conexion ociosa: se repite con una nueva sin gastar reintento.
+                    fresh = True
+                    continue
+                if isinstance(exc, asyncio.IncompleteReadError):
+                    raise ConnectionResetError('Scryfall closed the connection mid-response') from exc
+                raise
+            except BaseException:
+                # Incluye la cancelacion: una respuesta a medio leer deja la conexion inservible.
+                pool.discard(connection)
+                raise
+            if will_close:
+                pool.discard(connection)
+            else:
+                pool.release(connection)
+            if response_headers.get('Content-Encoding', '').lower() == 'gzip':
+                data = gzip.decompress(data)
+            return ScryfallResponse(status, response_headers, data)
+
+
+class _Refresh:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+        # Refrescos en segundo plano o que ya superaron la espera: siguen aunque nadie espere.
+        self.detached = False
+
+
+class _LoopState:
+    def __init__(self):
+        self.client = None
+        self.in_flight = {}
+
+
+_states = weakref.WeakKeyDictionary()
+_states_lock = threading.Lock()
+
+
+def _state():
+    loop = asyncio.get_running_loop()
+    state = _states.get(loop)
+    if state is None:
+        with _states_lock:
+            state = _states.setdefault(loop, _LoopState())
+    return state
+
+
+def get_client():
+    """Cliente del bucle de eventos actual para `SCRYFALL_API_BASE`."""
+    state = _state()
+    if state.client is None:
+        state.client = configured_client(AsyncScryfallClient, settings.SCRYFALL_API_BASE)
+    return state.client
+
+
+def _forget(in_flight, key, task):
+    refresh = in_flight.get(key)
+    if refresh is not None and refresh.task is task:
+        del in_flight[key]
+    if not task.cancelled():
+        # Marca la excepcion como recogida: los refrescos en segundo plano no tienen a quien avisar.
+        task.exception()
+
+
+def _refresh(key, loader):
+    """Lanza `loader()` como tarea salvo que ya haya una en curso para `key`."""
+    in_flight = _state().in_flight
+    refresh = in_flight.get(key)
+    if refresh is None:
+        task = asyncio.ensure_future(loader())
+        refresh = in_flight[key] = _Refresh(task)
+        task.add_done_callback(lambda done: _forget(in_flight, key, done))
+    return refresh
+
+
+async def cached_search(params, limit):
+    """
+    Version asincrona de `scryfall.cached_search`, con la misma cache y las mismas reglas
+    de frescura. Si se cancela la unica peticion que esperaba una busqueda sin cachear,
+    la llamada a Scryfall se cancela tambien.
+    """
+    cache_key = search_cache_key(params)
+
+    async def load():
+        try:
+            cards = (await get_client().get('/cards/search', params)).get('data', [])[:limit]
+        except HTTPError as exc:
+            # Scryfall responde 404 cuando la busqueda no tiene resultados.
+            if exc.code != 404:
+                raise
+            cards = []
+        await cache.aset(
+            cache_key, {'cards': cards, 'fetched_at': time.time()}, timeout=settings.SCRYFALL_SEARCH_STALE_SECONDS,
+        )
+        return cards
+
+    entry = await cache.aget(cache_key)
+    if entry is not None:
+        if time.time() - entry['fetched_at'] < settings.SCRYFALL_SEARCH_FRESH_SECONDS:
+            metrics.inc('maki_scryfall_cache_total', cache='search', result='hit')
+        else:
+            metrics.inc('maki_scryfall_cache_total', cache='search', result='stale')
+            _refresh(cache_key, load).detached = True
+        return entry['cards']
+
+    metrics.inc('maki_scryfall_cache_total', cache='search', result='miss')
+    refresh = _refresh(cache_key, load)
+    refresh.waiters += 1
+    try:
+        async with asyncio.timeout(settings.SCRYFALL_SEARCH_WAIT_SECONDS):
+            return await asyncio.shield(refresh.task)
+    except TimeoutError:
+        # La respuesta queda en cache para la siguiente tecla; esperar mas es una llamada lenta.
+        refresh.detached = True
+        get_client().breaker_for('/cards/search').record_failure()
+        raise
+    except asyncio.CancelledError:
+        if refresh.waiters == 1 and not refresh.detached:
+            refresh.task.cancel()
+        raise
+    finally:
+        refresh.waiters -= 1
@@ -0,0 +1,210 @@
+"""
+Servidor local que imita la API de Scryfall para pruebas de carga sin red.
+
+Sirve `/cards/search`, `/cards/collection` y `/sets`. Si existe una respuesta grabada
+en el directorio de grabaciones se devuelve tal cual; si no, se genera una carta
+determinista a partir del nombre buscado (o, con `record_from`, se pide a la API real
+y se guarda para la proxima vez). La latencia, los errores 5xx y las respuestas 429
+son configurables.
+"""
+
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from .scryfall import ScryfallClient
+
+STUB_SETS = [
+    ('lea', 'Limited Edition Alpha'),
+    ('m10', 'Magic 2010'),
+    ('zen', 'Zendikar'),
+    ('mh2', 'Modern Horizons 2'),
+    ('dmu', 'Dominaria United'),
+    ('one', 'Phyrexia: All Will Be One'),
+    ('mom', 'March of the Machine'),
+    ('woe', 'Wilds of Eldraine'),
+    ('lci', 'The Lost Caverns of Ixalan'),
+    ('mkm', 'Murders at Karlov Manor'),
+]
+
+
+def recording_key(method, path, query, body=b''):
+    digest = hashlib.sha1(method.encode() + path.encode() + query.encode() + body).hexdigest()[:16]
+    return f"{path.strip('/').replace('/', '_')}__{digest}.json"
+
+
+def stub_card(name, set_index=0):
+    set_code, set_name = STUB_SETS[set_index % len(STUB_SETS)]
+    seed = int(hashlib.sha1(f'{name}|{set_code}'.encode()).hexdigest()[:8], 16)
+    card_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f'stub:{name}:{set_code}'))
+    usd = seed % 5000 / 100
+    return {
+        'object': 'card',
+        'id': card_id,
+        'name': name,
+        'set': set_code,
+        'set_name': set_name,
+        'collector_number': str(seed % 300 + 1),
+        'rarity': ['common', 'uncommon', 'rare', 'mythic'][seed % 4],
+        'type_line': 'Instant',
+        'oracle_text': f'{name} (stub)',
+        'image_uris': {
+            'normal': f'https://cards.scryfall.io/normal/front/{card_id[0]}/{card_id[1]}/{card_id}.jpg',
+            'small': f'https://cards.scryfall.io/small/front/{card_id[0]}/{card_id[1]}/{card_id}.jpg',
+        },
+        'prices': {'usd': f'{usd:.2f}', 'usd_foil': f'{usd * 2:.2f}', 'eur': f'{usd * 0.9:.2f}'},
+    }
+
+
+def _search_response(query):
+    exact = query.startswith('!"') and query.endswith('"')
+    name = query[2:-1] if exact else query.strip()
+    if not name:
+        return 404, {'object': 'error', 'code': 'not_found', 'status': 404}
+    if exact:
+        cards = [stub_card(name, i) for i in range(3)]
+    else:
+        title = name.title()
+        cards = [stub_card(f'{title} {suffix}'.strip(), i) for i, suffix in enumerate(['', 'Elemental', 'Titan', 'Ritual'])]
+    return 200, {'object': 'list', 'total_cards': len(cards), 'has_more': False, 'data': cards}
+
+
+def _collection_response(body):
+    identifiers = body.get('identifiers', [])
+    data = []
+    for index, identifier in enumerate(identifiers[:75]):
+        name = identifier.get('name') or identifier.get('id') or f"{identifier.get('set')}-{identifier.get('collector_number')}"
+        data.append(stub_card(name, index))
+    return 200, {'object': 'list', 'not_found': [], 'data': data}
+
+
+def _sets_response():
+    return 200, {
+        'object': 'list',
+        'has_more': False,
+        'data': [{'object': 'set', 'code': code, 'name': name} for code, name in STUB_SETS],
+    }
+
+
+class StubConfig:
+    def __init__(self, latency_ms=50, jitter_ms=20, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1, recordings_dir=None, record_from=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.recordings_dir = Path(recordings_dir) if recordings_dir else None
+        self.record_from = record_from.rstrip('/') if record_from else None
+        self.upstream = ScryfallClient(self.record_from, max_retries=0, timeout=15) if record_from else None
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'recorded': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+
+class ScryfallStubHandler(BaseHTTPRequestHandler):
+    server_version = 'ScryfallStub/1.0'
+    protocol_version = 'HTTP/1.1'
+    # Con keep-alive, Nagle + ACK retardado anaden ~40 ms a cada respuesta.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle(b'')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._handle(self.rfile.read(length) if length else b'')
+
+    def _handle(self, body):
+        config = self.server.stub_config
+        config.count('requests')
+        parsed = urlparse(self.path)
+
+        with config.lock:
+            delay = max(0.0, config.latency_ms + config.random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+            roll = config.random.random()
+        time.sleep(delay)
+
+        if roll < config.rate_limit_rate:
+            config.count('rate_limited')
+            self._send(429, {'object': 'error', 'code': 'rate_limited', 'status': 429},
+                       headers={'Retry-After': str(config.retry_after)})
+            return
+        if roll < config.rate_limit_rate + config.error_rate:
+            config.count('errors')
+            self._send(503, {'object': 'error', 'code': 'unavailable', 'status': 503})
+            return
+
+        if config.recordings_dir:
+            recorded = config.recordings_dir / recording_key(self.command, parsed.path, parsed.query, body)
+            if recorded.exists():
+                config.count('recorded')
+                self._send_raw(200, recorded.read_bytes())
+                return
+            if config.record_from:
+                response = config.upstream.fetch(self.command, f'{config.record_from}{self.path}', body or None,
+                                                 {'User-Agent': 'MakiExchange/1.0 (scryfall stub recorder)'})
+                status, content = response.status, response.body
+                if status == 200:
+                    config.recordings_dir.mkdir(parents=True, exist_ok=True)
+                    recorded.write_bytes(content)
+                self._send_raw(status, content)
+                return
+
+        if parsed.path == '/cards/search' and self.command == 'GET':
+            query = parse_qs(parsed.query).get('q', [''])[0]
+            status, payload = _search_response(query)
+        elif parsed.path == '/cards/collection' and self.command == 'POST':
+            try:
+                status, payload = _collection_response(json.loads(body or b'{}'))
+            except ValueError:
+                status, payload = 400, {'object': 'error', 'code': 'bad_request', 'status': 400}
+        elif parsed.path == '/sets' and self.command == 'GET':
+            status, payload = _sets_response()
+        else:
+            status, payload = 404, {'object': 'error', 'code': 'not_found', 'status': 404}
+        self._send(status, payload)
+
+    def _send(self, status, payload, headers=None):
+        self._send_raw(status, json.dumps(payload).encode('utf-8'), headers)
+
+    def _send_raw(self, status, body, headers=None):
+        headers = dict(headers or {})
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and len(body) > 512:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_stub_server(host='127.0.0.1', port=8765, **config):
+    server = ThreadingHTTPServer((host, port), ScryfallStubHandler)
+    server.daemon_threads = True
+    server.stub_config = StubConfig(**config)
+    return server
+
+
+def start_stub_in_thread(host='127.0.0.1', port=0, **config):
+    """Arranca el stub en un hilo y devuelve (server, base_url)."""
+    server = make_stub_server(host, port, **config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
@@ -0,0 +1,106 @@
+"""Serializadores de la API JSON (`users/api.py`)."""
+
+from rest_framework import serializers
+
+from .models import Card, CustomUser, Exchange, Notification, UserCard
+
+
+def requested_fields(request):
+    """Campos pedidos con `?fields=id,name,price`, o None si se quieren todos."""
+    if request is None:
+        return None
+    fields = request.query_params.get('fields', '')
+    return {field.strip() for field in fields.split(',') if field.strip()} or None
+
+
+class SparseFieldsMixin:
+    """Deja solo los campos de `?fields=`; los nombres desconocidos se ignoran."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Los serializadores anidados se crean sin contexto y siempre devuelven todos sus campos.
+        wanted = requested_fields(self.context.get('request'))
+        if wanted:
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class CardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Card
+        fields = [
+            'id', 'name', 'description', 'price', 'scryfall_id', 'set_name', 'set_code', 'collector_number',
+            'image_url', 'rarity', 'usd_price', 'usd_foil_price', 'eur_price', 'updated_at',
+        ]
+        read_only_fields = ['updated_at']
+
+
+class OwnerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CustomUser
+        fields = ['id', 'username', 'city', 'transaction_preference']
+
+
+class UserCardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    card = CardSerializer(read_only=True)
+    card_id = serializers.PrimaryKeyRelatedField(source='card', queryset=Card.objects.all())
+
+    class Meta:
+        model = UserCard
+        fields = [
+            'id', 'card', 'card_id', 'is_owned', 'quantity_owned', 'quantity_required', 'listing_intent',
+            'condition', 'asking_price', 'updated_at',
+        ]
+        read_only_fields = ['updated_at']
+
+
+class ListingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Carta poseída por otro usuario, como en `search_card_matches`."""
+
+    card = CardSerializer(read_only=True)
+    owner = OwnerSerializer(source='user', read_only=True)
+
+    class Meta:
+        model = UserCard
+        fields = ['id', 'card', 'owner', 'quantity_owned', 'listing_intent', 'condition', 'asking_price', 'updated_at']
+        read_only_fields = fields
+
+
+class ExchangeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    sender_username = serializers.CharField(source='sender.username', read_only=True)
+    receiver_username = serializers.CharField(source='receiver.username', read_only=True)
+
+    class Meta:
+        model = Exchange
+        fields = [
+            'id', 'sender', 'sender_username', 'receiver', 'receiver_username', 'sender_cards', 'receiver_cards',
+            'date', 'status', 'exchange_type', 'sender_value', 'receiver_value', 'fairness_score', 'valuation',
+            'updated_at',
+        ]
+        read_only_fields = ['sender', 'date', 'sender_value', 'receiver_value', 'fairness_score', 'valuation', 'updated_at']
+
+    def validate(self, attrs):
+        request = self.context['request']
+        if self.instance is None:
+            # Los intercambios nuevos siempre empiezan pendientes.
+            attrs.pop('status', None)
+            if attrs.get('receiver') == request.user:
+                raise serializers.ValidationError({'receiver': 'No puedes proponerte un intercambio a ti mismo.'})
+            return attrs
+        if set(attrs) - {'status'}:
+            raise serializers.ValidationError('Solo se puede cambiar el estado de un intercambio existente.')
+        if attrs.get('status') not in (None, 'accepted', 'rejected'):
+            raise serializers.ValidationError({'status': 'Un intercambio solo se puede aceptar o rechazar.'})
+        return attrs
+
+
+class NotificationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    sender_username = serializers.CharField(source='sender.username', read_only=True)
+
+    class Meta:
+        model = Notification
+        fields = [
+            'id', 'sender', 'sender_username', 'message', 'created_at', 'is_read', 'type', 'exchange', 'card',
+            'payload', 'updated_at',
+        ]
+        read_only_fields = [field for field in fields if field != 'is_read']
@@ -0,0 +1,11 @@
+from django import template
+
+from users.images import proxy_url
+
+register = template.Library()
+
+
+@register.filter
+def card_thumbnail(url, size='small'):
+    """Sirve la imagen de Scryfall desde la cache local en el tamano pedido."""
+    return proxy_url(url, size) if url else ''
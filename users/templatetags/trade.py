@@ -0,0 +1,11 @@
+from django import template
+
+from users.valuation import user_card_value
+
+register = template.Library()
+
+
+@register.filter
+def trade_value(user_card):
+    """Valor en USD de una copia segun `users.valuation` (estado y precio pedido incluidos)."""
+    return user_card_value(user_card)
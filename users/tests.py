@@ -1,3 +1,1326 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from contextlib import closing
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import urlopen
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Q
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from my_django_project import db_router
+from my_django_project.staticfiles import serve_static
+
+from . import admin, cardindex, decklist, exports, images, metrics, ratelimit, scryfall, views
+from .auth import CachedModelBackend
+from .models import Card, CustomUser, Exchange, Notification, NotificationArchive, UserCard
+from .scryfall import CircuitBreaker, ScryfallClient
+from .scryfall_stub import recording_key, start_stub_in_thread, stub_card
+from .valuation import CardPrices, fairness_score, line_value, value_exchange
+
+router = db_router.PrimaryReplicaRouter()
+
+
+class ArchiveNotificationsTests(TestCase):
+    def setUp(self):
+        self.sender = CustomUser.objects.create_user(username='sender', password='x')
+        self.receiver = CustomUser.objects.create_user(username='receiver', password='x')
+        self.card = Card.objects.create(name='Opt')
+        self.exchange = Exchange.objects.create(sender=self.sender, receiver=self.receiver, sender_cards='', receiver_cards='Opt')
+
+    def notification(self, type, days_old):
+        notification = Notification.objects.create(
+            sender=self.sender, receiver=self.receiver, message=f'{type} {days_old}', type=type,
+            exchange=self.exchange, card=self.card, payload={'card_name': 'Opt'},
+        )
+        Notification.objects.filter(pk=notification.pk).update(created_at=timezone.now() - timedelta(days=days_old))
+        return notification
+
+    def test_moves_old_resolved_notifications_to_the_archive(self):
+        old = self.notification('resolved', 40)
+        recent = self.notification('resolved', 5)
+        unresolved = self.notification('action', 40)
+
+        call_command('archive_notifications', '--pause', '0', '--chunk-size', '1', stdout=io.StringIO())
+        self.assertEqual(
+            sorted(Notification.objects.values_list('pk', flat=True)), sorted([recent.pk, unresolved.pk]),
+        )
+        archived = NotificationArchive.objects.get()
+        self.assertEqual(
+            (archived.notification_id, archived.sender_id, archived.receiver_id, archived.message),
+            (old.pk, self.sender.pk, self.receiver.pk, 'resolved 40'),
+        )
+        self.assertEqual((archived.exchange_id, archived.card_id), (self.exchange.pk, self.card.pk))
+        self.assertEqual(archived.payload, {'card_name': 'Opt'})
+
+    def test_delete_skips_the_archive(self):
+        self.notification('resolved', 40)
+        call_command('archive_notifications', '--pause', '0', '--delete', stdout=io.StringIO())
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(NotificationArchive.objects.exists())
+
+
+class NotificationFlowTests(TestCase):
+    def setUp(self):
+        caches['fragments'].clear()
+        self.seeker = CustomUser.objects.create_user(username='seeker', password='x')
+        self.owner = CustomUser.objects.create_user(username='owner', password='x')
+        self.bolt = Card.objects.create(name='Lightning Bolt')
+        self.opt = Card.objects.create(name='Opt')
+        UserCard.objects.create(user=self.owner, card=self.bolt, is_owned=True, quantity_owned=1)
+        self.offered = UserCard.objects.create(user=self.seeker, card=self.opt, is_owned=True, quantity_owned=1)
+
+    def login(self, user):
+        self.client.force_login(user)
+
+    def test_trade_request_round_trip(self):
+        self.login(self.seeker)
+        response = self.client.post('/users/send_notification/', {
+            'card_name': 'Lightning Bolt', 'owner_id': self.owner.pk, 'card_id': self.bolt.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        request = Notification.objects.get(receiver=self.owner)
+        exchange = Exchange.objects.get()
+        self.assertEqual((request.type, request.exchange, request.card), ('action', exchange, self.bolt))
+        self.assertEqual(request.payload, {'card_name': 'Lightning Bolt'})
+
+        self.login(self.owner)
+        self.assertEqual(self.client.get('/users/notifications/').status_code, 200)
+        response = self.client.get('/users/view_user_cards/', {'user_id': self.seeker.pk, 'notification_id': request.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['searched_card'], 'Lightning Bolt')
+
+        response = self.client.post('/users/send_trade_request/', {
+            'desired_card': 'Lightning Bolt', 'selected_cards': [str(self.offered.pk)],
+            'user_id': self.seeker.pk, 'notification_id': request.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        request.refresh_from_db()
+        self.assertEqual(request.type, 'resolved')
+        offer = Notification.objects.get(receiver=self.seeker)
+        self.assertEqual((offer.type, offer.exchange_id, offer.card_id), ('exchange', exchange.pk, self.bolt.pk))
+        self.assertEqual(offer.payload['offered_cards'], ['Opt'])
+
+        self.login(self.seeker)
+        response = self.client.post('/users/accept_notification/', {'notification_id': offer.pk})
+        self.assertRedirects(response, f'/users/user_info/{self.owner.pk}/', fetch_redirect_response=False)
+        exchange.refresh_from_db()
+        self.assertEqual(exchange.status, 'accepted')
+
+    def test_reject_notification_keeps_the_exchange_link(self):
+        exchange = Exchange.objects.create(sender=self.seeker, receiver=self.owner, sender_cards='', receiver_cards='Opt')
+        request = Notification.objects.create(
+            sender=self.seeker, receiver=self.owner, message='...', type='action', exchange=exchange,
+        )
+        self.login(self.owner)
+        self.client.post('/users/reject_notification/', {'notification_id': request.pk})
+        reply = Notification.objects.get(receiver=self.seeker)
+        self.assertEqual((reply.type, reply.exchange_id), ('info', exchange.pk))
+
+    def test_purchase_offer_stores_the_card(self):
+        self.login(self.seeker)
+        self.client.post('/users/make_purchase_offer/', {
+            'card_name': 'Lightning Bolt', 'owner_id': self.owner.pk, 'card_id': self.bolt.pk,
+        })
+        offer = Notification.objects.get(receiver=self.owner)
+        self.assertEqual((offer.type, offer.card_id, offer.payload), ('compra', self.bolt.pk, {'card_name': 'Lightning Bolt'}))
+
+
+@mock.patch('my_django_project.db_router.replica_enabled', return_value=True)
+class ReplicaRoutingTests(SimpleTestCase):
+    def run_view(self, request, url_name):
+        seen = {}
+
+        def get_response(request):
+            seen['card'] = router.db_for_read(Card)
+            seen['user'] = router.db_for_read(CustomUser)
+            return HttpResponse()
+
+        request.resolver_match = mock.Mock(url_name=url_name)
+        middleware = db_router.ReplicaRoutingMiddleware(get_response)
+        middleware.process_view(request, None, (), {})
+        response = middleware(request)
+        return seen, response
+
+    def test_listed_read_only_views_read_from_the_replica(self, replica_enabled):
+        seen, response = self.run_view(RequestFactory().get('/users/cards/'), 'card_list')
+        self.assertEqual(seen, {'card': 'replica', 'user': 'default'})
+        self.assertNotIn(db_router.PRIMARY_PIN_COOKIE, response.cookies)
+        self.assertIsNone(router.db_for_read(Card))
+
+    def test_other_views_and_writes_use_the_primary(self, replica_enabled):
+        seen, _ = self.run_view(RequestFactory().get('/users/notifications/'), 'list_notifications')
+        self.assertEqual(seen['card'], None)
+        seen, response = self.run_view(RequestFactory().post('/users/cards/'), 'card_list')
+        self.assertEqual(seen['card'], None)
+        self.assertIn(db_router.PRIMARY_PIN_COOKIE, response.cookies)
+        self.assertEqual(router.db_for_write(Card), 'default')
+
+    def test_pinned_clients_read_from_the_primary(self, replica_enabled):
+        request = RequestFactory().get('/users/cards/')
+        request.COOKIES[db_router.PRIMARY_PIN_COOKIE] = '1'
+        seen, _ = self.run_view(request, 'card_list')
+        self.assertEqual(seen['card'], None)
+
+    def test_replica_is_never_migrated(self, replica_enabled):
+        self.assertFalse(router.allow_migrate(db_router.REPLICA_ALIAS, 'users'))
+        self.assertIsNone(router.allow_migrate('default', 'users'))
+
+
+class RefreshReplicaTests(SimpleTestCase):
+    def test_copies_the_primary_with_the_backup_api(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        primary, replica = f'{directory}/primary.sqlite3', f'{directory}/replica.sqlite3'
+        with closing(sqlite3.connect(primary)) as connection:
+            connection.execute('CREATE TABLE cards (name TEXT)')
+            connection.execute("INSERT INTO cards VALUES ('Opt')")
+            connection.commit()
+        databases = {
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': primary},
+            db_router.REPLICA_ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': replica},
+        }
+        with mock.patch.object(settings, 'DATABASES', databases):
+            call_command('refresh_replica', stdout=io.StringIO())
+        with closing(sqlite3.connect(replica)) as connection:
+            self.assertEqual(connection.execute('SELECT name FROM cards').fetchall(), [('Opt',)])
+
+    def test_requires_a_replica(self):
+        with self.assertRaises(CommandError):
+            call_command('refresh_replica', stdout=io.StringIO())
+
+
+class PublishImportTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='ana', password='secret')
+        self.client.force_login(self.user)
+
+    @mock.patch('users.views.IMPORT_TRANSACTION_ROWS', 2)
+    def test_publish_writes_matched_rows_in_batches(self):
+        rows = [
+            {'match_status': 'matched', 'scryfall_id': f'id-{number}', 'name': f'Card {number}', 'usd_price': '1.00',
+             'quantity': 2, 'card_type': 'owned' if number % 2 else 'desired'}
+            for number in range(3)
+        ] + [{'match_status': 'missing', 'name': 'Unknown'}]
+
+        response = self.client.post('/users/upload_file/', {'action': 'publish', 'bulk_payload': json.dumps(rows)})
+
+        self.assertRedirects(response, '/users/cards/', fetch_redirect_response=False)
+        self.assertEqual(
+            sorted(UserCard.objects.filter(user=self.user).values_list(
+                'card__scryfall_id', 'is_owned', 'quantity_owned', 'quantity_required',
+            )),
+            [('id-0', False, 0, 2), ('id-1', True, 2, 0), ('id-2', False, 0, 2)],
+        )
+
+    def test_upload_page_renders(self):
+        self.assertEqual(self.client.get('/users/upload_file/').status_code, 200)
+
+
+class IndexTests(TestCase):
+    def test_view_indexes_exist(self):
+        with connection.cursor() as cursor:
+            indexes = {
+                name
+                for model in (Card, Exchange, Notification, UserCard)
+                for name in connection.introspection.get_constraints(cursor, model._meta.db_table)
+            }
+        self.assertLessEqual({
+            'users_card_name_set_idx',
+            'users_card_price_name_idx',
+            'users_card_name_ci_idx',
+            'users_exch_status_idx',
+            'users_exch_recv_status_idx',
+            'users_notif_inbox_idx',
+            'users_uc_user_owned_idx',
+            'users_uc_card_owned_idx',
+            'users_uc_user_card_idx',
+        }, indexes)
+
+    def test_case_insensitive_name_lookup_uses_the_nocase_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('The NOCASE index only applies to SQLite.')
+        self.assertIn('users_card_name_ci_idx', Card.objects.filter(name__iexact='opt').explain())
+
+
+class DatasetTests(TestCase):
+    def test_generate_dataset_command_inserts_the_requested_rows(self):
+        call_command(
+            'generate_dataset', users=3, cards=9, user_cards=20, exchanges=4, notifications=6, batch_size=4,
+            stdout=io.StringIO(),
+        )
+        call_command('generate_dataset', users=2, cards=0, user_cards=0, exchanges=0, notifications=0, stdout=io.StringIO())
+
+        self.assertEqual(
+            sorted(CustomUser.objects.values_list('username', flat=True)),
+            ['bench-0', 'bench-1', 'bench-2', 'bench-3', 'bench-4'],
+        )
+        self.assertEqual(
+            (Card.objects.count(), UserCard.objects.count(), Exchange.objects.count(), Notification.objects.count()),
+            (9, 20, 4, 6),
+        )
+
+    def test_benchmark_views_reports_every_url(self):
+        call_command(
+            'generate_dataset', users=3, cards=9, user_cards=20, exchanges=4, notifications=6, stdout=io.StringIO(),
+        )
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        output = f'{directory}/benchmark.json'
+
+        call_command('benchmark_views', current_db=True, iterations=1, output=output, stdout=io.StringIO())
+
+        with open(output, encoding='utf-8') as handle:
+            statuses = {entry['view']: entry['status'] for entry in json.load(handle)['results']}
+        self.assertEqual(statuses['home'], 200)
+        self.assertEqual(statuses['card_list'], 200)
+        self.assertIn('search_card_matches', statuses)
+
+
+class ScryfallStubTests(SimpleTestCase):
+    def start_stub(self, **config):
+        server, base_url = start_stub_in_thread(latency_ms=0, jitter_ms=0, seed=1, **config)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, base_url
+
+    def fetch(self, url, data=None):
+        try:
+            with urlopen(url, data=data, timeout=5) as response:
+                return response.status, response.headers, json.loads(response.read())
+        except HTTPError as exc:
+            return exc.code, exc.headers, json.loads(exc.read())
+
+    def test_synthesizes_deterministic_cards(self):
+        _, base_url = self.start_stub()
+
+        status, _, payload = self.fetch(f'{base_url}/cards/search?q=%21%22Opt%22')
+        self.assertEqual(status, 200)
+        self.assertEqual([card['name'] for card in payload['data']], ['Opt'] * 3)
+        self.assertEqual(payload['data'][0], stub_card('Opt'))
+
+        status, _, payload = self.fetch(
+            f'{base_url}/cards/collection', json.dumps({'identifiers': [{'name': 'Opt'}, {'name': 'Shock'}]}).encode(),
+        )
+        self.assertEqual((status, [card['name'] for card in payload['data']]), (200, ['Opt', 'Shock']))
+
+    def test_rate_limited_responses_carry_retry_after(self):
+        server, base_url = self.start_stub(rate_limit_rate=1.0, retry_after=3)
+
+        status, headers, _ = self.fetch(f'{base_url}/sets')
+
+        self.assertEqual((status, headers['Retry-After']), (429, '3'))
+        self.assertEqual(server.stub_config.stats['rate_limited'], 1)
+
+    def test_replays_recordings(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        recorded = {'object': 'list', 'data': [{'name': 'Recorded'}]}
+        with open(f"{directory}/{recording_key('GET', '/cards/search', 'q=opt')}", 'w', encoding='utf-8') as handle:
+            json.dump(recorded, handle)
+        server, base_url = self.start_stub(recordings_dir=directory)
+
+        self.assertEqual(self.fetch(f'{base_url}/cards/search?q=opt')[2], recorded)
+        self.assertEqual(server.stub_config.stats['recorded'], 1)
+
+    @override_settings(SCRYFALL_API_BASE='https://api.scryfall.com')
+    def test_load_test_refuses_the_live_api(self):
+        with self.assertRaises(CommandError):
+            call_command('scryfall_load_test', stdout=io.StringIO())
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.overrides = override_settings(PROFILING_OUTPUT_DIR=self.directory, PROFILING_SAMPLE_RATE=0)
+        self.overrides.enable()
+        self.addCleanup(self.overrides.disable)
+        self.user = CustomUser.objects.create_user(username='ana', password='secret')
+        self.client.force_login(self.user)
+
+    def test_staff_requests_are_profiled_on_demand(self):
+        self.user.is_staff = True
+        self.user.save()
+
+        response = self.client.get('/users/cards/', headers={'X-Profile': '1'})
+
+        profile_id = response['X-Profile-Id']
+        with open(f'{self.directory}/{profile_id}.json', encoding='utf-8') as handle:
+            summary = json.load(handle)
+        self.assertEqual((summary['view'], summary['status']), ('card_list', 200))
+        self.assertGreater(summary['sql_queries'], 0)
+        self.assertTrue(os.path.exists(f'{self.directory}/{profile_id}.prof'))
+
+    def test_other_users_cannot_trigger_a_profile(self):
+        response = self.client.get('/users/cards/', {'__profile__': '1'})
+
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.overrides = override_settings(METRICS_DIR=self.directory, METRICS_TOKEN='s3cret')
+        self.overrides.enable()
+        self.addCleanup(self.overrides.disable)
+        for name, value in (('_path', None), ('_counters', {}), ('_histograms', {}), ('serving', False)):
+            patcher = mock.patch.object(metrics.registry, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_dead_worker(self, pid, value):
+        path = f'{self.directory}/metrics-{pid}-0123abcd.json'
+        with open(path, 'w', encoding='utf-8') as handle:
+            json.dump({'counters': [['maki_import_rows_total', [['source', 'csv_publish']], value]]}, handle)
+        return path
+
+    def test_endpoint_requires_the_token_and_reports_requests(self):
+        self.client.get('/users/search_card/')
+
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        response = self.client.get('/metrics/', headers={'Authorization': 'Bearer s3cret'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('maki_http_requests_total{method="GET",status="302",view="search_card"} 1', response.content.decode())
+
+    @unittest.skipIf(metrics.fcntl is None, 'Retiring files needs flock.')
+    def test_dead_worker_files_are_folded_into_the_retired_file(self):
+        first = self.write_dead_worker(999999991, 2)
+        metrics.retire_dead_files()
+        second = self.write_dead_worker(999999992, 3)
+        metrics.retire_dead_files()
+
+        self.assertFalse(os.path.exists(first) or os.path.exists(second))
+        self.assertIn('maki_import_rows_total{source="csv_publish"} 5', metrics.render_exposition())
+
+
+class ScryfallClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server, base_url = start_stub_in_thread(latency_ms=0, jitter_ms=0, seed=1, retry_after=0)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = ScryfallClient(base_url, max_retries=2, backoff_seconds=0)
+        self.addCleanup(self.client.close)
+
+    def test_reuses_kept_alive_connections_and_decodes_gzip(self):
+        first = self.client.get('/cards/search', {'q': 'bolt'})
+        second = self.client.post('/cards/collection', {'identifiers': [{'name': 'Opt'}]})
+
+        self.assertEqual([card['name'] for card in first['data']], ['Bolt', 'Bolt Elemental', 'Bolt Titan', 'Bolt Ritual'])
+        self.assertEqual(second['data'][0]['name'], 'Opt')
+        pool = self.client._pool('http', '127.0.0.1', self.server.server_address[1])
+        self.assertEqual(pool._idle.qsize(), 1)
+
+    def test_retries_rate_limited_responses_then_raises(self):
+        self.server.stub_config.rate_limit_rate = 1.0
+
+        with self.assertRaises(HTTPError) as raised:
+            self.client.get('/sets')
+
+        self.assertEqual(raised.exception.code, 429)
+        self.assertEqual(self.server.stub_config.stats['requests'], 3)
+
+    def test_client_errors_are_not_retried(self):
+        with self.assertRaises(HTTPError) as raised:
+            self.client.get('/cards/search', {'q': ''})
+
+        self.assertEqual(raised.exception.code, 404)
+        self.assertEqual(self.server.stub_config.stats['requests'], 1)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch('users.scryfall.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('test', failure_threshold=2, reset_seconds=30)
+
+    def open(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open)
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker.allow())
+
+    def test_lets_one_trial_through_after_reset_seconds(self):
+        self.open()
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertFalse(self.breaker.is_open)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_trial_reopens_for_another_period(self):
+        self.open()
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+
+    def test_abandoned_trial_allows_another(self):
+        self.open()
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.abandon()
+        self.assertTrue(self.breaker.allow())
+
+
+class CachedSearchTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.server, base_url = start_stub_in_thread(latency_ms=0, jitter_ms=0, seed=1)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        settings_override = override_settings(SCRYFALL_API_BASE=base_url, RATELIMIT_DB_PATH=f'{directory}/ratelimit.sqlite3')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        ratelimit._local.connection = None
+        self.addCleanup(setattr, ratelimit._local, 'connection', None)
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_serves_fresh_and_stale_entries_from_the_cache(self):
+        stats = self.server.stub_config.stats
+        first = scryfall.cached_search({'q': 'bolt'}, 2)
+        self.assertEqual([card['name'] for card in first], ['Bolt', 'Bolt Elemental'])
+        self.assertEqual(scryfall.cached_search({'q': ' BOLT '}, 2), first)
+        self.assertEqual(stats['requests'], 1)
+
+        later = time.time() + settings.SCRYFALL_SEARCH_FRESH_SECONDS + 1
+        with mock.patch('users.scryfall.time.time', return_value=later):
+            self.assertEqual(scryfall.cached_search({'q': 'bolt'}, 2), first)
+        deadline = time.monotonic() + 5
+        while stats['requests'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(stats['requests'], 2)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(RATELIMIT_DB_PATH=f'{directory}/ratelimit.sqlite3')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # La conexion es por hilo: que la siguiente prueba abra su propio fichero.
+        ratelimit._local.connection = None
+        self.addCleanup(setattr, ratelimit._local, 'connection', None)
+        self.now = 1000.0
+        patcher = mock.patch('users.ratelimit.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_allows_up_to_capacity_then_refills(self):
+        bucket = ratelimit.TokenBucket('test', rate=2, capacity=3)
+        self.assertEqual([bucket.consume('a')[0] for _ in range(3)], [True, True, True])
+        self.assertEqual(bucket.consume('a'), (False, 0.5))
+        self.now += 0.5
+        self.assertEqual(bucket.consume('a'), (True, 0.0))
+
+    def test_buckets_are_per_identity(self):
+        bucket = ratelimit.TokenBucket('test', rate=1, capacity=1)
+        self.assertTrue(bucket.consume('a')[0])
+        self.assertFalse(bucket.consume('a')[0])
+        self.assertTrue(bucket.consume('b')[0])
+
+    def test_refill_is_capped_at_capacity(self):
+        bucket = ratelimit.TokenBucket('test', rate=1, capacity=2)
+        bucket.consume('a', cost=2)
+        self.now += 60
+        self.assertTrue(bucket.consume('a', cost=2)[0])
+        self.assertFalse(bucket.consume('a')[0])
+
+    def test_acquire_without_timeout_does_not_wait(self):
+        bucket = ratelimit.TokenBucket('test', rate=1, capacity=1)
+        self.assertTrue(bucket.acquire('a'))
+        with mock.patch('users.ratelimit.time.sleep') as sleep:
+            self.assertFalse(bucket.acquire('a'))
+        sleep.assert_not_called()
+
+
+class RateLimitedViewTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(
+            RATELIMIT_DB_PATH=f'{directory}/ratelimit.sqlite3', SCRYFALL_CLIENT_RATE=0.1, SCRYFALL_CLIENT_BURST=1,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        ratelimit._local.connection = None
+        self.addCleanup(setattr, ratelimit._local, 'connection', None)
+        patcher = mock.patch('users.ratelimit.time.time', return_value=1000.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(CustomUser.objects.create_user(username='ana', password='secret'))
+
+    def test_search_answers_429_with_retry_after_once_the_bucket_is_empty(self):
+        self.assertEqual(self.client.get('/users/scryfall/search/', {'q': 'ab'}).json(), {'results': []})
+        response = self.client.get('/users/scryfall/search/', {'q': 'ab'})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(response.json()['results'], [])
+
+
+class CardImageTests(TestCase):
+    url = 'https://cards.scryfall.io/normal/front/a/b/ab.jpg'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings_override = override_settings(
+            CARD_IMAGE_CACHE_DIR=f'{self.directory}/images',
+            CARD_IMAGE_FETCHER='users.images.placeholder_fetcher',
+            RATELIMIT_DB_PATH=f'{self.directory}/ratelimit.sqlite3',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        ratelimit._local.connection = None
+        self.addCleanup(setattr, ratelimit._local, 'connection', None)
+        self.client.force_login(CustomUser.objects.create_user(username='ana', password='secret'))
+
+    def cached_files(self):
+        return sorted(path.name for path in Path(self.directory, 'images').rglob('*') if path.is_file())
+
+    def test_serves_thumbnails_and_answers_304_for_the_same_etag(self):
+        response = self.client.get('/users/card_image/', {'url': self.url})
+
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/jpeg'))
+        response = self.client.get('/users/card_image/', {'url': self.url}, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_query_strings_share_one_cached_image(self):
+        with mock.patch('users.images.placeholder_fetcher', wraps=images.placeholder_fetcher) as fetcher:
+            for query in ('?1562702127', '?1700000000', '#x'):
+                self.assertEqual(self.client.get('/users/card_image/', {'url': self.url + query}).status_code, 200)
+
+        fetcher.assert_called_once_with(self.url)
+        self.assertEqual(len(self.cached_files()), 2)
+
+    def test_rejects_other_hosts_anonymous_clients_and_oversized_images(self):
+        self.assertEqual(self.client.get('/users/card_image/', {'url': 'https://example.com/a.jpg'}).status_code, 400)
+        with override_settings(CARD_IMAGE_MAX_BYTES=100):
+            self.assertEqual(self.client.get('/users/card_image/', {'url': self.url}).status_code, 502)
+        self.assertEqual(self.cached_files(), [])
+        self.client.logout()
+        self.assertEqual(self.client.get('/users/card_image/', {'url': self.url}).status_code, 302)
+
+    @override_settings(CARD_IMAGE_CLIENT_RATE=0.01, CARD_IMAGE_CLIENT_BURST=2)
+    def test_is_rate_limited_per_client(self):
+        statuses = [self.client.get('/users/card_image/', {'url': self.url}).status_code for _ in range(3)]
+
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_prefetch_warms_the_cache(self):
+        Card.objects.create(name='Opt', image_url=f'{self.url}?1562702127')
+        Card.objects.create(name='Shock', image_url='https://example.com/shock.jpg')
+
+        call_command('prefetch_card_images', sizes='small', stdout=io.StringIO())
+
+        self.assertTrue(images.is_cached(self.url, 'small'))
+        self.assertEqual(len(self.cached_files()), 2)
+
+
+class StaticBuildTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Comprimir con brotli tarda: se construye una sola vez para toda la clase.
+        directory = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(
+            STATIC_ROOT=directory,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'my_django_project.staticfiles.CompressedManifestStaticFilesStorage'},
+            },
+        )
+        settings_override.enable()
+        cls.addClassCleanup(settings_override.disable)
+        call_command('build_static', stdout=io.StringIO())
+
+    def built(self, name):
+        return staticfiles_storage.stored_name(name)
+
+    def test_collects_referenced_files_with_hashes_and_compressed_copies(self):
+        stylesheet = self.built('css/bootstrap.min.css')
+
+        self.assertRegex(stylesheet, r'^css/bootstrap\.min\.[0-9a-f]{12}\.css$')
+        self.assertTrue(staticfiles_storage.exists(f'{stylesheet}.gz'))
+        self.assertFalse(staticfiles_storage.exists('css/bootstrap.css'))
+        with Image.open(staticfiles_storage.path(self.built('img/logo.png'))) as logo:
+            self.assertLessEqual(max(logo.size), 128)
+
+    def test_serve_static_negotiates_encoding_and_caching(self):
+        stylesheet = self.built('css/style.css')
+        factory = RequestFactory()
+
+        response = serve_static(factory.get('/', headers={'Accept-Encoding': 'gzip, deflate'}), stylesheet)
+        self.assertEqual(
+            (response['Content-Encoding'], response['Content-Type'], response['Cache-Control']),
+            ('gzip', 'text/css', 'public, max-age=31536000, immutable'),
+        )
+        response.close()
+        response = serve_static(
+            factory.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response['ETag']}), stylesheet,
+        )
+        self.assertEqual(response.status_code, 304)
+        response = serve_static(factory.get('/'), 'css/style.css')
+        self.assertEqual((response.get('Content-Encoding'), response['Cache-Control']), (None, 'public, max-age=3600'))
+        response.close()
+        with self.assertRaises(Http404):
+            serve_static(factory.get('/'), '../settings.py')
+
+
+class CachedListViewTests(TestCase):
+    def setUp(self):
+        caches['fragments'].clear()
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(username='owner', password='x', transaction_preference='trade_and_sell')
+        self.seeker = CustomUser.objects.create_user(username='seeker', password='x', transaction_preference='trade_only')
+        self.card = Card.objects.create(name='Opt', price=Decimal('1.00'), usd_price=Decimal('1.00'))
+        self.owned = UserCard.objects.create(user=self.owner, card=self.card, is_owned=True, quantity_owned=2)
+        self.wanted = UserCard.objects.create(user=self.seeker, card=self.card, is_owned=False, quantity_required=1)
+
+    def test_search_results_render_matching_rows(self):
+        self.client.force_login(self.seeker)
+        response = self.client.get('/users/search_card_matches/', {'card_name': 'opt'})
+        self.assertContains(response, 'owner -')
+        self.assertContains(response, f'name="card_id" value="{self.card.pk}"', count=2)
+
+        self.client.force_login(self.owner)
+        response = self.client.get('/users/search_users_with_desired_card/', {'card_name': 'OPT'})
+        self.assertContains(response, 'seeker -')
+        self.assertEqual(self.client.get('/users/search_users_with_desired_card/').status_code, 200)
+
+    def test_card_list_rows_follow_quantity_and_price_changes(self):
+        self.client.force_login(self.owner)
+        self.assertContains(self.client.get('/users/cards/'), 'Opt - Precio: $1.00 - Cantidad: 2')
+
+        self.client.post(f'/users/edit_card_quantity/{self.card.pk}/', {'edit_card_quantity': 3})
+        self.card.price = Decimal('2.50')
+        self.card.save(update_fields=['price'])
+
+        self.assertContains(self.client.get('/users/cards/'), 'Opt - Precio: $2.50 - Cantidad: 3')
+
+    def test_trade_rows_follow_price_changes(self):
+        self.client.force_login(self.seeker)
+        url = f'/users/view_user_cards/?user_id={self.owner.pk}'
+        self.assertContains(self.client.get(url), 'Valor: $1.00')
+
+        self.card.usd_price = Decimal('4.00')
+        self.card.save()
+
+        self.assertContains(self.client.get(url), 'Valor: $4.00')
+
+    def test_every_listed_price_field_bumps_the_rows(self):
+        for field in Card.LISTED_FIELDS:
+            before = UserCard.objects.get(pk=self.owned.pk).updated_at
+            setattr(self.card, field, 'Opt' if field == 'name' else Decimal('9.99'))
+            self.card.save(update_fields=[field])
+            self.assertGreater(UserCard.objects.get(pk=self.owned.pk).updated_at, before, field)
+
+        before = UserCard.objects.get(pk=self.owned.pk).updated_at
+        self.card.save(update_fields=['image_url'])
+        self.assertEqual(UserCard.objects.get(pk=self.owned.pk).updated_at, before)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='ana', password='secret')
+        self.other = CustomUser.objects.create_user(username='luis', password='secret')
+        self.client.force_login(self.user)
+
+    def test_cursor_pagination_walks_every_row_once(self):
+        Card.objects.bulk_create([Card(name=f'Card {number}') for number in range(5)])
+
+        names = []
+        url = '/api/cards/?format=json&page_size=2&fields=id,name'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            self.assertTrue(all(set(row) == {'id', 'name'} for row in page['results']))
+            names += [row['name'] for row in page['results']]
+            url = page['next']
+
+        self.assertEqual(names, [f'Card {number}' for number in reversed(range(5))])
+
+    def test_lists_answer_304_until_a_row_changes(self):
+        card = Card.objects.create(name='Opt')
+        UserCard.objects.create(user=self.user, card=card, quantity_owned=1)
+        url = '/api/user-cards/?format=json'
+
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        UserCard.objects.create(user=self.user, card=card, is_owned=False, quantity_required=1)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+
+        self.assertEqual((response.status_code, len(response.json()['results'])), (200, 2))
+
+    def test_only_the_receiver_answers_a_pending_exchange(self):
+        exchange = Exchange.objects.create(sender=self.user, receiver=self.other, sender_cards='', receiver_cards='Opt')
+        url = f'/api/exchanges/{exchange.pk}/?format=json'
+
+        self.assertEqual(self.client.patch(url, {'status': 'accepted'}, content_type='application/json').status_code, 403)
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.patch(url, {'status': 'accepted'}, content_type='application/json').json()['status'], 'accepted')
+        self.assertEqual(self.client.patch(url, {'status': 'rejected'}, content_type='application/json').status_code, 400)
+
+    def test_catalog_is_read_only_for_regular_users(self):
+        response = self.client.post('/api/cards/?format=json', {'name': 'Opt'}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 403)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='ana', password='secret')
+        self.client.force_login(self.user)
+        self.bolt = Card.objects.create(name='Lightning Bolt', set_code='M10', collector_number='146', price=Decimal('1.50'))
+        self.opt = Card.objects.create(name='Opt', set_code='XLN', collector_number='65')
+        UserCard.objects.create(
+            user=self.user, card=self.bolt, is_owned=True, quantity_owned=3, listing_intent='trade', condition='lightly_played',
+            asking_price=Decimal('2.00'),
+        )
+        UserCard.objects.create(user=self.user, card=self.opt, is_owned=False, quantity_required=2)
+
+    def export(self, **params):
+        response = self.client.get('/users/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_export_round_trips_through_the_importer(self):
+        response, content = self.export(cards='all')
+
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertIn('attachment; filename="coleccion-ana-all-', response['Content-Disposition'])
+        rows = views._parse_moxfield_csv(io.BytesIO(content.encode('utf-8')))
+        self.assertEqual(
+            [(row['card_name'], row['quantity'], row['card_type']) for row in rows],
+            [('Lightning Bolt', 3, 'owned'), ('Opt', 2, 'desired')],
+        )
+
+    def test_ndjson_export_of_the_wishlist(self):
+        _, content = self.export(format='ndjson', cards='desired')
+
+        lines = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([(line['name'], line['quantity'], line['is_owned']) for line in lines], [('Opt', 2, False)])
+
+    def test_rejects_unknown_formats(self):
+        self.assertEqual(self.client.get('/users/export/', {'format': 'xml'}).status_code, 400)
+
+
+class CollectionDeltaTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='collector', password='x')
+        self.sol_ring = Card.objects.create(name='Sol Ring', set_code='C21', set_name='Commander 2021', scryfall_id='sol')
+        self.bolt = Card.objects.create(name='Lightning Bolt', set_code='M10', set_name='Magic 2010', scryfall_id='bolt')
+        self.near_mint = UserCard.objects.create(
+            user=self.user, card=self.sol_ring, is_owned=True, quantity_owned=2,
+            condition='near_mint', listing_intent='sell', asking_price=Decimal('5.00'),
+        )
+        self.damaged = UserCard.objects.create(
+            user=self.user, card=self.sol_ring, is_owned=True, quantity_owned=1,
+            condition='damaged', listing_intent='trade', asking_price=Decimal('1.00'),
+        )
+        UserCard.objects.create(user=self.user, card=self.bolt, is_owned=True, quantity_owned=4, listing_intent='trade')
+
+    def delta(self, text):
+        return views._collection_delta(self.user, views._parse_moxfield_csv(io.BytesIO(text.encode('utf-8'))))
+
+    def export(self):
+        return ''.join(exports.moxfield_csv(exports._rows(self.user, 'owned')))
+
+    def test_unchanged_export_has_no_changes(self):
+        delta = self.delta(self.export())
+        self.assertEqual((delta['added'], delta['changed'], delta['removed']), ([], [], []))
+        self.assertEqual(delta['unchanged'], 3)
+
+    def test_copies_with_other_condition_are_not_merged(self):
+        delta = self.delta(
+            'Count,Tradelist Count,Name,Edition,Condition,Purchase Price\n'
+            '2,0,Sol Ring,c21,Near Mint,5.00\n'
+            '3,3,Sol Ring,c21,Damaged,1.00\n'
+            '4,4,Lightning Bolt,m10,Near Mint,\n'
+        )
+        changed, = delta['changed']
+        self.assertEqual((changed['ids'], changed['current_quantity'], changed['quantity']), ([self.damaged.pk], 1, 3))
+        self.assertEqual((delta['added'], delta['removed']), ([], []))
+
+    def test_new_condition_is_a_new_row(self):
+        delta = self.delta(
+            'Count,Tradelist Count,Name,Edition,Condition,Purchase Price\n'
+            '2,0,Sol Ring,c21,Near Mint,5.00\n'
+            '1,1,Sol Ring,c21,Lightly Played,1.00\n'
+            '4,4,Lightning Bolt,m10,Near Mint,\n'
+        )
+        added, = delta['added']
+        self.assertEqual((added['card_name'], added['condition'], added['quantity']), ('Sol Ring', 'lightly_played', 1))
+        removed, = delta['removed']
+        self.assertEqual(removed['ids'], [self.damaged.pk])
+
+    def test_columns_missing_from_the_csv_match_any_copy(self):
+        delta = self.delta('Count,Name,Edition\n3,Sol Ring,c21\n4,Lightning Bolt,Magic 2010\n')
+        self.assertEqual((delta['added'], delta['changed'], delta['removed']), ([], [], []))
+
+
+    def test_sync_preview_then_apply(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('collection.csv', (
+            'Count,Tradelist Count,Name,Edition,Condition,Purchase Price\n'
+            '5,0,Sol Ring,c21,Near Mint,5.00\n'
+        ).encode('utf-8'))
+
+        response = self.client.post('/users/upload_file/', {'mode': 'sync', 'file': upload})
+
+        delta = response.context['delta']
+        self.assertEqual((len(delta['changed']), len(delta['removed']), delta['added']), (1, 2, []))
+        response = self.client.post('/users/upload_file/', {
+            'action': 'apply_delta', 'delta_payload': response.context['delta_payload'],
+        })
+        self.assertRedirects(response, '/users/cards/', fetch_redirect_response=False)
+        self.assertEqual(
+            list(UserCard.objects.filter(user=self.user).values_list('pk', 'quantity_owned')),
+            [(self.near_mint.pk, 5)],
+        )
+
+    def test_apply_refuses_a_stale_preview(self):
+        self.client.force_login(self.user)
+        payload = json.dumps({'version': 'stale', 'added': [], 'changed': [], 'removed': [
+            {'ids': [self.damaged.pk]},
+        ]})
+
+        response = self.client.post('/users/upload_file/', {'action': 'apply_delta', 'delta_payload': payload})
+
+        self.assertRedirects(response, '/users/upload_file/', fetch_redirect_response=False)
+        self.assertTrue(UserCard.objects.filter(pk=self.damaged.pk).exists())
+
+
+class CardIndexTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = f'{directory}/card_index.bin'
+        count = cardindex.build(self.path, [
+            (1, 'Lightning Bolt', 'M10', 'Magic 2010', 'bolt-m10'),
+            (2, 'Lightning Bolt', 'LEA', 'Limited Edition Alpha', 'bolt-lea'),
+            (3, 'Lightning Helix', 'RAV', 'Ravnica', 'helix'),
+            (4, 'Jötun Grunt', '', None, None),
+            (5, '!!!', 'XXX', 'Nothing', 'ignored'),
+        ])
+        self.assertEqual(count, 4)
+        self.index = cardindex.CardIndex(self.path)
+        self.addCleanup(self.index.close)
+
+    def test_lookup_normalizes_the_name_and_filters_by_set(self):
+        self.assertEqual([match.card_id for match in self.index.lookup('lightning bolt!')], [1, 2])
+        self.assertEqual([match.card_id for match in self.index.lookup('Lightning Bolt', 'm10')], [1])
+        self.assertEqual([match.card_id for match in self.index.lookup('Lightning Bolt', 'Limited Edition Alpha')], [2])
+        self.assertEqual(self.index.lookup('Jötun Grunt')[0].name, 'Jötun Grunt')
+        self.assertEqual(self.index.lookup('Counterspell'), [])
+        self.assertEqual(self.index.lookup(''), [])
+
+    def test_by_scryfall_id(self):
+        match = self.index.by_scryfall_id('bolt-lea')
+        self.assertEqual((match.card_id, match.set_code, match.set_name), (2, 'LEA', 'Limited Edition Alpha'))
+        self.assertIsNone(self.index.by_scryfall_id('missing'))
+
+    def test_complete_returns_distinct_names(self):
+        self.assertEqual(self.index.complete('light'), ['Lightning Bolt', 'Lightning Helix'])
+        self.assertEqual(self.index.complete('light', limit=1), ['Lightning Bolt'])
+        self.assertEqual(self.index.complete('zzz'), [])
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as handle:
+            handle.write(b'not an index' * 10)
+        with self.assertRaises(ValueError):
+            cardindex.CardIndex(self.path)
+
+
+class AutocompleteViewTests(TestCase):
+    def setUp(self):
+        self.client.force_login(CustomUser.objects.create_user(username='ana', password='secret'))
+        Card.objects.create(name='Lightning Bolt', set_code='M10')
+        Card.objects.create(name='Lightning Helix', set_code='RAV')
+
+    def test_completes_from_the_index_built_by_the_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        call_command('build_card_index', path=f'{directory}/card_index.bin', stdout=io.StringIO())
+        index = cardindex.CardIndex(f'{directory}/card_index.bin')
+        self.addCleanup(index.close)
+        Card.objects.create(name='Lightning Greaves')
+
+        with mock.patch('users.cardindex.get_index', return_value=index):
+            response = self.client.get('/users/cards/autocomplete/', {'q': 'light'})
+
+        self.assertEqual(response.json(), {'results': ['Lightning Bolt', 'Lightning Helix']})
+        self.assertEqual(response['Cache-Control'], 'private, max-age=300')
+
+    @mock.patch('users.cardindex.get_index', return_value=None)
+    def test_falls_back_to_the_database(self, get_index):
+        self.assertEqual(self.client.get('/users/cards/autocomplete/', {'q': 'lightning h'}).json(), {'results': ['Lightning Helix']})
+        self.assertEqual(self.client.get('/users/cards/autocomplete/', {'q': 'l'}).json(), {'results': []})
+
+
+@override_settings(AUTHENTICATION_BACKENDS=['users.auth.CachedModelBackend'])
+class CachedModelBackendTests(TestCase):
+    def setUp(self):
+        caches[settings.AUTH_USER_CACHE_ALIAS].clear()
+        self.user = CustomUser.objects.create_user(username='ana', password='secret')
+        self.backend = CachedModelBackend()
+
+    def test_second_lookup_is_served_from_the_cache(self):
+        self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk).username, 'ana')
+
+    def test_saving_or_deleting_the_user_invalidates_the_entry(self):
+        self.backend.get_user(self.user.pk)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+        user_id = self.user.pk
+        self.user.delete()
+        self.assertIsNone(self.backend.get_user(user_id))
+
+    def test_authenticated_pages_skip_the_user_table(self):
+        self.client.force_login(self.user)
+        self.client.get('/users/cards/')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/users/cards/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if 'FROM "users_customuser"' in query['sql']])
+
+
+class AsyncScryfallSearchViewTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.server, base_url = start_stub_in_thread(latency_ms=0, jitter_ms=0, seed=1)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        settings_override = override_settings(
+            SCRYFALL_API_BASE=base_url,
+            SCRYFALL_RETRY_BACKOFF_SECONDS=0,
+            RATELIMIT_DB_PATH=f'{directory}/ratelimit.sqlite3',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        ratelimit._local.connection = None
+        self.addCleanup(setattr, ratelimit._local, 'connection', None)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = CustomUser.objects.create_user(username='ana', password='secret')
+
+    async def test_searches_through_the_async_client_and_caches_the_result(self):
+        await self.async_client.aforce_login(self.user)
+
+        short = await self.async_client.get('/users/scryfall/search/', {'q': 'bo'})
+        first = await self.async_client.get('/users/scryfall/search/', {'q': 'bolt'})
+        second = await self.async_client.get('/users/scryfall/search/', {'q': 'Bolt'})
+
+        self.assertEqual(short.json(), {'results': []})
+        self.assertEqual([card['name'] for card in first.json()['results']], ['Bolt', 'Bolt Elemental', 'Bolt Titan', 'Bolt Ritual'])
+        self.assertEqual(first.json()['results'][0]['set_code'], 'LEA')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(self.server.stub_config.stats['requests'], 1)
+
+    async def test_upstream_errors_become_json_errors(self):
+        self.server.stub_config.error_rate = 1.0
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get('/users/scryfall/search/', {'q': 'bolt'})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['results'], [])
+
+
+class DecklistParseTests(SimpleTestCase):
+    def test_recognises_common_formats(self):
+        lines = [
+            'Deck',
+            '4 Lightning Bolt (M10) 146',
+            '2x Counterspell [MH2] *F*',
+            'Opt',
+            '',
+            'Sideboard',
+            'SB: 3 Duress',
+        ]
+        entries = list(decklist.parse(lines))
+        self.assertEqual(
+            [(entry.quantity, entry.name, entry.set_code, entry.collector_number) for entry in entries],
+            [(4, 'Lightning Bolt', 'M10', '146'), (2, 'Counterspell', 'MH2', ''), (1, 'Opt', '', ''), (3, 'Duress', '', '')],
+        )
+        self.assertEqual([entry.line_number for entry in entries], [2, 3, 4, 7])
+
+    def test_skips_about_and_maybeboard_blocks_and_reports_unreadable_lines(self):
+        errors = []
+        lines = ['About', 'Name My Deck', 'Deck', '1 Opt', '12345', 'Maybeboard', '1 Brainstorm']
+        entries = list(decklist.parse(lines, errors))
+        self.assertEqual([entry.name for entry in entries], ['Opt'])
+        self.assertEqual(errors, [(5, '12345')])
+
+    def test_caps_quantity(self):
+        entry, = decklist.parse([f'{decklist.MAX_QUANTITY * 10} Island'])
+        self.assertEqual(entry.quantity, decklist.MAX_QUANTITY)
+
+
+@mock.patch('users.cardindex.get_index', return_value=None)
+class DecklistResolveTests(TestCase):
+    def test_groups_repeated_lines_and_creates_missing_cards(self, get_index):
+        entries = decklist.parse(['2 Lightning Bolt (M10) 146', '1 lightning bolt (M10) 146', '1 Brand New Card'])
+        resolved = decklist.resolve(entries)
+        self.assertEqual(
+            sorted((card.name, card.set_code, quantity, lines) for card, quantity, lines in resolved),
+            [('Brand New Card', '', 1, [3]), ('Lightning Bolt', 'M10', 3, [1, 2])],
+        )
+        self.assertEqual(Card.objects.count(), 2)
+        self.assertTrue(all(card.pk for card, _, _ in resolved))
+
+    def test_prefers_existing_printings(self, get_index):
+        placeholder = Card.objects.create(name='Opt', set_code='')
+        Card.objects.create(name='Opt', set_code='XLN', collector_number='65')
+        enriched = Card.objects.create(name='Opt', set_code='XLN', collector_number='65', scryfall_id='opt-xln')
+        exact = Card.objects.create(name='Opt', set_code='DOM', collector_number='60')
+        Card.objects.create(name='Opt', set_code='DOM', collector_number='60a', scryfall_id='opt-dom')
+
+        resolved = decklist.resolve(decklist.parse(['1 Opt', '1 Opt (XLN)', '1 Opt (DOM) 60']))
+        self.assertEqual([card.pk for card, _, _ in resolved], [placeholder.pk, enriched.pk, exact.pk])
+        self.assertEqual(Card.objects.count(), 5)
+
+    def test_uses_oldest_resolved_printing_once_placeholders_are_merged(self, get_index):
+        oldest = Card.objects.create(name='Opt', set_code='XLN', scryfall_id='opt-xln')
+        Card.objects.create(name='Opt', set_code='DOM', scryfall_id='opt-dom')
+        (card, quantity, _), = decklist.resolve(decklist.parse(['4 Opt']))
+        self.assertEqual((card.pk, quantity), (oldest.pk, 4))
+
+
+@mock.patch('users.cardindex.get_index', return_value=None)
+class DecklistImportViewTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='collector', password='x')
+        self.client.force_login(self.user)
+
+    def test_add_to_owned_cards_sums_into_the_collection(self, get_index):
+        response = self.client.post('/users/add_to_owned_cards/', {'decklist': '4 Lightning Bolt (M10) 146\n1 Opt\n'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'success')
+        self.assertEqual((response.json()['created'], response.json()['updated']), (2, 0))
+
+        response = self.client.post('/users/add_to_owned_cards/', {'decklist': '2 Lightning Bolt (M10) 146'})
+        self.assertEqual((response.json()['created'], response.json()['updated']), (0, 1))
+        self.assertEqual(
+            UserCard.objects.get(user=self.user, card__name='Lightning Bolt').quantity_owned, 6,
+        )
+
+    def test_add_to_owned_cards_requires_login(self, get_index):
+        self.client.logout()
+        response = self.client.post('/users/add_to_owned_cards/', {'decklist': '1 Opt'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_add_to_desired_cards_accepts_extracted_data(self, get_index):
+        extracted = json.dumps([{'cantidad': '3', 'nombre_carta': 'Opt'}])
+        response = self.client.post('/users/add_to_desired_cards/', {'extracted_data': extracted})
+        self.assertEqual(response.json()['status'], 'success')
+        user_card = UserCard.objects.get(user=self.user)
+        self.assertEqual((user_card.is_owned, user_card.quantity_required, user_card.card.name), (False, 3, 'Opt'))
+
+    def test_import_cards_redirects_to_the_collection(self, get_index):
+        response = self.client.post('/users/import_cards/', {'decklist': 'Deck\n1 Opt\nSideboard\n2 Duress'})
+        self.assertRedirects(response, '/users/cards/', fetch_redirect_response=False)
+        self.assertEqual(Card.objects.count(), 2)
+
+
+class ValuationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fairness_score(self):
+        self.assertEqual(fairness_score(Decimal('10.00'), Decimal('10.00')), Decimal('1.000'))
+        self.assertEqual(fairness_score(Decimal('5.00'), Decimal('20.00')), Decimal('0.250'))
+        self.assertEqual(fairness_score(Decimal('0.00'), Decimal('3.00')), Decimal('0.000'))
+        self.assertEqual(fairness_score(Decimal('0.00'), Decimal('0.00')), Decimal('1.000'))
+
+    def test_line_value_applies_condition_unless_there_is_an_asking_price(self):
+        prices = CardPrices('Opt', Decimal('0.10'), Decimal('10.00'), Decimal('20.00'), None)
+        self.assertEqual(
+            line_value(prices, 'moderately_played'),
+            {'usd': Decimal('7.50'), 'usd_foil': Decimal('15.00'), 'eur': None},
+        )
+        self.assertEqual(line_value(prices, 'damaged', Decimal('1.25'))['usd'], Decimal('1.25'))
+        no_usd = CardPrices('Opt', Decimal('2.00'), None, None, None)
+        self.assertEqual(line_value(no_usd)['usd'], Decimal('2.00'))
+
+    def test_value_exchange_stores_both_sides(self):
+        sender = CustomUser.objects.create_user(username='sender', password='x')
+        receiver = CustomUser.objects.create_user(username='receiver', password='x')
+        offered = Card.objects.create(name='Opt', usd_price=Decimal('4.00'))
+        wanted = Card.objects.create(name='Sol Ring', usd_price=Decimal('10.00'))
+        UserCard.objects.create(user=sender, card=offered, is_owned=True, quantity_owned=1, condition='lightly_played')
+        UserCard.objects.create(user=receiver, card=wanted, is_owned=True, quantity_owned=1, asking_price=Decimal('8.00'))
+        exchange = Exchange.objects.create(sender=sender, receiver=receiver, sender_cards='', receiver_cards='Sol Ring')
+
+        valuation = value_exchange(exchange, Q(card=offered), Q(card=wanted))
+        exchange.refresh_from_db()
+        self.assertEqual((exchange.sender_value, exchange.receiver_value), (Decimal('3.60'), Decimal('8.00')))
+        self.assertEqual(exchange.fairness_score, Decimal('0.450'))
+        self.assertEqual(exchange.valuation['fairness_score'], '0.450')
+        self.assertEqual([line['name'] for line in valuation.sender_lines], ['Opt'])
+
+        self.client.force_login(receiver)
+        self.assertContains(
+            self.client.get('/users/pending_transactions/'), 'Valor: $3.60 por $8.00 (equidad 0.450)',
+        )
+
+    def test_value_exchange_falls_back_to_the_catalog_card(self):
+        sender = CustomUser.objects.create_user(username='sender', password='x')
+        receiver = CustomUser.objects.create_user(username='receiver', password='x')
+        wanted = Card.objects.create(name='Sol Ring', usd_price=Decimal('10.00'))
+        exchange = Exchange.objects.create(sender=sender, receiver=receiver, sender_cards='', receiver_cards='Sol Ring')
+
+        value_exchange(exchange, Q(pk__in=[]), Q(card=wanted), receiver_card_id=wanted.pk)
+        self.assertEqual((exchange.sender_value, exchange.receiver_value), (Decimal('0.00'), Decimal('10.00')))
+        self.assertEqual(exchange.fairness_score, Decimal('0.000'))
+
+
+@mock.patch('users.cardindex.get_index', return_value=None)
+class ReconcilePlaceholderCardsTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='collector', password='x')
+
+    def reconcile(self, *args):
+        call_command('reconcile_placeholder_cards', '--pause', '0', *args, stdout=io.StringIO())
+
+    def test_merges_placeholders_into_the_oldest_resolved_printing(self, get_index):
+        placeholder = Card.objects.create(name='Lightning Bolt', set_code='')
+        other = Card.objects.create(name='lightning bolt', set_code=None)
+        resolved = Card.objects.create(name='Lightning Bolt', set_code='M10', scryfall_id='bolt-m10')
+        Card.objects.create(name='Lightning Bolt', set_code='LEA', scryfall_id='bolt-lea')
+        first = UserCard.objects.create(user=self.user, card=placeholder, is_owned=True, quantity_owned=2)
+        UserCard.objects.create(user=self.user, card=other, is_owned=True, quantity_owned=1)
+
+        self.reconcile()
+        self.assertFalse(Card.objects.filter(pk__in=[placeholder.pk, other.pk]).exists())
+        self.assertEqual(
+            list(UserCard.objects.values_list('pk', 'card_id', 'quantity_owned')),
+            [(first.pk, resolved.pk, 3)],
+        )
+        self.client.force_login(self.user)
+        response = self.client.post(f'/users/edit_card_quantity/{resolved.pk}/', {'edit_card_quantity': '4'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(UserCard.objects.get(pk=first.pk).quantity_owned, 4)
+
+    def test_sums_into_the_row_already_on_the_resolved_card(self, get_index):
+        placeholder = Card.objects.create(name='Opt', set_code='')
+        resolved = Card.objects.create(name='Opt', set_code='XLN', scryfall_id='opt-xln')
+        owned = UserCard.objects.create(user=self.user, card=resolved, is_owned=True, quantity_owned=2)
+        UserCard.objects.create(user=self.user, card=placeholder, is_owned=True, quantity_owned=3)
+        desired = UserCard.objects.create(user=self.user, card=placeholder, is_owned=False, quantity_required=1)
+        other_user = CustomUser.objects.create_user(username='rival', password='x')
+        UserCard.objects.create(user=other_user, card=resolved, is_owned=True, quantity_owned=4)
+
+        self.reconcile()
+        self.assertEqual(
+            list(UserCard.objects.filter(user=self.user).order_by('pk').values_list('pk', 'card_id', 'is_owned')),
+            [(owned.pk, resolved.pk, True), (desired.pk, resolved.pk, False)],
+        )
+        owned.refresh_from_db()
+        self.assertEqual(owned.quantity_owned, 5)
+        self.assertEqual(UserCard.objects.get(user=other_user).quantity_owned, 4)
+
+    def test_keeps_the_oldest_placeholder_when_nothing_is_resolved(self, get_index):
+        oldest = Card.objects.create(name='Opt', set_code='')
+        newer = Card.objects.create(name='OPT', set_code='')
+        user_card = UserCard.objects.create(user=self.user, card=newer, is_owned=True, quantity_owned=1)
+
+        self.reconcile()
+        self.assertEqual(list(Card.objects.values_list('pk', flat=True)), [oldest.pk])
+        user_card.refresh_from_db()
+        self.assertEqual(user_card.card_id, oldest.pk)
+
+    def test_dry_run_changes_nothing(self, get_index):
+        placeholder = Card.objects.create(name='Opt', set_code='')
+        Card.objects.create(name='Opt', set_code='XLN', scryfall_id='opt-xln')
+        UserCard.objects.create(user=self.user, card=placeholder, is_owned=True, quantity_owned=1)
+
+        self.reconcile('--dry-run')
+        self.assertEqual(Card.objects.count(), 2)
+        self.assertTrue(UserCard.objects.filter(card=placeholder).exists())
+
+
+class AdminChangeListTests(TestCase):
+    def setUp(self):
+        self.admin_user = CustomUser.objects.create_superuser(username='root', password='x', email='root@example.com')
+        self.collector = CustomUser.objects.create_user(username='collector', password='x')
+        self.client.force_login(self.admin_user)
+        self.cards = [Card.objects.create(name=name) for name in ('Opt', 'Ponder', 'Preordain')]
+
+    def test_card_changelist_pages_by_cursor(self):
+        with mock.patch.object(admin.CardAdmin, 'list_per_page', 2):
+            response = self.client.get('/admin/users/card/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([card.pk for card in response.context['cl'].result_list], [self.cards[2].pk, self.cards[1].pk])
+            self.assertContains(response, f'?{admin.CURSOR_VAR}={self.cards[1].pk}')
+
+            response = self.client.get('/admin/users/card/', {admin.CURSOR_VAR: self.cards[1].pk})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([card.pk for card in response.context['cl'].result_list], [self.cards[0].pk])
+            self.assertIsNone(response.context['cl'].next_cursor)
+
+    def test_search_uses_username_and_card_prefix(self):
+        owned = UserCard.objects.create(user=self.collector, card=self.cards[0], is_owned=True, quantity_owned=1)
+        UserCard.objects.create(user=self.admin_user, card=self.cards[1], is_owned=True, quantity_owned=1)
+
+        for term in ('collector', 'op'):
+            response = self.client.get('/admin/users/usercard/', {'q': term})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([user_card.pk for user_card in response.context['cl'].result_list], [owned.pk])
+
+    def test_notification_and_exchange_changelists(self):
+        Notification.objects.create(sender=self.collector, receiver=self.admin_user, message='Hola')
+        Exchange.objects.create(sender=self.collector, receiver=self.admin_user)
+
+        for path in ('/admin/users/notification/', '/admin/users/exchange/'):
+            response = self.client.get(path, {'q': 'collector'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['cl'].result_list), 1)
+            self.assertEqual(len(self.client.get(path, {'q': 'nadie'}).context['cl'].result_list), 0)
@@ -1,7 +1,7 @@
 # filepath: /Users/usuario/Documents/Proyectos python/my_django_project/users/urls.py
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import exports, images, views
 from .views import reject_offer, mark_all_resolved
 
 urlpatterns = [
@@ -13,6 +13,7 @@ urlpatterns = [
     path('register_cards/', views.register_cards, name='register_cards'),  # Nueva ruta
     path('scryfall/search/', views.scryfall_card_search, name='scryfall_card_search'),
     path('search_card/', views.search_card, name='search_card'),
+    path('cards/autocomplete/', views.card_name_autocomplete, name='card_name_autocomplete'),
     path('delete_card/<int:card_id>/', views.delete_card, name='delete_card'),
     path('edit_card_quantity/<int:card_id>/', views.edit_card_quantity, name='edit_card_quantity'),
     path('search_card_matches/', views.search_card_matches, name='search_card_matches'),
@@ -37,4 +38,6 @@ urlpatterns = [
     path('import_cards/', views.import_cards, name='import_cards'),
     path('add_to_desired_cards/', views.create_user_cards_from_txt, name='add_to_desired_cards'),
     path('add_to_owned_cards/', views.add_to_owned_cards, name='add_to_owned_cards'),
+    path('card_image/', images.card_image, name='card_image'),
+    path('export/', exports.export_collection, name='export_collection'),
 ]
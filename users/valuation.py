@@ -0,0 +1,175 @@
+"""
+Valoracion de intercambios en el servidor.
+
+Cada lado de un intercambio se valora con las cartas que su duenio tiene en posesion: el
+`asking_price` del UserCard si lo hay y, si no, el precio de catalogo (USD, o `price` si
+Scryfall no da USD) ajustado por el estado de la carta. Tambien se guardan los valores foil
+y EUR con el mismo ajuste como referencia, pero la equidad se mide en USD:
+
+    fairness_score = min(valor enviado, valor recibido) / max(...)
+
+1 es un cambio equilibrado y 0 uno en el que un lado no vale nada.
+
+Los precios de catalogo se cachean por carta en la cache `default` durante
+`TRADE_PRICE_CACHE_SECONDS`; `Card.save` borra la entrada al cambiar la carta. Asi las
+ofertas de una noche de intercambios solo consultan los UserCard elegidos (una consulta
+para los dos lados) y los precios que aun no estan en cache (otra, por lotes).
+"""
+
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import metrics
+from .models import Card, UserCard
+
+CONDITION_MULTIPLIERS = {
+    'near_mint': Decimal('1.00'),
+    'lightly_played': Decimal('0.90'),
+    'moderately_played': Decimal('0.75'),
+    'heavily_played': Decimal('0.60'),
+    'damaged': Decimal('0.40'),
+}
+CURRENCIES = ('usd', 'usd_foil', 'eur')
+CENT = Decimal('0.01')
+SCORE_PLACES = Decimal('0.001')
+BATCH_SIZE = 500
+
+CardPrices = namedtuple('CardPrices', 'name price usd usd_foil eur')
+
+
+def price_cache_key(card_id):
+    return f'card-prices-{card_id}'
+
+
+def invalidate_card_prices(card_id):
+    cache.delete(price_cache_key(card_id))
+
+
+def card_prices(card_ids):
+    """{card_id: CardPrices} de las cartas pedidas; las que no existen no aparecen."""
+    keys = {price_cache_key(card_id): card_id for card_id in set(card_ids)}
+    prices = {keys[key]: CardPrices(*value) for key, value in cache.get_many(keys).items()}
+    missing = sorted(set(keys.values()) - set(prices))
+    metrics.inc('maki_trade_price_cache_total', len(prices), result='hit')
+    if missing:
+        metrics.inc('maki_trade_price_cache_total', len(missing), result='miss')
+        fresh = {}
+        for start in range(0, len(missing), BATCH_SIZE):
+            rows = Card.objects.filter(pk__in=missing[start:start + BATCH_SIZE]).values_list(
+                'id', 'name', 'price', 'usd_price', 'usd_foil_price', 'eur_price',
+            )
+            fresh.update((row[0], CardPrices(*row[1:])) for row in rows)
+        cache.set_many(
+            {price_cache_key(card_id): tuple(value) for card_id, value in fresh.items()},
+            timeout=settings.TRADE_PRICE_CACHE_SECONDS,
+        )
+        prices.update(fresh)
+    return prices
+
+
+def _adjusted(value, multiplier):
+    return (value * multiplier).quantize(CENT) if value is not None else None
+
+
+def line_value(prices, condition='near_mint', asking_price=None):
+    """Valor de una copia en cada moneda de `CURRENCIES`; USD nunca es None."""
+    multiplier = CONDITION_MULTIPLIERS.get(condition, Decimal('1.00'))
+    usd = prices.usd if prices.usd is not None else prices.price
+    return {
+        'usd': asking_price if asking_price is not None else _adjusted(usd or Decimal('0.00'), multiplier),
+        'usd_foil': _adjusted(prices.usd_foil, multiplier),
+        'eur': _adjusted(prices.eur, multiplier),
+    }
+
+
+def user_card_value(user_card):
+    """`line_value` de un UserCard con su carta ya cargada (`select_related('card')`)."""
+    card = user_card.card
+    prices = CardPrices(card.name, card.price, card.usd_price, card.usd_foil_price, card.eur_price)
+    return line_value(prices, user_card.condition, user_card.asking_price)['usd']
+
+
+def fairness_score(sent, received):
+    if sent == received:
+        return Decimal('1.000')
+    return (min(sent, received) / max(sent, received)).quantize(SCORE_PLACES)
+
+
+class Valuation:
+    def __init__(self, sender_lines, receiver_lines):
+        self.sender_lines = sender_lines
+        self.receiver_lines = receiver_lines
+        self.sender_value = self._total(sender_lines, 'usd')
+        self.receiver_value = self._total(receiver_lines, 'usd')
+        self.fairness_score = fairness_score(self.sender_value, self.receiver_value)
+
+    @staticmethod
+    def _total(lines, currency):
+        return sum((line[currency] or Decimal('0.00') for line in lines), Decimal('0.00'))
+
+    def as_payload(self):
+        def side(lines):
+            return {
+                'cards': [
+                    {key: str(value) if isinstance(value, Decimal) else value for key, value in line.items()}
+                    for line in lines
+                ],
+                'totals': {currency: str(self._total(lines, currency)) for currency in CURRENCIES},
+            }
+
+        return {
+            'sender': side(self.sender_lines),
+            'receiver': side(self.receiver_lines),
+            'fairness_score': str(self.fairness_score),
+        }
+
+
+def value_exchange(exchange, sender_selection, receiver_selection, receiver_card_id=None):
+    """
+    Valora `exchange` con los UserCard poseidos por su emisor que cumplen `sender_selection`
+    y los de su receptor que cumplen `receiver_selection` (dos `Q`), una copia por carta.
+    Si el receptor ya no tiene ninguna, se valora `receiver_card_id` del catalogo en near
+    mint. Guarda los valores en el intercambio y devuelve la `Valuation`.
+    """
+    rows = (
+        UserCard.objects.filter(
+            Q(user_id=exchange.sender_id, is_owned=True) & sender_selection
+            | Q(user_id=exchange.receiver_id, is_owned=True) & receiver_selection
+        )
+        .order_by('id')
+        .values('id', 'user_id', 'card_id', 'condition', 'asking_price')
+    )
+    sides = {exchange.sender_id: {}, exchange.receiver_id: {}}
+    for row in rows:
+        sides[row['user_id']].setdefault(row['card_id'], row)
+    receiver_rows = list(sides[exchange.receiver_id].values())
+    if not receiver_rows and receiver_card_id is not None:
+        receiver_rows = [{'id': None, 'card_id': receiver_card_id, 'condition': 'near_mint', 'asking_price': None}]
+    sender_rows = list(sides[exchange.sender_id].values())
+
+    prices = card_prices(row['card_id'] for row in sender_rows + receiver_rows)
+
+    def lines(side_rows):
+        return [
+            {
+                'user_card_id': row['id'],
+                'card_id': row['card_id'],
+                'name': prices[row['card_id']].name,
+                'condition': row['condition'],
+                **line_value(prices[row['card_id']], row['condition'], row['asking_price']),
+            }
+            for row in side_rows
+            if row['card_id'] in prices
+        ]
+
+    valuation = Valuation(lines(sender_rows), lines(receiver_rows))
+    exchange.sender_value = valuation.sender_value
+    exchange.receiver_value = valuation.receiver_value
+    exchange.fairness_score = valuation.fairness_score
+    exchange.valuation = valuation.as_payload()
+    exchange.save(update_fields=['sender_value', 'receiver_value', 'fairness_score', 'valuation', 'updated_at'])
+    return valuation
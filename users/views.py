@@ -5,50 +5,32 @@ import io
 import json
 import time
 from urllib.error import HTTPError, URLError
-from urllib.parse import urlencode
-from urllib.request import Request, urlopen
 
 from django import forms
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.core.cache import cache
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Max, Q, Sum, Value, When
 from django.http import JsonResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET
 
+from . import cardindex, decklist, metrics, ratelimit, scryfall, scryfall_async
 from .forms import CardForm, UploadFileForm, UserRegisterForm
 from .models import Card, CustomUser, Exchange, Notification, UserCard
+from .exports import TRADE_INTENTS
+from .valuation import card_prices, line_value, value_exchange
 
-SCRYFALL_API_BASE = 'https://api.scryfall.com'
 SCRYFALL_SEARCH_LIMIT = 8
-SCRYFALL_MIN_INTERVAL_SECONDS = 0.35
-SCRYFALL_TIMEOUT_SECONDS = 8
-SCRYFALL_BULK_LOOKUP_INTERVAL_SECONDS = 0.26
-SCRYFALL_HEADERS = {
-    'User-Agent': 'MakiExchange/1.0 (local development contact: desktop-app)',
-    'Accept': 'application/json;q=0.9,*/*;q=0.8',
-}
-
-
-def _client_rate_limit_key(request):
-    if request.user.is_authenticated:
-        return f"scryfall-search-user-{request.user.pk}"
-    forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR', '')
-    client_ip = forwarded_for.split(',')[0].strip() or request.META.get('REMOTE_ADDR', 'anon')
-    return f"scryfall-search-ip-{client_ip}"
-
-
-def _enforce_scryfall_rate_limit(request):
-    now = time.monotonic()
-    cache_key = _client_rate_limit_key(request)
-    previous = cache.get(cache_key)
-    if previous is not None and now - previous < SCRYFALL_MIN_INTERVAL_SECONDS:
-        return False
-    cache.set(cache_key, now, timeout=60)
-    return True
+AUTOCOMPLETE_LIMIT = 10
+# Filas escritas por transaccion al publicar un lote: los demas escritores no esperan al lote entero.
+IMPORT_TRANSACTION_ROWS = 100
 
 
 def _to_decimal(value):
@@ -67,13 +49,6 @@ def _to_int(value, default=1):
         return default
 
 
-def _scryfall_request(path, params):
-    query_string = urlencode(params)
-    request = Request(f"{SCRYFALL_API_BASE}{path}?{query_string}", headers=SCRYFALL_HEADERS)
-    with urlopen(request, timeout=SCRYFALL_TIMEOUT_SECONDS) as response:
-        return json.loads(response.read().decode('utf-8'))
-
-
 def _normalize_scryfall_card(card_data):
     image_uris = card_data.get('image_uris') or {}
     card_faces = card_data.get('card_faces') or []
@@ -98,7 +73,8 @@ def _normalize_scryfall_card(card_data):
 
 def _upsert_card_from_payload(card_payload, asking_price=None):
     scryfall_id = (card_payload.get('scryfall_id') or '').strip()
-    card_name = (card_payload.get('name') or '').strip()
+    # Las filas del CSV enriquecidas traen el nombre en `card_name`.
+    card_name = (card_payload.get('name') or card_payload.get('card_name') or '').strip()
     set_name = (card_payload.get('set_name') or '').strip()
     set_code = (card_payload.get('set_code') or '').strip().upper()
     collector_number = (card_payload.get('collector_number') or '').strip()
@@ -145,7 +121,7 @@ def _upsert_card_from_payload(card_payload, asking_price=None):
                 setattr(card, field, value)
                 updates.append(field)
         if updates:
-            card.save(update_fields=updates)
+            card.save(update_fields=[*updates, 'updated_at'])
         return card
 
     card, _ = Card.objects.get_or_create(
@@ -191,6 +167,20 @@ def _extract_csv_field(row_dict, aliases):
     return ''
 
 
+# Estados de la columna Condition (Moxfield, Deckbox, TCGplayer...) ya normalizados.
+CSV_CONDITIONS = {
+    'mint': 'near_mint', 'nearmint': 'near_mint', 'nm': 'near_mint',
+    'lightlyplayed': 'lightly_played', 'goodlightlyplayed': 'lightly_played', 'excellent': 'lightly_played',
+    'slightlyplayed': 'lightly_played', 'lp': 'lightly_played', 'sp': 'lightly_played',
+    'moderatelyplayed': 'moderately_played', 'played': 'moderately_played', 'good': 'moderately_played',
+    'mp': 'moderately_played',
+    'heavilyplayed': 'heavily_played', 'hp': 'heavily_played',
+    'damaged': 'damaged', 'poor': 'damaged', 'dmg': 'damaged',
+}
+
+PRICE_HEADERS = {'purchaseprice', 'askingprice'}
+
+
 def _parse_moxfield_csv(uploaded_file):
     raw_bytes = uploaded_file.read()
     decoded = raw_bytes.decode('utf-8-sig', errors='replace')
@@ -200,6 +190,8 @@ def _parse_moxfield_csv(uploaded_file):
         return []
 
     data_rows = rows[1:] if _is_header_row(rows[0]) else rows
+    # Con la columna de precio, una celda vacia es "sin precio" ('') y no "no se sabe" (None).
+    has_price_column = _is_header_row(rows[0]) and any(_normalize_csv_header(cell) in PRICE_HEADERS for cell in rows[0])
     parsed_rows = []
     for index, row in enumerate(data_rows, start=1):
         if not row or not any(cell.strip() for cell in row):
@@ -216,6 +208,9 @@ def _parse_moxfield_csv(uploaded_file):
         quantity = padded[0].strip()
         name = padded[1].strip()
         set_name = padded[2].strip()
+        # Sin cabecera no se sabe que columna es cada cosa: None es "el CSV no lo dice".
+        condition = asking_price = tradelist = None
+        card_type = 'owned'
 
         if _is_header_row(rows[0]):
             header = rows[0]
@@ -223,19 +218,74 @@ def _parse_moxfield_csv(uploaded_file):
             quantity = _extract_csv_field(row_dict, {'count', 'qty', 'quantity', 'collected'})
             name = _extract_csv_field(row_dict, {'name', 'cardname', 'card'})
             set_name = _extract_csv_field(row_dict, {'edition', 'set', 'setname', 'expansion'})
+            condition = CSV_CONDITIONS.get(_normalize_csv_header(_extract_csv_field(row_dict, {'condition'})))
+            price_text = _extract_csv_field(row_dict, PRICE_HEADERS)
+            if has_price_column:
+                asking_price = _to_decimal(price_text)
+                asking_price = str(asking_price.quantize(Decimal('0.01'))) if asking_price is not None else ''
+            tradelist_text = _extract_csv_field(row_dict, {'tradelistcount', 'tradelist'})
+            tradelist = _to_int(tradelist_text, default=None) if tradelist_text else None
+            # Moxfield marca la lista de deseos con la etiqueta "wishlist" (la que escribe la exportacion).
+            tags = {_normalize_csv_header(tag) for tag in _extract_csv_field(row_dict, {'tags'}).split(',')}
+            if 'wishlist' in tags:
+                card_type = 'desired'
 
         parsed_rows.append({
             'row_number': index,
             'quantity': _to_int(quantity, default=1),
             'card_name': name,
             'set_name': set_name,
+            'condition': condition,
+            'asking_price': asking_price,
+            'tradelist': tradelist,
+            'card_type': card_type,
         })
     return parsed_rows
 
 
+def _card_payload(card):
+    """Un Card local con la misma forma que `_normalize_scryfall_card`."""
+    return {
+        'scryfall_id': card.scryfall_id or '',
+        'name': card.name,
+        'set_name': card.set_name or '',
+        'set_code': card.set_code or '',
+        'collector_number': card.collector_number or '',
+        'rarity': card.rarity or '',
+        'image_url': card.image_url or '',
+        'usd_price': str(card.usd_price) if card.usd_price is not None else None,
+        'usd_foil_price': str(card.usd_foil_price) if card.usd_foil_price is not None else None,
+        'eur_price': str(card.eur_price) if card.eur_price is not None else None,
+        'description': card.description or '',
+        'type_line': '',
+    }
+
+
+def _indexed_cards(rows):
+    """
+    Cartas ya enriquecidas con Scryfall que el índice de nombres encuentra por nombre y
+    set, cargadas en una sola consulta. Devuelve {row_number: Card}; las filas sin set se
+    dejan a Scryfall, que elige la impresión más reciente.
+    """
+    index = cardindex.get_index()
+    if index is None:
+        return {}
+    card_ids = {}
+    for row in rows:
+        set_name = (row.get('set_name') or '').strip()
+        if not set_name:
+            continue
+        match = next((m for m in index.lookup(row.get('card_name'), set_name) if m.scryfall_id), None)
+        if match:
+            card_ids[row['row_number']] = match.card_id
+    cards = Card.objects.in_bulk(set(card_ids.values()))
+    return {row_number: cards[card_id] for row_number, card_id in card_ids.items() if card_id in cards}
+
+
 def _bulk_lookup_scryfall_cards(rows):
     enriched_rows = []
     errors = []
+    local_cards = _indexed_cards(rows)
 
     for row in rows:
         name = (row.get('card_name') or '').strip()
@@ -245,10 +295,16 @@ def _bulk_lookup_scryfall_cards(rows):
             continue
 
         cache_key = f"scryfallbulk-{_normalize_csv_header(name)}-{_normalize_csv_header(set_name)}"
-        cached_card = cache.get(cache_key)
+        local_card = local_cards.get(row['row_number'])
+        if local_card is not None:
+            cached_card = _card_payload(local_card)
+            metrics.inc('maki_scryfall_cache_total', cache='card_index', result='hit')
+        else:
+            cached_card = cache.get(cache_key)
+            metrics.inc('maki_scryfall_cache_total', cache='bulk_lookup', result='miss' if cached_card is None else 'hit')
         if cached_card is None:
             try:
-                payload = _scryfall_request(
+                payload = scryfall.get_client().get(
                     '/cards/search',
                     {
                         'q': f'!"{name}"',
@@ -283,16 +339,17 @@ def _bulk_lookup_scryfall_cards(rows):
             except (URLError, TimeoutError, ValueError):
                 errors.append(f"Fila {row['row_number']}: no se pudo consultar Scryfall para {name}.")
                 cached_card = None
-            time.sleep(SCRYFALL_BULK_LOOKUP_INTERVAL_SECONDS)
+            time.sleep(settings.SCRYFALL_BULK_LOOKUP_INTERVAL_SECONDS)
 
         enriched_row = {
             'row_number': row['row_number'],
             'quantity': row['quantity'],
             'card_name': name,
             'csv_set_name': set_name,
-            'condition': 'near_mint',
-            'listing_intent': 'sell',
-            'asking_price': '',
+            'condition': row.get('condition') or 'near_mint',
+            'listing_intent': 'trade' if row.get('tradelist') else 'sell',
+            'card_type': row.get('card_type', 'owned'),
+            'asking_price': row.get('asking_price') or '',
             'match_status': 'matched' if cached_card else 'missing',
         }
         if cached_card:
@@ -308,7 +365,11 @@ def _bulk_lookup_scryfall_cards(rows):
                 'eur_price': cached_card.get('eur_price') or '',
                 'description': cached_card.get('description', ''),
                 'type_line': cached_card.get('type_line', ''),
-                'asking_price': cached_card.get('usd_price') or '',
+                # Sin columna de precio en el CSV se propone el de Scryfall.
+                'asking_price': (
+                    row['asking_price'] if row.get('asking_price') is not None
+                    else cached_card.get('usd_price') or ''
+                ),
             })
         else:
             enriched_row.update({
@@ -325,21 +386,232 @@ def _bulk_lookup_scryfall_cards(rows):
                 'type_line': '',
             })
         enriched_rows.append(enriched_row)
+        metrics.inc('maki_import_rows_total', source='csv_lookup', result=enriched_row['match_status'])
 
     return enriched_rows, errors
 
+def _import_key(name, set_text=''):
+    return f"{_normalize_csv_header(name)}|{_normalize_csv_header(set_text)}"
+
+
+def _owned_cards_version(user):
+    summary = UserCard.objects.filter(user=user, is_owned=True).aggregate(
+        count=Count('id'), last_updated=Max('updated_at'),
+    )
+    return _fragment_version(summary['count'], summary['last_updated'])
+
+
+def _row_matches(group, row):
+    """
+    Si una fila del CSV puede ser parte de un grupo de la colección: mismo estado, precio
+    pedido y lista de cambio. Las columnas que el CSV no trae (None) valen para cualquiera.
+    """
+    trade = row.get('tradelist')
+    return (
+        row.get('condition') in (None, group['condition'])
+        and row.get('asking_price') in (None, group['asking_price'])
+        and (trade is None or (trade > 0) == (group['listing_intent'] in TRADE_INTENTS))
+    )
+
+
+def _collection_delta(user, parsed_rows):
+    """
+    Compara las filas del CSV con las cartas poseídas del usuario. Cada impresión se
+    identifica por nombre y expansión normalizados (vale el código o el nombre del set, y
+    solo el nombre si no hay duda); dentro de ella, los UserCard se agrupan por estado,
+    intención y precio pedido, así que solo se tratan como una misma fila las copias que
+    son idénticas. Una fila del CSV con otro estado es una carta nueva, no un cambio de
+    cantidad, y reimportar sin cambios la exportación de `/users/export/` no cambia nada.
+    """
+    groups = {}
+    printings = {}
+    aliases = {}
+    keys_by_name = {}
+    inventory = (
+        UserCard.objects.filter(user=user, is_owned=True)
+        .order_by('id')
+        .values_list(
+            'id', 'quantity_owned', 'condition', 'listing_intent', 'asking_price',
+            'card__name', 'card__set_code', 'card__set_name',
+        )
+    )
+    for user_card_id, quantity, condition, listing_intent, asking_price, name, set_code, set_name in inventory:
+        key = _import_key(name, set_code or set_name or '')
+        asking_price = str(asking_price) if asking_price is not None else ''
+        fingerprint = (key, condition, listing_intent, asking_price)
+        group = groups.get(fingerprint)
+        if group is None:
+            group = groups[fingerprint] = {
+                'ids': [],
+                'card_name': name,
+                'set_name': set_name or set_code or '',
+                'condition': condition,
+                'listing_intent': listing_intent,
+                'asking_price': asking_price,
+                'current_quantity': 0,
+                'quantity': 0,
+            }
+            printings.setdefault(key, []).append(group)
+        group['ids'].append(user_card_id)
+        group['current_quantity'] += quantity
+        for alias in (set_code, set_name):
+            if alias:
+                aliases.setdefault(_import_key(name, alias), key)
+        keys_by_name.setdefault(_normalize_csv_header(name), set()).add(key)
+    for name_key, keys in keys_by_name.items():
+        if len(keys) == 1:
+            aliases.setdefault(f'{name_key}|', next(iter(keys)))
+
+    # Las filas que encajan con los mismos grupos se suman y el total llena esos grupos en
+    # orden (el CSV no distingue, por ejemplo, "trade" de "sell_trade"); lo que sobra va al
+    # primero. Los repartos más concretos van antes que los de las filas sin esas columnas.
+    buckets = {}
+    added = {}
+    for row in parsed_rows:
+        raw_key = _import_key(row['card_name'], row['set_name'])
+        key = aliases.get(raw_key, raw_key)
+        candidates = [group for group in printings.get(key, []) if _row_matches(group, row)]
+        if candidates:
+            bucket = buckets.setdefault(tuple(group['ids'][0] for group in candidates), [candidates, 0])
+            bucket[1] += row['quantity']
+            continue
+        added_key = (key, row.get('condition'), row.get('asking_price'), bool(row.get('tradelist')))
+        if added_key in added:
+            added[added_key]['quantity'] += row['quantity']
+        else:
+            added[added_key] = dict(row)
+    for candidates, quantity in sorted(buckets.values(), key=lambda bucket: len(bucket[0])):
+        for group in candidates:
+            taken = min(quantity, max(group['current_quantity'] - group['quantity'], 0))
+            group['quantity'] += taken
+            quantity -= taken
+        candidates[0]['quantity'] += quantity
+
+    delta = {'added': [row for row in added.values() if row['quantity'] > 0],
+             'changed': [], 'removed': [], 'unchanged': 0}
+    for group in groups.values():
+        if group['quantity'] <= 0:
+            delta['removed'].append(group)
+        elif group['quantity'] != group['current_quantity']:
+            # Las filas del grupo son copias idénticas: la cantidad nueva queda en la primera.
+            delta['changed'].append(group)
+        else:
+            delta['unchanged'] += 1
+    return delta
+
+
+def _apply_collection_delta(user, delta):
+    """
+    Escribe un delta de `_collection_delta` y devuelve los conteos. Las cartas nuevas se
+    crean antes, en transacciones de IMPORT_TRANSACTION_ROWS filas; los cambios de la
+    colección van juntos en una sola transacción corta.
+    """
+    updates = {}
+    obsolete_ids = []
+    for group in delta.get('changed', []):
+        ids = sorted(int(user_card_id) for user_card_id in group['ids'])
+        updates[ids[0]] = _to_int(group['quantity'])
+        obsolete_ids.extend(ids[1:])
+    for group in delta.get('removed', []):
+        obsolete_ids.extend(int(user_card_id) for user_card_id in group['ids'])
+
+    added_rows = [row for row in delta.get('added', []) if row.get('match_status') == 'matched']
+    new_user_cards = []
+    for start in range(0, len(added_rows), IMPORT_TRANSACTION_ROWS):
+        with transaction.atomic():
+            for row in added_rows[start:start + IMPORT_TRANSACTION_ROWS]:
+                new_user_cards.append(UserCard(
+                    user=user,
+                    card=_upsert_card_from_payload(row, asking_price=row.get('asking_price')),
+                    is_owned=True,
+                    quantity_owned=_to_int(row.get('quantity'), default=1),
+                    listing_intent=row.get('listing_intent', 'sell'),
+                    condition=row.get('condition', 'near_mint'),
+                    asking_price=_to_decimal(row.get('asking_price')),
+                ))
+
+    with transaction.atomic():
+        UserCard.objects.bulk_create(new_user_cards, batch_size=500)
+
+        # Un UPDATE ... CASE por lote en vez de un save() por fila.
+        pending = list(updates.items())
+        for start in range(0, len(pending), 500):
+            batch = dict(pending[start:start + 500])
+            UserCard.objects.filter(user=user, is_owned=True, pk__in=batch).update(
+                quantity_owned=Case(*[When(pk=pk, then=Value(quantity)) for pk, quantity in batch.items()]),
+                updated_at=timezone.now(),
+            )
+        removed, _ = UserCard.objects.filter(user=user, is_owned=True, pk__in=obsolete_ids).delete()
+
+    counts = {
+        'added': len(new_user_cards),
+        'changed': len(delta.get('changed', [])),
+        'removed': len(delta.get('removed', [])),
+        'unchanged': _to_int(delta.get('unchanged'), default=0),
+    }
+    for result, count in counts.items():
+        metrics.inc('maki_import_rows_total', count, source='csv_sync', result=result)
+    return counts
+
+
+def _card_id_from_post(request):
+    card_id = _to_int(request.POST.get('card_id'), default=None)
+    if card_id is None or not Card.objects.filter(pk=card_id).exists():
+        return None
+    return card_id
+
+
+def _fragment_version(count, last_updated):
+    """Versión de una lista de UserCard: cambia al crear, editar o borrar cualquiera de ellos."""
+    return f"{count}-{last_updated.timestamp() if last_updated else 0}"
+
+
+def _fragment_context(request):
+    """
+    Contexto de los fragmentos cacheados. Las filas con formularios llevan el token CSRF,
+    así que se cachean por secreto CSRF (`fragment_scope`) y nunca se comparten entre sesiones.
+    """
+    get_token(request)
+    return {
+        'fragment_scope': request.META['CSRF_COOKIE'],
+        'fragment_seconds': settings.FRAGMENT_CACHE_SECONDS,
+    }
+
+
+def _notification_card_name(notification):
+    if notification.card_id:
+        return notification.card.name
+    return (notification.payload or {}).get('card_name')
+
+
 @login_required
 def card_list(request):
-    owned_cards = UserCard.objects.filter(user=request.user, is_owned=True)
-    desired_cards = UserCard.objects.filter(user=request.user, is_owned=False)
-
-    # Calcular el valor total de la colección
-    total_collection_value = sum(card.total_price() for card in owned_cards)
+    user_cards = UserCard.objects.filter(user=request.user).select_related('card')
+    owned_cards = user_cards.filter(is_owned=True)
+    desired_cards = user_cards.filter(is_owned=False)
+
+    # Una sola consulta: valor total de la colección y versión de cada lista para la caché.
+    owned, desired = Q(is_owned=True), Q(is_owned=False)
+    summary = UserCard.objects.filter(user=request.user).aggregate(
+        owned_count=Count('id', filter=owned),
+        owned_updated=Max('updated_at', filter=owned),
+        desired_count=Count('id', filter=desired),
+        desired_updated=Max('updated_at', filter=desired),
+        total_collection_value=Sum(
+            F('card__price') * F('quantity_owned'),
+            filter=owned,
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    )
 
+    # Los querysets son perezosos: si el fragmento de la lista está en caché no se consultan.
     return render(request, 'users/card_list.html', {
         'owned_cards': owned_cards,
         'desired_cards': desired_cards,
-        'total_collection_value': total_collection_value,
+        'owned_version': _fragment_version(summary['owned_count'], summary['owned_updated']),
+        'desired_version': _fragment_version(summary['desired_count'], summary['desired_updated']),
+        'total_collection_value': (summary['total_collection_value'] or Decimal('0')).quantize(Decimal('0.01')),
+        **_fragment_context(request),
     })
 
 @login_required
@@ -439,46 +711,67 @@ def register_cards(request):
 
 @login_required
 @require_GET
-def scryfall_card_search(request):
+@ratelimit.rate_limit(
+    ratelimit.scryfall_search_bucket,
+    payload={
+        'results': [],
+        'error': 'Estás consultando demasiado rápido. Espera un momento antes de buscar otra vez.',
+    },
+)
+async def scryfall_card_search(request):
+    # Asincrona: bajo ASGI la espera a Scryfall no ocupa un hilo (users/scryfall_async.py).
     query = request.GET.get('q', '').strip()
     if len(query) < 3:
         return JsonResponse({'results': []})
 
-    if not _enforce_scryfall_rate_limit(request):
-        return JsonResponse(
-            {
-                'results': [],
-                'error': 'Estás consultando demasiado rápido. Espera un momento antes de buscar otra vez.',
-            },
-            status=429,
-        )
-
     try:
-        payload = _scryfall_request(
-            '/cards/search',
+        cards = await scryfall_async.cached_search(
             {
                 'q': query,
                 'unique': 'prints',
                 'order': 'released',
                 'dir': 'desc',
             },
+            limit=SCRYFALL_SEARCH_LIMIT,
         )
     except HTTPError as exc:
-        if exc.code == 404:
-            return JsonResponse({'results': []})
         return JsonResponse(
             {'results': [], 'error': 'Scryfall no pudo responder la búsqueda en este momento.'},
             status=exc.code,
         )
+    except scryfall.CircuitOpenError:
+        return JsonResponse(
+            {'results': [], 'error': 'Scryfall no está respondiendo. Vuelve a intentarlo en unos segundos.'},
+            status=503,
+        )
     except (URLError, TimeoutError, ValueError):
         return JsonResponse(
             {'results': [], 'error': 'No fue posible conectar con Scryfall ahora mismo.'},
             status=502,
         )
 
-    results = [_normalize_scryfall_card(card) for card in payload.get('data', [])[:SCRYFALL_SEARCH_LIMIT]]
+    results = [_normalize_scryfall_card(card) for card in cards]
     return JsonResponse({'results': results})
 
+@login_required
+@require_GET
+def card_name_autocomplete(request):
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'results': []})
+
+    index = cardindex.get_index()
+    names = index.complete(query, limit=AUTOCOMPLETE_LIMIT) if index is not None else []
+    if not names:
+        # Sin índice, o cartas creadas después de construirlo.
+        names = list(
+            Card.objects.filter(name__istartswith=query)
+            .order_by('name').values_list('name', flat=True).distinct()[:AUTOCOMPLETE_LIMIT]
+        )
+    response = JsonResponse({'results': names})
+    response['Cache-Control'] = 'private, max-age=300'
+    return response
+
 @login_required
 def search_card(request):
     card_name = request.GET.get('card_name', '').strip()
@@ -487,8 +780,11 @@ def search_card(request):
             Q(card__name__icontains=card_name),
             ~Q(user=request.user),
             is_owned=True
-        )
-        return render(request, 'users/search_results.html', {'matching_cards': matching_cards})
+        ).select_related('user')
+        return render(request, 'users/search_results.html', {
+            'matching_cards': matching_cards,
+            **_fragment_context(request),
+        })
     return render(request, 'users/search_results.html', {'matching_cards': []})
 
 @login_required
@@ -518,14 +814,16 @@ def search_card_matches(request):
         matching_cards = UserCard.objects.filter(
             card__name__iexact=card_name,
             is_owned=True
-        ).exclude(user=request.user)
+        ).exclude(user=request.user).select_related('user')
         return render(request, 'users/search_results.html', {
             'matching_cards': matching_cards,
-            'searched_card': card_name
+            'searched_card': card_name,
+            **_fragment_context(request),
         })
     return render(request, 'users/search_results.html', {
         'matching_cards': [],
-        'searched_card': None
+        'searched_card': None,
+        **_fragment_context(request),
     })
 
 @login_required
@@ -535,14 +833,16 @@ def search_users_with_desired_card(request):
         interested_users = UserCard.objects.filter(
             card__name__iexact=card_name,
             is_owned=False
-        ).exclude(user=request.user)
+        ).exclude(user=request.user).select_related('user', 'card')
         return render(request, 'users/search_results.html', {
             'matching_cards': interested_users,
-            'searched_card': card_name
+            'searched_card': card_name,
+            **_fragment_context(request),
         })
     return render(request, 'users/search_results.html', {
         'matching_cards': [],
-        'searched_card': None
+        'searched_card': None,
+        **_fragment_context(request),
     })
 
 @login_required
@@ -569,6 +869,20 @@ def edit_user_profile(request):
 
     return render(request, 'users/edit_profile.html', {'form': form})
 
+def _requested_card_value(user, card_id):
+    """Valor en USD de la copia de `card_id` que `user` daria en el cambio, como `value_exchange`."""
+    user_card = (
+        UserCard.objects.filter(user=user, is_owned=True, card_id=card_id)
+        .order_by('id')
+        .values('condition', 'asking_price')
+        .first()
+    ) or {'condition': 'near_mint', 'asking_price': None}
+    prices = card_prices([card_id]).get(card_id)
+    if prices is None:
+        return None
+    return line_value(prices, user_card['condition'], user_card['asking_price'])['usd']
+
+
 @login_required
 def view_user_cards(request):
     user_id = request.GET.get('user_id')
@@ -584,22 +898,32 @@ def view_user_cards(request):
         messages.error(request, 'No se encontró un usuario con el ID proporcionado.')
         return redirect('list_notifications')
 
-    user_cards = UserCard.objects.filter(user=selected_user, is_owned=True)
+    user_cards = UserCard.objects.filter(user=selected_user, is_owned=True).select_related('card')
+    summary = user_cards.aggregate(count=Count('id'), last_updated=Max('updated_at'))
 
     # Obtener la carta deseada desde la notificación
     desired_card = None
+    desired_value = None
     if notification_id:
-        try:
-            notification = Notification.objects.get(id=notification_id, receiver=request.user)
-            desired_card = notification.message.split("'")[1]  # Extraer la carta deseada del mensaje
-        except (Notification.DoesNotExist, IndexError):
-            pass
+        notification = (
+            Notification.objects.select_related('card')
+            .filter(id=notification_id, receiver=request.user)
+            .first()
+        )
+        if notification:
+            desired_card = _notification_card_name(notification)
+            if notification.card_id:
+                desired_value = _requested_card_value(request.user, notification.card_id)
 
     return render(request, 'users/view_user_cards.html', {
         'selected_user': selected_user,
         'user_cards': user_cards,
+        'user_cards_version': _fragment_version(summary['count'], summary['last_updated']),
         'searched_card': desired_card,  # Pasar la carta deseada al template
-        'show_price': True  # Indicate to the template to show prices
+        'searched_card_value': desired_value,
+        'notification_id': notification_id,
+        'show_price': True,  # Indicate to the template to show prices
+        'fragment_seconds': settings.FRAGMENT_CACHE_SECONDS,
     })
 
 @login_required
@@ -613,38 +937,71 @@ def send_trade_request(request):
             messages.error(request, 'Seleccione una o más cartas a cambiar.')
             return redirect(f"/users/view_user_cards/?user_id={receiver_id}&notification_id={request.GET.get('notification_id')}")
 
-        selected_cards_str = ', '.join(selected_cards)
-        message = f"{request.user.username} ofrece '{desired_card}' por '{selected_cards_str}'."
-
-        # Enviar notificación al usuario correspondiente
         receiver = get_object_or_404(CustomUser, id=receiver_id)
-        Notification.objects.create(
-            sender=request.user,
-            receiver=receiver,
-            message=message,
-            type='exchange'  # Tipo de notificación: intercambio
-        )
-
-        # Buscar el intercambio existente
-        exchange = Exchange.objects.filter(sender=receiver, receiver=request.user, status='pending').first()
+        notification_id = request.POST.get('notification_id') or request.GET.get('notification_id')
+        origin = Notification.objects.filter(id=_to_int(notification_id, default=None), receiver=request.user).first()
+
+        # Buscar el intercambio ligado a la notificación original
+        exchange = None
+        if origin and origin.exchange_id:
+            exchange = Exchange.objects.filter(
+                pk=origin.exchange_id, sender=receiver, receiver=request.user, status='pending'
+            ).first()
         if not exchange:
             messages.error(request, 'No se encontró un intercambio pendiente para actualizar.')
             return redirect('list_notifications')
 
-        # Actualizar los detalles del intercambio
-        exchange.sender_cards = ', '.join(selected_cards)
-        exchange.receiver_cards = desired_card
-        exchange.save()
+        # Las casillas envian el id del UserCard; las paginas abiertas antes, el nombre.
+        selected_ids = [int(value) for value in selected_cards if value.isdigit()]
+        selected_names = [value for value in selected_cards if not value.isdigit()]
+        requested = Q(card_id=origin.card_id) if origin.card_id else Q(card__name__iexact=desired_card)
+
+        with transaction.atomic():
+            valuation = value_exchange(
+                exchange,
+                Q(pk__in=selected_ids) | Q(card__name__in=selected_names),
+                requested,
+                receiver_card_id=origin.card_id,
+            )
+            offered_cards = [line['name'] for line in valuation.sender_lines]
+            if not offered_cards:
+                transaction.set_rollback(True)
+                messages.error(request, 'Las cartas seleccionadas ya no están disponibles.')
+                return redirect(f"/users/view_user_cards/?user_id={receiver_id}&notification_id={notification_id}")
+            selected_cards_str = ', '.join(offered_cards)
+            message = (
+                f"{request.user.username} ofrece '{desired_card}' por '{selected_cards_str}' "
+                f"(${valuation.receiver_value} por ${valuation.sender_value}, equidad {valuation.fairness_score})."
+            )
 
-        messages.success(request, 'Intercambio actualizado correctamente.')
+            # Enviar notificación al usuario correspondiente
+            Notification.objects.create(
+                sender=request.user,
+                receiver=receiver,
+                message=message,
+                type='exchange',  # Tipo de notificación: intercambio
+                exchange=exchange,
+                card_id=origin.card_id,
+                payload={
+                    'card_name': desired_card,
+                    'offered_cards': offered_cards,
+                    'offered_value': str(valuation.sender_value),
+                    'requested_value': str(valuation.receiver_value),
+                    'fairness_score': str(valuation.fairness_score),
+                },
+            )
 
-        # Marcar la notificación como resuelta
-        if 'notification_id' in request.GET:
-            notification_id = request.GET.get('notification_id')
-            notification = get_object_or_404(Notification, id=notification_id, receiver=request.user)
-            notification.type = 'resolved'
-            notification.is_read = True
-            notification.save()
+            # Actualizar los detalles del intercambio
+            exchange.sender_cards = selected_cards_str
+            exchange.receiver_cards = desired_card
+            exchange.save(update_fields=['sender_cards', 'receiver_cards', 'updated_at'])
+
+            # Marcar la notificación como resuelta
+            origin.type = 'resolved'
+            origin.is_read = True
+            origin.save(update_fields=['type', 'is_read', 'updated_at'])
+
+        messages.success(request, 'Intercambio actualizado correctamente.')
 
         messages.success(request, 'Solicitud de intercambio enviada correctamente.')
         return redirect('list_notifications')
@@ -661,21 +1018,26 @@ def send_notification(request):
 
         try:
             owner = get_object_or_404(CustomUser, id=owner_id)
-            exchange = Exchange.objects.create(
-                sender=request.user,
-                receiver=owner,
-                sender_cards='',  # No hay cartas ofrecidas en este caso
-                receiver_cards=card_name,
-                status='pending',
-                exchange_type='trade'
-            )
-            message = f"{request.user.username} busca la carta '{card_name}', ¿quieres revisar sus cartas en posesión? (ID de intercambio: {exchange.id})"
-            Notification.objects.create(
-                sender=request.user,
-                receiver=owner,
-                message=message,
-                type='action'
-            )
+            card_id = _card_id_from_post(request)
+            with transaction.atomic():
+                exchange = Exchange.objects.create(
+                    sender=request.user,
+                    receiver=owner,
+                    sender_cards='',  # No hay cartas ofrecidas en este caso
+                    receiver_cards=card_name,
+                    status='pending',
+                    exchange_type='trade'
+                )
+                message = f"{request.user.username} busca la carta '{card_name}', ¿quieres revisar sus cartas en posesión? (ID de intercambio: {exchange.id})"
+                Notification.objects.create(
+                    sender=request.user,
+                    receiver=owner,
+                    message=message,
+                    type='action',
+                    exchange=exchange,
+                    card_id=card_id,
+                    payload={'card_name': card_name},
+                )
             messages.info(request, f"Notificación enviada a {owner.username}: {message}")
         except Exception as e:
             messages.error(request, f"Error al enviar la notificación: {str(e)}")
@@ -697,9 +1059,13 @@ def accept_notification(request):
         # Si la notificación es de tipo exchange, también ejecuta accept_exchange
         if notification.type == 'exchange':
             try:
-                exchange = Exchange.objects.get(sender=notification.sender, receiver=request.user, status='pending')
+                exchange = Exchange.objects.get(
+                    Q(sender=request.user) | Q(receiver=request.user),
+                    pk=notification.exchange_id,
+                    status='pending',
+                )
                 exchange.status = 'accepted'
-                exchange.save()
+                exchange.save(update_fields=['status', 'updated_at'])
             except Exchange.DoesNotExist:
                 messages.error(request, 'No se encontró un intercambio pendiente asociado a esta notificación.')
                 return redirect('list_notifications')
@@ -725,18 +1091,20 @@ def reject_notification(request):
     if request.method == 'POST':
         notification_id = request.POST.get('notification_id')
         notification = get_object_or_404(Notification, id=notification_id, receiver=request.user)
-        notification.is_read = True
-        notification.type = 'resolved'  # Cambiar el tipo a resuelta
-        notification.save()
+        with transaction.atomic():
+            notification.is_read = True
+            notification.type = 'resolved'  # Cambiar el tipo a resuelta
+            notification.save(update_fields=['is_read', 'type', 'updated_at'])
 
-        # Enviar notificación de rechazo al emisor
-        message = f"{request.user.username} no aceptó el cambio."
-        Notification.objects.create(
-            sender=request.user,
-            receiver=notification.sender,
-            message=message,
-            type='info'  # Tipo de notificación: informativo
-        )
+            # Enviar notificación de rechazo al emisor
+            message = f"{request.user.username} no aceptó el cambio."
+            Notification.objects.create(
+                sender=request.user,
+                receiver_id=notification.sender_id,
+                message=message,
+                type='info',  # Tipo de notificación: informativo
+                exchange_id=notification.exchange_id,
+            )
 
         return redirect('list_notifications')
 
@@ -765,7 +1133,9 @@ def reject_offer(request):
 @login_required
 def mark_all_resolved(request):
     if request.method == 'POST':
-        Notification.objects.filter(receiver=request.user).update(type='resolved', is_read=True)
+        Notification.objects.filter(receiver=request.user).update(
+            type='resolved', is_read=True, updated_at=timezone.now()
+        )
         messages.success(request, 'Todas las notificaciones han sido marcadas como resueltas.')
         return redirect('list_notifications')
 
@@ -798,7 +1168,9 @@ def make_purchase_offer(request):
                 sender=request.user,
                 receiver=owner,
                 message=message,
-                type='compra'  # Tipo de notificación: compra
+                type='compra',  # Tipo de notificación: compra
+                card_id=_card_id_from_post(request),
+                payload={'card_name': card_name},
             )
             messages.success(request, f"Notificación enviada a {owner.username}: {message}")
 
@@ -851,6 +1223,24 @@ def upload_file(request):
     }
 
     if request.method == 'POST':
+        if request.POST.get('action') == 'apply_delta':
+            try:
+                delta = json.loads(request.POST.get('delta_payload', '{}'))
+            except json.JSONDecodeError:
+                messages.error(request, 'No se pudo leer el lote enviado.')
+                return redirect('upload_file')
+            if delta.get('version') != _owned_cards_version(request.user):
+                messages.error(request, 'Tu colección cambió desde la vista previa. Vuelve a subir el CSV.')
+                return redirect('upload_file')
+
+            counts = _apply_collection_delta(request.user, delta)
+            messages.success(
+                request,
+                f"Colección sincronizada: {counts['added']} añadidas, {counts['changed']} con otra cantidad "
+                f"y {counts['removed']} eliminadas.",
+            )
+            return redirect('card_list')
+
         if request.POST.get('action') == 'publish':
             try:
                 bulk_rows = json.loads(request.POST.get('bulk_payload', '[]'))
@@ -859,25 +1249,27 @@ def upload_file(request):
                 return redirect('upload_file')
 
             created_count = 0
-            for row in bulk_rows:
-                if row.get('match_status') != 'matched':
-                    continue
-
-                card = _upsert_card_from_payload(row, asking_price=row.get('asking_price'))
-                quantity = _to_int(row.get('quantity'), default=1)
-                card_type = row.get('card_type', 'owned')
-                is_owned = card_type == 'owned'
-                UserCard.objects.create(
-                    user=request.user,
-                    card=card,
-                    is_owned=is_owned,
-                    quantity_owned=quantity if is_owned else 0,
-                    quantity_required=0 if is_owned else quantity,
-                    listing_intent=row.get('listing_intent', 'sell'),
-                    condition=row.get('condition', 'near_mint'),
-                    asking_price=_to_decimal(row.get('asking_price')),
-                )
-                created_count += 1
+            matched_rows = [row for row in bulk_rows if row.get('match_status') == 'matched']
+            # Transacciones cortas de IMPORT_TRANSACTION_ROWS filas: un commit por lote y no uno por fila.
+            for start in range(0, len(matched_rows), IMPORT_TRANSACTION_ROWS):
+                with transaction.atomic():
+                    for row in matched_rows[start:start + IMPORT_TRANSACTION_ROWS]:
+                        card = _upsert_card_from_payload(row, asking_price=row.get('asking_price'))
+                        quantity = _to_int(row.get('quantity'), default=1)
+                        card_type = row.get('card_type', 'owned')
+                        is_owned = card_type == 'owned'
+                        UserCard.objects.create(
+                            user=request.user,
+                            card=card,
+                            is_owned=is_owned,
+                            quantity_owned=quantity if is_owned else 0,
+                            quantity_required=0 if is_owned else quantity,
+                            listing_intent=row.get('listing_intent', 'sell'),
+                            condition=row.get('condition', 'near_mint'),
+                            asking_price=_to_decimal(row.get('asking_price')),
+                        )
+                        created_count += 1
+            metrics.inc('maki_import_rows_total', created_count, source='csv_publish', result='created')
 
             messages.success(request, f'Se publicaron {created_count} cartas desde el lote.')
             return redirect('card_list')
@@ -887,6 +1279,20 @@ def upload_file(request):
         if form.is_valid():
             uploaded_file = request.FILES['file']
             parsed_rows = _parse_moxfield_csv(uploaded_file)
+            if form.cleaned_data.get('mode') == 'sync':
+                # Solo las cartas nuevas pasan por Scryfall; el resto ya está en la colección.
+                # La sincronizacion es de las cartas poseidas: las filas de la lista de deseos no cuentan.
+                version = _owned_cards_version(request.user)
+                delta = _collection_delta(request.user, [row for row in parsed_rows if row['card_type'] == 'owned'])
+                delta['added'], parse_errors = _bulk_lookup_scryfall_cards(delta['added'])
+                context.update({
+                    'delta': delta,
+                    'delta_payload': json.dumps({**delta, 'version': version}),
+                    'delta_has_changes': any(delta[kind] for kind in ('added', 'changed', 'removed')),
+                    'parse_errors': parse_errors,
+                })
+                return render(request, 'users/upload_file.html', context)
+
             bulk_rows, parse_errors = _bulk_lookup_scryfall_cards(parsed_rows)
             context.update({
                 'bulk_rows': bulk_rows,
@@ -901,19 +1307,97 @@ def upload_file(request):
 
     return render(request, 'users/upload_file.html', context)
 
+def _decklist_entries(request, errors):
+    """
+    Entradas de la lista enviada como texto (`decklist`, fichero o campo del formulario),
+    o del `extracted_data` JSON que envian los clientes que parsean la lista ellos mismos.
+    """
+    upload = request.FILES.get('decklist')
+    if upload is not None:
+        return decklist.parse(io.TextIOWrapper(upload.file, encoding='utf-8-sig', errors='replace'), errors)
+    if request.POST.get('decklist', '').strip():
+        return decklist.parse(request.POST['decklist'].splitlines(), errors)
+    data = json.loads(request.POST.get('extracted_data', '[]'))
+    return [
+        decklist.Entry(line_number, int(row['cantidad']), row['nombre_carta'], '', '')
+        for line_number, row in enumerate(data, start=1)
+    ]
+
+
+def _import_decklist(request, is_owned):
+    """
+    Resuelve la lista por lotes y suma las cantidades a la coleccion en una transaccion:
+    las cartas que el usuario ya tenia en esa lista se actualizan con UPDATEs por lotes y
+    el resto se crean con `bulk_create`. Devuelve los conteos.
+    """
+    errors = []
+    quantity_field = 'quantity_owned' if is_owned else 'quantity_required'
+    with transaction.atomic():
+        quantities = Counter()
+        for card, quantity, _ in decklist.resolve(_decklist_entries(request, errors)):
+            quantities[card.pk] += quantity
+
+        existing = {}
+        card_ids = list(quantities)
+        for start in range(0, len(card_ids), 500):
+            rows = (
+                UserCard.objects.filter(user=request.user, is_owned=is_owned, card_id__in=card_ids[start:start + 500])
+                .order_by('-id').values_list('id', 'card_id')
+            )
+            # Si la carta esta repetida en la coleccion, se suma a la fila mas antigua.
+            existing.update({card_id: user_card_id for user_card_id, card_id in rows})
+
+        UserCard.objects.bulk_create(
+            [
+                UserCard(
+                    user=request.user,
+                    card_id=card_id,
+                    is_owned=is_owned,
+                    quantity_owned=quantity if is_owned else 0,
+                    quantity_required=0 if is_owned else quantity,
+                )
+                for card_id, quantity in quantities.items()
+                if card_id not in existing
+            ],
+            batch_size=500,
+        )
+        # Las cantidades de una lista se repiten mucho (1-4): un UPDATE por cantidad y lote.
+        by_quantity = {}
+        for card_id, quantity in quantities.items():
+            if card_id in existing:
+                by_quantity.setdefault(quantity, []).append(existing[card_id])
+        for quantity, user_card_ids in by_quantity.items():
+            for start in range(0, len(user_card_ids), 500):
+                UserCard.objects.filter(pk__in=user_card_ids[start:start + 500]).update(**{
+                    quantity_field: F(quantity_field) + quantity,
+                    'updated_at': timezone.now(),
+                })
+        updated = sum(len(user_card_ids) for user_card_ids in by_quantity.values())
+
+    counts = {
+        'created': len(quantities) - updated,
+        'updated': updated,
+        'unparsed': len(errors),
+    }
+    source = 'txt_owned' if is_owned else 'txt_desired'
+    for result, count in counts.items():
+        metrics.inc('maki_import_rows_total', count, source=source, result=result)
+    counts['unparsed_lines'] = [line_number for line_number, _ in errors[:20]]
+    return counts
+
+
 @login_required
 def import_cards(request):
     if request.method == 'POST':
         try:
-            extracted_data = json.loads(request.POST.get('extracted_data', '[]'))
-            for data in extracted_data:
-                UserCard.objects.create(
-                    user=request.user,
-                    card=Card.objects.get_or_create(name=data['nombre_carta'], set_code='')[0],
-                    quantity_owned=int(data['cantidad']),
-                    is_owned=True
-                )
-            messages.success(request, 'Cartas importadas exitosamente a tus cartas en posesión.')
+            counts = _import_decklist(request, is_owned=True)
+            messages.success(
+                request,
+                f"Cartas importadas exitosamente a tus cartas en posesión: {counts['created']} nuevas, "
+                f"{counts['updated']} actualizadas.",
+            )
+            if counts['unparsed']:
+                messages.warning(request, f"{counts['unparsed']} líneas no se reconocieron como cartas.")
         except Exception as e:
             messages.error(request, f'Error al importar las cartas: {str(e)}')
         return redirect('card_list')
@@ -921,16 +1405,11 @@ def import_cards(request):
 @csrf_exempt
 def add_to_owned_cards(request):
     if request.method == 'POST':
+        if not request.user.is_authenticated:
+            return JsonResponse({'status': 'error', 'message': 'Authentication required.'}, status=401)
         try:
-            data = json.loads(request.POST.get('extracted_data', '[]'))
-            for card in data:
-                UserCard.objects.create(
-                    user=request.user,
-                    card=Card.objects.get_or_create(name=card['nombre_carta'], set_code='')[0],
-                    quantity_owned=int(card['cantidad']),
-                    is_owned=True
-                )
-            return JsonResponse({'status': 'success', 'message': 'Cards added to owned list successfully.'})
+            counts = _import_decklist(request, is_owned=True)
+            return JsonResponse({'status': 'success', 'message': 'Cards added to owned list successfully.', **counts})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)})
     return JsonResponse({'status': 'error', 'message': 'Invalid request method.'})
@@ -939,21 +1418,12 @@ def add_to_owned_cards(request):
 def create_user_cards_from_txt(request):
     if request.method == 'POST':
         try:
-            extracted_data = request.POST.get('extracted_data', '[]')
-            if not extracted_data.strip():
+            has_decklist = 'decklist' in request.FILES or request.POST.get('decklist', '').strip()
+            if not has_decklist and not request.POST.get('extracted_data', '[]').strip():
                 return JsonResponse({'status': 'error', 'message': 'No data provided in extracted_data.'})
 
-            data = json.loads(extracted_data)
-            for card_data in data:
-                card, created = Card.objects.get_or_create(name=card_data['nombre_carta'], set_code='')
-                UserCard.objects.create(
-                    user=request.user,
-                    card=card,
-                    is_owned=False,
-                    quantity_owned=0,
-                    quantity_required=int(card_data['cantidad'])
-                )
-            return JsonResponse({'status': 'success', 'message': 'User cards created successfully.'})
+            counts = _import_decklist(request, is_owned=False)
+            return JsonResponse({'status': 'success', 'message': 'User cards created successfully.', **counts})
         except json.JSONDecodeError as e:
             return JsonResponse({'status': 'error', 'message': f'JSON decode error: {str(e)}'})
         except Exception as e: